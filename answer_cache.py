@@ -0,0 +1,115 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+
+def normalize_question(question: str) -> str:
+    """Normalize case, whitespace and trailing punctuation of a question"""
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip(" ?!.")
+
+
+class AnswerCache:
+    """LRU + TTL cache of RAG answers that also matches near-duplicate questions.
+
+    Entries are scoped by a tuple such as (corpus version, model, temperature).
+    A lookup first tries the normalized question text, then falls back to
+    cosine similarity between question embeddings within the same scope.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _expired(self, entry: dict) -> bool:
+        return time.time() - entry["created"] > self.ttl_seconds
+
+    def _find_similar(self, scope: tuple, query_vector: np.ndarray):
+        best_key, best_score = None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if key[0] != scope or self._expired(entry):
+                continue
+            score = float(np.dot(entry["vector"], query_vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def lookup(
+        self, scope: tuple, question: str, embed_query: Callable[[str], List[float]]
+    ) -> Tuple[Optional[dict], Optional[np.ndarray]]:
+        """Return (cached entry or None, question vector if one was computed)"""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                metrics.inc(
+                    "docuchat_cache_requests_total", cache="answer", result="hit"
+                )
+                return entry, None
+
+        # Embed outside the lock so concurrent sessions are not serialized
+        query_vector = np.asarray(embed_query(question), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+
+        with self._lock:
+            similar_key = self._find_similar(scope, query_vector)
+            if similar_key is not None:
+                self._entries.move_to_end(similar_key)
+                self.hits += 1
+                self.semantic_hits += 1
+                entry, result = self._entries[similar_key], "semantic_hit"
+            else:
+                self.misses += 1
+                entry, result = None, "miss"
+        metrics.inc("docuchat_cache_requests_total", cache="answer", result=result)
+        return entry, query_vector
+
+    def store(
+        self,
+        scope: tuple,
+        question: str,
+        query_vector: np.ndarray,
+        answer: str,
+        sources: List[str],
+    ):
+        """Cache an answer, evicting expired and least recently used entries"""
+        key = (scope, normalize_question(question))
+        with self._lock:
+            self._entries[key] = {
+                "answer": answer,
+                "sources": sources,
+                "vector": query_vector,
+                "created": time.time(),
+            }
+            self._entries.move_to_end(key)
+            for stale_key in [k for k, e in self._entries.items() if self._expired(e)]:
+                del self._entries[stale_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,16 +1,32 @@
 import streamlit as st
 from config import config
-from openrouter_client import get_openrouter_client, chat_with_openrouter
-from utils import (
-    get_embeddings,
-    load_documents_from_files,
-    create_vector_store,
-    get_relevant_context,
-    create_rag_prompt,
+import metrics
+from answer_cache import AnswerCache
+from chat_history import compact_history
+from context_packing import get_token_budget
+from index_registry import IndexRegistry
+from ingest import (
+    get_docs_dir,
+    is_ingestion_running,
+    load_library,
+    read_manifest,
+    read_status,
+    start_background_ingestion,
 )
+from lazy_imports import LazyModule
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import threading
 import time
 
+# LangChain, FAISS, the loaders and the OpenAI SDK load on first use, so the
+# first page renders without them
+indexing_jobs = LazyModule("indexing_jobs")
+openrouter_client = LazyModule("openrouter_client")
+utils = LazyModule("utils")
+vector_backends = LazyModule("vector_backends")
+
 # App configuration
 st.set_page_config(
     page_title=config.app["title"],
@@ -26,17 +42,107 @@ st.markdown(f"<style>{config.styles['css']}</style>", unsafe_allow_html=True)
 # Initialize resources
 @st.cache_resource
 def init_client():
-    return get_openrouter_client()
+    return openrouter_client.get_async_openrouter_client()
 
 
 @st.cache_resource
 def init_embeddings():
-    return get_embeddings()
+    return utils.get_embeddings()
+
+
+@st.cache_resource
+def init_answer_cache():
+    settings = config.answer_cache
+    return AnswerCache(
+        max_entries=settings.get("max_entries", 512),
+        ttl_seconds=settings.get("ttl_seconds", 3600),
+        similarity_threshold=settings.get("similarity_threshold", 0.95),
+    )
+
+
+@st.cache_resource
+def init_index_registry():
+    return IndexRegistry()
+
 
+@st.cache_resource
+def init_executor():
+    return ThreadPoolExecutor(
+        max_workers=config.loading.get("max_jobs", 2),
+        thread_name_prefix="indexing",
+    )
+
+
+@st.cache_resource
+def init_collection(name: str):
+    """One store per named collection, shared by every session that opens it"""
+    return vector_backends.get_vector_backend(init_embeddings(), collection=name)
 
-# Initialize
-client = init_client()
-embeddings = init_embeddings()
+
+@st.cache_resource
+def init_metrics():
+    metrics.start_exporters()
+
+
+@st.cache_resource
+def init_prewarm():
+    """Load the client and embedding model in the background"""
+
+    def prewarm():
+        init_client()
+        init_embeddings()
+
+    thread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+@st.fragment(run_every=1.0)
+def show_index_progress():
+    """Poll the background indexing job; rerun the whole app once it is over"""
+    job = st.session_state.index_job
+    if job is None or job.done:
+        st.rerun()
+    status = job.status
+    text = (
+        f"⚡ Processing documents: {status['files_done']}/{status['files_total']} files"
+    )
+    if status["batches_done"]:
+        text += f" • {status['chunks_added']} chunks indexed"
+    st.progress(job.progress, text=text)
+    if st.button("⏹️ Cancel", key="cancel_indexing", use_container_width=True):
+        job.cancel()
+
+
+def ingestion_running() -> bool:
+    """Whether the folder is being indexed, counting a job not yet started"""
+    process = st.session_state.ingest_process
+    if process is not None and process.poll() is None:
+        return True
+    st.session_state.ingest_process = None
+    return is_ingestion_running()
+
+
+@st.fragment(run_every=1.0)
+def show_library_progress():
+    """Poll the folder indexing job; rerun the whole app once it is over"""
+    if not ingestion_running():
+        st.rerun()
+    status = read_status()
+    if status is None or status["state"] != "running":
+        st.progress(0.0, text="📚 Starting library indexing...")
+        return
+    st.progress(
+        status["bytes_done"] / max(status["bytes_total"], 1),
+        text=f"📚 Indexing library: {status['files_done']}/"
+        f"{status['files_total']} files",
+    )
+
+
+# Initialize; the client and embedding model are created on first use
+answer_cache = init_answer_cache()
+index_registry = init_index_registry()
+init_metrics()
 
 # Initialize session state
 if "messages" not in st.session_state:
@@ -45,10 +151,30 @@ if "response_times" not in st.session_state:
     st.session_state.response_times = []
 if "vectorstore" not in st.session_state:
     st.session_state.vectorstore = None
-if "documents" not in st.session_state:
-    st.session_state.documents = []
-if "processing" not in st.session_state:
-    st.session_state.processing = False
+if "sources" not in st.session_state:
+    st.session_state.sources = []
+if "corpus_hash" not in st.session_state:
+    st.session_state.corpus_hash = None
+if "index_lease" not in st.session_state:
+    st.session_state.index_lease = None
+if "index_bytes" not in st.session_state:
+    st.session_state.index_bytes = 0
+if "index_chunks" not in st.session_state:
+    st.session_state.index_chunks = 0
+if "index_job" not in st.session_state:
+    st.session_state.index_job = None
+if "ingest_process" not in st.session_state:
+    st.session_state.ingest_process = None
+if "load_errors" not in st.session_state:
+    st.session_state.load_errors = []
+if "library_sources" not in st.session_state:
+    st.session_state.library_sources = set()
+if "collection" not in st.session_state:
+    st.session_state.collection = None
+if "history_state" not in st.session_state:
+    st.session_state.history_state = {}
+if "history_tokens_saved" not in st.session_state:
+    st.session_state.history_tokens_saved = 0
 
 # Enhanced Sidebar
 with st.sidebar:
@@ -69,6 +195,63 @@ with st.sidebar:
         unsafe_allow_html=True,
     )
 
+    # Named collections persist and are shared; uploads are added to the open one
+    collection = None
+    if st.toggle(
+        "🗂️ Shared Collection",
+        value=st.session_state.collection is not None,
+        help="Index into and search a named collection kept for your team or project",
+    ):
+        new_collection = "➕ New collection"
+        existing = vector_backends.list_collections()
+        options = existing + [new_collection]
+        choice = st.selectbox(
+            "Collection:",
+            options,
+            index=options.index(st.session_state.collection)
+            if st.session_state.collection in existing
+            else 0,
+        )
+        if choice == new_collection:
+            collection = (
+                st.text_input("Collection name:", placeholder="team-reports").strip()
+                or None
+            )
+        else:
+            collection = choice
+
+    if collection != st.session_state.collection:
+        try:
+            backend = init_collection(collection) if collection else None
+        except ValueError as e:
+            st.markdown(
+                f'<div class="status-warning">⚠️ {e}</div>', unsafe_allow_html=True
+            )
+        else:
+            if st.session_state.index_job is not None:
+                st.session_state.index_job.discard()
+                st.session_state.index_job = None
+            if st.session_state.index_lease is not None:
+                st.session_state.index_lease.release()
+                st.session_state.index_lease = None
+            vectorstore = None
+            if backend is not None:
+                # A collection session sees every file in the collection
+                backend.session_sources = backend.get_sources()
+                vectorstore = backend if backend.session_sources else None
+            st.session_state.collection = collection
+            st.session_state.vectorstore = vectorstore
+            st.session_state.library_sources = set()
+            st.session_state.load_errors = []
+            st.session_state.sources = sorted(utils.get_indexed_files(vectorstore))
+            st.session_state.corpus_hash = (
+                utils.get_corpus_hash(vectorstore) if vectorstore else None
+            )
+            (
+                st.session_state.index_chunks,
+                st.session_state.index_bytes,
+            ) = utils.get_vector_store_stats(vectorstore)
+
     # File upload
     uploaded_files = st.file_uploader(
         "",
@@ -92,7 +275,7 @@ with st.sidebar:
         # Show file details
         with st.expander("📋 File Details", expanded=False):
             for file in uploaded_files:
-                file_size = len(file.getvalue()) / 1024  # KB
+                file_size = file.size / 1024  # KB
                 st.markdown(
                     f"""
                     <div class="doc-item">
@@ -122,10 +305,19 @@ with st.sidebar:
             st.button("📁 Select Files First", disabled=True, use_container_width=True)
 
     with col2:
-        if st.session_state.documents:
+        if st.session_state.sources:
             if st.button("🗑️", help="Clear all documents", key="clear_docs"):
-                st.session_state.documents = []
+                if st.session_state.index_job is not None:
+                    st.session_state.index_job.discard()
+                    st.session_state.index_job = None
+                st.session_state.sources = []
                 st.session_state.vectorstore = None
+                if st.session_state.index_lease is not None:
+                    st.session_state.index_lease.release()
+                    st.session_state.index_lease = None
+                st.session_state.corpus_hash = None
+                st.session_state.load_errors = []
+                st.session_state.library_sources = set()
                 st.rerun()
             # Apply clear button styling
             st.markdown(
@@ -133,48 +325,176 @@ with st.sidebar:
                 unsafe_allow_html=True,
             )
 
-    # Processing indicator
+    # Indexing runs in the background; chat keeps using the current index
     if uploaded_files and "process_clicked" in locals() and process_clicked:
-        st.session_state.processing = True
-
-    if st.session_state.processing:
-        st.markdown(
-            '<div class="processing-indicator">⚡ Processing documents...</div>',
-            unsafe_allow_html=True,
+        if st.session_state.index_job is not None:
+            st.session_state.index_job.discard()
+        vectorstore = st.session_state.vectorstore
+        if vectorstore is None and st.session_state.collection:
+            vectorstore = init_collection(st.session_state.collection)
+        # Only new or changed files are loaded and embedded
+        changed_files, removed_sources = utils.plan_index_update(
+            vectorstore, uploaded_files
         )
-
-        documents = load_documents_from_files(uploaded_files)
-        if documents:
-            st.session_state.documents = documents
-            st.session_state.vectorstore = create_vector_store(documents, embeddings)
-            st.session_state.processing = False
+        # Library files are not uploads; keep them when the upload list changes
+        removed_sources -= st.session_state.library_sources
+        if st.session_state.collection:
+            # Collections keep files that are no longer in this upload list
+            removed_sources = set()
+        embeddings = init_embeddings()
+        share = None
+        if config.cache.get("share_indexes", True) and not isinstance(
+            vectorstore, vector_backends.VectorBackend
+        ):
+            # Publishing the new index to the registry also runs in the job
+            share = functools.partial(
+                utils.share_vector_store,
+                embeddings=embeddings,
+                registry=index_registry,
+            )
+        job = indexing_jobs.IndexingJob(
+            vectorstore,
+            changed_files,
+            embeddings,
+            removed_sources,
+            share,
+        )
+        init_executor().submit(job.run)
+        st.session_state.index_job = job
+
+    job = st.session_state.index_job
+    if job is not None and job.done:
+        # Swap the finished index in within a single script run
+        st.session_state.index_job = None
+        st.session_state.load_errors = job.errors
+        if job.indexed:
+            if st.session_state.index_lease is not None:
+                st.session_state.index_lease.release()
+            st.session_state.index_lease = job.lease
+            vectorstore = job.vectorstore
+            st.session_state.vectorstore = vectorstore
+            (
+                st.session_state.index_chunks,
+                st.session_state.index_bytes,
+            ) = utils.get_vector_store_stats(vectorstore)
+            metrics.set_gauge("docuchat_index_vectors", st.session_state.index_chunks)
+            metrics.set_gauge("docuchat_index_bytes", st.session_state.index_bytes)
+            st.session_state.corpus_hash = utils.get_corpus_hash(vectorstore)
+            st.session_state.sources = sorted(utils.get_indexed_files(vectorstore))
             st.markdown(
                 '<div class="status-success">✅ Documents processed successfully!</div>',
                 unsafe_allow_html=True,
             )
-            time.sleep(1)  # Brief pause to show success
-            st.rerun()
+            if job.embedded_chunks and job.embed_seconds:
+                st.markdown(
+                    f"""
+                    <div class="status-info">
+                        ⚡ Embedded {job.embedded_chunks} chunks at
+                        {job.embedded_chunks / job.embed_seconds:.0f} chunks/s
+                    </div>
+                """,
+                    unsafe_allow_html=True,
+                )
+            if job.status["chunks_skipped"]:
+                st.markdown(
+                    f'<div class="status-info">♻️ Skipped '
+                    f"{job.status['chunks_skipped']} duplicate chunks</div>",
+                    unsafe_allow_html=True,
+                )
         else:
-            st.session_state.processing = False
+            job.discard()
+            if isinstance(st.session_state.vectorstore, vector_backends.VectorBackend):
+                # Persistent backends are updated in place, batch by batch
+                st.session_state.sources = sorted(
+                    utils.get_indexed_files(st.session_state.vectorstore)
+                )
+            if job.state == "cancelled":
+                message = "⏹️ Processing cancelled; the previous index is kept"
+            elif job.error:
+                message = f"❌ Failed to process documents: {job.error}"
+            else:
+                message = "❌ Failed to process documents"
             st.markdown(
-                '<div class="status-warning">❌ Failed to process documents</div>',
+                f'<div class="status-warning">{message}</div>',
                 unsafe_allow_html=True,
             )
+    elif job is not None:
+        show_index_progress()
+
+    # Library indexed from the documents folder by ingest.py
+    library_manifest = read_manifest()
+    library_status = read_status()
+    ingest_running = ingestion_running()
+    if ingest_running:
+        show_library_progress()
+    elif library_status and library_status.get("state") == "failed":
+        st.markdown(
+            f'<div class="status-warning">⚠️ Library indexing failed: '
+            f"{library_status.get('error', '')}</div>",
+            unsafe_allow_html=True,
+        )
+
+    col1, col2 = st.columns(2)
+    with col1:
+        if st.button(
+            "🗂️ Index Folder",
+            key="ingest_btn",
+            help=f"Index {get_docs_dir()} in the background",
+            disabled=ingest_running,
+            use_container_width=True,
+        ):
+            st.session_state.ingest_process = start_background_ingestion()
+            st.rerun()
+    with col2:
+        if st.button(
+            "📚 Use Library",
+            key="attach_library",
+            help="Chat with the last indexed version of the folder",
+            disabled=not (library_manifest and library_manifest.get("num_chunks")),
+            use_container_width=True,
+        ):
+            lease = index_registry.acquire(
+                f"library:{library_manifest['updated']}",
+                lambda: load_library(init_embeddings()),
+            )
+            if lease.vectorstore is not None:
+                # An upload still being indexed would replace the library
+                if st.session_state.index_job is not None:
+                    st.session_state.index_job.discard()
+                    st.session_state.index_job = None
+                if st.session_state.index_lease is not None:
+                    st.session_state.index_lease.release()
+                vectorstore = lease.vectorstore
+                st.session_state.index_lease = lease
+                st.session_state.vectorstore = vectorstore
+                st.session_state.corpus_hash = utils.get_corpus_hash(vectorstore)
+                st.session_state.library_sources = set(
+                    utils.get_indexed_files(vectorstore)
+                )
+                st.session_state.sources = sorted(st.session_state.library_sources)
+                st.session_state.index_bytes = library_manifest.get("index_bytes", 0)
+                st.session_state.index_chunks = vectorstore.index.ntotal
+                metrics.set_gauge("docuchat_index_vectors", vectorstore.index.ntotal)
+                metrics.set_gauge("docuchat_index_bytes", st.session_state.index_bytes)
+                st.session_state.load_errors = []
+            else:
+                lease.release()
+            st.rerun()
+
+    # Report files that could not be loaded
+    for error in st.session_state.load_errors:
+        st.markdown(
+            f'<div class="status-warning">⚠️ {error}</div>',
+            unsafe_allow_html=True,
+        )
 
     # Display loaded documents with enhanced styling
-    if st.session_state.documents:
+    if st.session_state.sources:
         st.markdown(
             '<div class="section-header">📚 Loaded Documents</div>',
             unsafe_allow_html=True,
         )
-        sources = list(
-            set(
-                [
-                    doc.metadata.get("source", "Unknown")
-                    for doc in st.session_state.documents
-                ]
-            )
-        )
+        sources = st.session_state.sources
 
         for i, source in enumerate(sources, 1):
             st.markdown(
@@ -187,7 +507,7 @@ with st.sidebar:
             )
 
         # Document stats
-        total_chunks = len(st.session_state.documents)
+        total_chunks = st.session_state.index_chunks
         st.markdown(
             f"""
             <div class="status-success">
@@ -196,6 +516,17 @@ with st.sidebar:
         """,
             unsafe_allow_html=True,
         )
+        if st.session_state.vectorstore and st.session_state.index_bytes:
+            num_vectors = st.session_state.index_chunks
+            st.markdown(
+                f"""
+                <div class="status-info">
+                    💾 Index: {st.session_state.index_bytes / 1024:.0f} KB •
+                    {st.session_state.index_bytes / max(num_vectors, 1):.0f} B/chunk
+                </div>
+            """,
+                unsafe_allow_html=True,
+            )
 
     st.markdown("---")
 
@@ -253,6 +584,56 @@ with st.sidebar:
             help="Number of relevant document chunks to use for context",
         )
 
+        search_modes = {
+            "vector": "🧭 Semantic (vector)",
+            "hybrid": "🔀 Hybrid (keyword + vector)",
+        }
+        search_mode = st.selectbox(
+            "🔎 Search Mode:",
+            options=list(search_modes.keys()),
+            format_func=lambda x: search_modes[x],
+            index=list(search_modes.keys()).index(config.search.get("mode", "vector")),
+            help="Hybrid also matches exact terms such as names, codes and numbers",
+        )
+
+        rerank = st.checkbox(
+            "🎯 Re-rank Results",
+            value=config.rerank.get("enabled", False),
+            help="Re-score a larger candidate pool with a local cross-encoder "
+            "and keep only the best chunks",
+        )
+
+        where = None
+        if st.session_state.collection:
+            # Applied inside the index search, not to its results
+            with st.expander("🧰 Filters", expanded=False):
+                filter_sources = st.multiselect("Files:", st.session_state.sources)
+                filter_types = st.multiselect(
+                    "File types:",
+                    sorted(
+                        {
+                            source.rsplit(".", 1)[-1].lower()
+                            for source in st.session_state.sources
+                        }
+                    ),
+                )
+                added = st.date_input(
+                    "Added between:",
+                    value=(),
+                    help="When the files were added to the collection",
+                )
+            where = vector_backends.MetadataFilter(
+                sources=filter_sources or None,
+                file_types=filter_types or None,
+                since=datetime.combine(added[0], datetime.min.time()).timestamp()
+                if added
+                else None,
+                until=datetime.combine(added[-1], datetime.max.time()).timestamp()
+                if added
+                else None,
+            )
+            where = where or None
+
         # Search quality indicator
         quality_labels = {
             1: "⚡ Fast",
@@ -271,6 +652,9 @@ with st.sidebar:
         )
     else:
         num_docs = 3
+        search_mode = config.search.get("mode", "vector")
+        rerank = config.rerank.get("enabled", False)
+        where = None
 
     st.markdown("---")
 
@@ -308,14 +692,57 @@ with st.sidebar:
 
     # Average response time
     if st.session_state.response_times:
-        avg_time = sum(st.session_state.response_times) / len(
-            st.session_state.response_times
+        num_responses = len(st.session_state.response_times)
+        avg_time = (
+            sum(t["total"] for t in st.session_state.response_times) / num_responses
+        )
+        avg_first_token = (
+            sum(t["first_token"] for t in st.session_state.response_times)
+            / num_responses
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown(
+                f"""
+                <div class="metric-container">
+                    <div class="metric-value" style="color: #667eea;">⏱️ {avg_time:.1f}s</div>
+                    <div class="metric-label">Avg Response Time</div>
+                </div>
+            """,
+                unsafe_allow_html=True,
+            )
+        with col2:
+            st.markdown(
+                f"""
+                <div class="metric-container">
+                    <div class="metric-value" style="color: #667eea;">⚡ {avg_first_token:.1f}s</div>
+                    <div class="metric-label">Avg First Token</div>
+                </div>
+            """,
+                unsafe_allow_html=True,
+            )
+
+    # Prompt tokens avoided by summarizing older turns
+    if st.session_state.history_tokens_saved:
+        st.markdown(
+            f"""
+            <div class="metric-container">
+                <div class="metric-value" style="color: #4ECDC4;">✂️ {st.session_state.history_tokens_saved:,}</div>
+                <div class="metric-label">History Tokens Saved</div>
+            </div>
+        """,
+            unsafe_allow_html=True,
         )
+
+    # Answer cache effectiveness
+    if config.answer_cache.get("enabled", True) and (
+        answer_cache.hits or answer_cache.misses
+    ):
         st.markdown(
             f"""
             <div class="metric-container">
-                <div class="metric-value" style="color: #667eea;">⏱️ {avg_time:.1f}s</div>
-                <div class="metric-label">Avg Response Time</div>
+                <div class="metric-value" style="color: #4ECDC4;">🎯 {answer_cache.hit_rate:.0%}</div>
+                <div class="metric-label">Answer Cache Hit Rate ({answer_cache.hits} hits, {answer_cache.semantic_hits} similar)</div>
             </div>
         """,
             unsafe_allow_html=True,
@@ -330,6 +757,8 @@ with st.sidebar:
     if st.button(config.sidebar["clear_button_text"], use_container_width=True):
         st.session_state.messages = []
         st.session_state.response_times = []
+        st.session_state.history_state = {}
+        st.session_state.history_tokens_saved = 0
         st.rerun()
 
     # Export chat button
@@ -405,69 +834,167 @@ if prompt := st.chat_input(config.sidebar["input_placeholder"]):
 
     # Generate AI response
     with st.chat_message("assistant"):
+        start_time = time.time()
+        client = init_client()
+        cached_answer = None
         with st.spinner(config.messages["thinking"]):
-            start_time = time.time()
+            # Repeated or near-duplicate questions are answered from the cache
+            use_answer_cache = bool(
+                st.session_state.vectorstore
+                and config.answer_cache.get("enabled", True)
+            )
+            if use_answer_cache:
+                # Other sessions write to shared collections, so their
+                # version comes from the store itself
+                vectorstore = st.session_state.vectorstore
+                corpus = (
+                    vectorstore.version
+                    if isinstance(vectorstore, vector_backends.VectorBackend)
+                    else st.session_state.corpus_hash
+                )
+                cache_scope = (
+                    corpus,
+                    selected_model,
+                    temperature,
+                    max_tokens,
+                    num_docs,
+                    search_mode,
+                    rerank,
+                    st.session_state.collection,
+                    where.key() if where else None,
+                )
+                cached_answer, query_vector = answer_cache.lookup(
+                    cache_scope, prompt, init_embeddings().embed_query
+                )
 
+            if cached_answer is not None:
+                sources = cached_answer["sources"]
             # Check if we have documents loaded for RAG
-            if st.session_state.vectorstore:
+            elif st.session_state.vectorstore:
                 # Use RAG approach
-                context, sources = get_relevant_context(
-                    st.session_state.vectorstore, prompt, num_docs
+                token_budget = None
+                if config.context.get("packing", True):
+                    token_budget = get_token_budget(
+                        selected_model,
+                        max_tokens,
+                        config.app["system_prompt"]
+                        + utils.create_rag_prompt("", prompt),
+                    )
+                context, sources = utils.get_relevant_context(
+                    st.session_state.vectorstore,
+                    prompt,
+                    num_docs,
+                    search_mode,
+                    token_budget,
+                    rerank,
+                    where,
                 )
-                enhanced_prompt = create_rag_prompt(context, prompt)
+                enhanced_prompt = utils.create_rag_prompt(context, prompt)
 
                 messages = [
                     {"role": "system", "content": config.app["system_prompt"]},
                     {"role": "user", "content": enhanced_prompt},
                 ]
             else:
-                # Use regular chat approach
-                messages = [{"role": "system", "content": config.app["system_prompt"]}]
-                messages.extend(
-                    [
-                        {"role": m["role"], "content": m["content"]}
-                        for m in st.session_state.messages
-                    ]
+                # Use regular chat approach with a bounded history window
+                history, tokens_saved = compact_history(
+                    st.session_state.messages,
+                    st.session_state.history_state,
+                    lambda summary_prompt: client.chat(
+                        model=config.history.get("summary_model") or selected_model,
+                        messages=[{"role": "user", "content": summary_prompt}],
+                        temperature=0.2,
+                        max_tokens=config.history.get("summary_max_tokens", 300),
+                    ),
                 )
+                st.session_state.history_tokens_saved += tokens_saved
+                messages = [{"role": "system", "content": config.app["system_prompt"]}]
+                messages.extend(history)
                 sources = []
 
-            # Get response from OpenRouter
-            response = chat_with_openrouter(
-                client=client,
-                model=selected_model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-
-            end_time = time.time()
-            response_time = end_time - start_time
-            st.session_state.response_times.append(response_time)
+        response_failed = False
+        if cached_answer is not None:
+            response = cached_answer["answer"]
+            first_token_time = None
+            st.markdown(response)
+        elif config.chat.get("stream", True):
+            # Stream tokens into the message as they arrive
+            placeholder = st.empty()
+            placeholder.markdown(config.messages["thinking"])
+            response = ""
+            first_token_time = None
+            last_render = 0.0
+            try:
+                for token in client.stream(
+                    model=selected_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    fallback_model=config.openrouter.get("fallback_model"),
+                ):
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    response += token
+                    # Throttle redraws; each one re-renders the whole message
+                    if time.time() - last_render > 0.05:
+                        placeholder.markdown(response + "▌")
+                        last_render = time.time()
+            except Exception as e:
+                response_failed = True
+                # Keep whatever arrived before the error
+                if response:
+                    response += f"\n\n⚠️ Error: {str(e)}"
+                else:
+                    response = f"Error: {str(e)}"
+            placeholder.markdown(response)
+        else:
+            with st.spinner(config.messages["thinking"]):
+                # Get response from OpenRouter
+                response = client.chat(
+                    model=selected_model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    fallback_model=config.openrouter.get("fallback_model"),
+                )
+            response_failed = response.startswith("Error: ")
+            first_token_time = None
 
             # Display response
             st.markdown(response)
 
-            # Display sources if available
-            if sources:
-                with st.expander("📄 Sources"):
-                    for source in sources:
-                        st.text(f"• {source}")
-
-            response_timestamp = datetime.now().strftime(
-                config.chat["timestamp_format"]
-            )
-            st.caption(f"*{response_timestamp}*")
+        if use_answer_cache and cached_answer is None and not response_failed:
+            answer_cache.store(cache_scope, prompt, query_vector, response, sources)
 
-            # Add assistant message to session state
-            assistant_message = {
-                "role": "assistant",
-                "content": response,
-                "timestamp": response_timestamp,
+        response_time = time.time() - start_time
+        st.session_state.response_times.append(
+            {
+                "first_token": first_token_time
+                if first_token_time is not None
+                else response_time,
+                "total": response_time,
             }
-            if sources:
-                assistant_message["sources"] = sources
+        )
+
+        # Display sources if available
+        if sources:
+            with st.expander("📄 Sources"):
+                for source in sources:
+                    st.text(f"• {source}")
 
-            st.session_state.messages.append(assistant_message)
+        response_timestamp = datetime.now().strftime(config.chat["timestamp_format"])
+        st.caption(f"*{response_timestamp}*")
+
+        # Add assistant message to session state
+        assistant_message = {
+            "role": "assistant",
+            "content": response,
+            "timestamp": response_timestamp,
+        }
+        if sources:
+            assistant_message["sources"] = sources
+
+        st.session_state.messages.append(assistant_message)
 
 # Footer
 st.markdown(
@@ -478,3 +1005,7 @@ st.markdown(
 """,
     unsafe_allow_html=True,
 )
+
+# Warm up after the page has been sent, so the first render does not wait
+if config.startup.get("prewarm", False):
+    init_prewarm()
@@ -0,0 +1,388 @@
+import argparse
+import io
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from config import config
+from openrouter_client import AsyncOpenRouterClient
+from utils import (
+    create_rag_prompt,
+    create_vector_store,
+    get_embeddings,
+    get_relevant_context,
+    load_documents_from_files,
+    split_documents,
+)
+
+SAMPLE_FILE = "data/sample.txt"
+TOPICS = [
+    "invoice",
+    "warranty",
+    "shipment",
+    "contract",
+    "battery",
+    "firmware",
+    "payroll",
+    "audit",
+    "license",
+    "sensor",
+]
+QUERIES = [
+    "What is LangChain?",
+    "What does Chroma store?",
+    "What is Streamlit used for?",
+]
+
+
+class MemoryFile(io.BytesIO):
+    """In-memory stand-in for a Streamlit upload"""
+
+    def __init__(self, name: str, data: bytes):
+        super().__init__(data)
+        self.name = name
+        self.size = len(data)
+
+
+def build_corpus(num_files: int, paragraphs: int, seed: int = 0):
+    """Deterministic synthetic files plus data/sample.txt, and matching queries"""
+    rng = random.Random(seed)
+    files, queries = [], list(QUERIES)
+    for i in range(num_files):
+        lines = []
+        for j in range(paragraphs):
+            topic = rng.choice(TOPICS)
+            code = f"{topic[:3].upper()}-{rng.randint(1000, 9999)}"
+            amount = rng.randint(10, 5000)
+            sentence = (
+                f"Record {i}.{j}: the {topic} {code} was reviewed by team "
+                f"{rng.choice(TOPICS)} and closed at {amount} units after "
+                f"{rng.randint(1, 30)} days."
+            )
+            lines.append(" ".join([sentence] * rng.randint(2, 5)))
+            if rng.random() < 0.05:
+                queries.append(f"What happened to {topic} {code}?")
+        files.append(MemoryFile(f"synthetic_{i:04d}.txt", "\n\n".join(lines).encode()))
+    with open(SAMPLE_FILE, "rb") as f:
+        files.append(MemoryFile("sample.txt", f.read()))
+    return files, queries
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Otherwise delayed ACKs add ~40 ms to every response
+    disable_nagle_algorithm = True
+    latency = 0.0
+    tokens = 50
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        time.sleep(self.latency)
+        self._answer(body)
+
+    def _answer(self, body: dict):
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            for _ in range(self.tokens):
+                chunk = {
+                    "id": "stub",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": "tok "},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        data = json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {
+                            "role": "assistant",
+                            "content": "tok " * self.tokens,
+                        },
+                        "finish_reason": "stop",
+                    }
+                ],
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def start_stub_server(latency: float) -> ThreadingHTTPServer:
+    """Local OpenAI-compatible server answering with canned tokens"""
+    handler = type("StubHandler", (_StubHandler,), {"latency": latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in KiB on Linux; children covers the parsing pool
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "min_ms": float(ms.min()),
+    }
+
+
+def run_benchmark(
+    embeddings,
+    num_files: int = 50,
+    paragraphs: int = 40,
+    repeat: int = 3,
+    num_docs: int = 3,
+    llm_latency: float = 0.05,
+    llm_requests: int = 20,
+) -> Dict:
+    """Time each pipeline stage on a fixed corpus; returns a JSON-able report.
+
+    ``index_build`` times ``create_vector_store`` end to end (split, embed
+    and FAISS build). Unless the on-disk cache is left enabled in config,
+    every repeat measures a cold build.
+    """
+    files, queries = build_corpus(num_files, paragraphs)
+    samples: Dict[str, List[float]] = {}
+    rss: Dict[str, Dict[str, float]] = {}
+
+    def measure(name: str, fn: Callable, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.setdefault(name, []).append(time.perf_counter() - start)
+        rss[name] = peak_rss_mb()
+        return result
+
+    for _ in range(repeat):
+        documents, errors = measure("load", load_documents_from_files, files)
+        splits = measure("split", split_documents, documents)
+        texts = [doc.page_content for doc in splits]
+        measure("embed", embeddings.embed_documents, texts)
+        vectorstore = measure("index_build", create_vector_store, documents, embeddings)
+    for mode in ("vector", "hybrid"):
+        for query in queries:
+            measure(
+                f"retrieve_{mode}",
+                get_relevant_context,
+                vectorstore,
+                query,
+                num_docs,
+                mode,
+            )
+
+    server = start_stub_server(llm_latency)
+    client = AsyncOpenRouterClient(
+        {
+            **config.openrouter,
+            "base_url": f"http://127.0.0.1:{server.server_port}/v1",
+            "hedge_after_seconds": 0,
+        },
+        api_key="benchmark",
+    )
+    model = config.app["available_models"][0]
+
+    def stream(messages):
+        start = time.perf_counter()
+        for i, _ in enumerate(client.stream(model, messages)):
+            if i == 0:
+                samples.setdefault("llm_first_token", []).append(
+                    time.perf_counter() - start
+                )
+
+    for query in queries[:llm_requests]:
+        context, _ = get_relevant_context(vectorstore, query, num_docs)
+        messages = [{"role": "user", "content": create_rag_prompt(context, query)}]
+        measure("llm", client.chat, model, messages)
+        measure("llm_stream", stream, messages)
+    server.shutdown()
+
+    return {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {
+            "embedding_model": getattr(
+                embeddings, "model_name", type(embeddings).__name__
+            ),
+            "index": config.index,
+            "cache_enabled": config.cache.get("enabled", True),
+        },
+        "corpus": {
+            "files": len(files),
+            "bytes": sum(f.size for f in files),
+            "documents": len(documents),
+            "chunks": len(splits),
+            "queries": len(queries),
+            "load_errors": len(errors),
+        },
+        "stages": {name: summarize(values) for name, values in samples.items()},
+        # Process-lifetime peaks, read after each stage
+        "peak_rss_mb": rss,
+    }
+
+
+# Runs in a fresh interpreter so imports and resource setup are cold
+STARTUP_SCRIPT = """
+import sys, time
+from streamlit.testing.v1 import AppTest
+
+app = AppTest.from_file(sys.argv[1], default_timeout=600)
+start = time.perf_counter()
+app.run()
+if app.exception:
+    sys.exit(app.exception[0].value)
+print(time.perf_counter() - start)
+"""
+
+
+def measure_startup(app_path: str = "app.py", runs: int = 3) -> List[float]:
+    """Seconds for a new process to run the app script to its first page"""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, app_path],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: Dict, current: Dict) -> List[Dict]:
+    """p50/p95 change per stage between two reports (negative is faster)"""
+    rows = []
+    for name, stats in current["stages"].items():
+        before = baseline["stages"].get(name)
+        if before is None:
+            continue
+        row = {"stage": name}
+        for key in ("p50_ms", "p95_ms"):
+            row[key] = stats[key]
+            row[f"{key}_change"] = (stats[key] - before[key]) / max(before[key], 1e-9)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-stage latency and memory benchmark of the RAG pipeline"
+    )
+    parser.add_argument("--num-files", type=int, default=50)
+    parser.add_argument("--paragraphs", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--num-docs", type=int, default=3)
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.05, help="stub server delay (s)"
+    )
+    parser.add_argument("--llm-requests", type=int, default=20)
+    parser.add_argument(
+        "--use-cache",
+        action="store_true",
+        help="keep the embedding/index cache on (measures warm runs)",
+    )
+    parser.add_argument(
+        "--fake-embeddings",
+        type=int,
+        metavar="DIM",
+        help="use deterministic fake embeddings instead of the configured model",
+    )
+    parser.add_argument(
+        "--startup-runs",
+        type=int,
+        default=0,
+        help="also time cold starts of app.py to its first page (needs streamlit)",
+    )
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    args = parser.parse_args()
+
+    config.cache["enabled"] = args.use_cache
+    if args.fake_embeddings:
+        from langchain_community.embeddings import DeterministicFakeEmbedding
+
+        embeddings = DeterministicFakeEmbedding(size=args.fake_embeddings)
+    else:
+        embeddings = get_embeddings()
+
+    report = run_benchmark(
+        embeddings,
+        num_files=args.num_files,
+        paragraphs=args.paragraphs,
+        repeat=args.repeat,
+        num_docs=args.num_docs,
+        llm_latency=args.llm_latency,
+        llm_requests=args.llm_requests,
+    )
+    if args.startup_runs:
+        report["stages"]["startup"] = summarize(measure_startup(runs=args.startup_runs))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(json.load(f), report)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
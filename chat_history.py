@@ -0,0 +1,100 @@
+import hashlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import config
+from context_packing import estimate_tokens
+
+
+def _message_tokens(message: Dict) -> int:
+    # A few tokens of per-message framing on top of the content
+    return estimate_tokens(message["content"]) + 4
+
+
+def _prefix_hash(history: List[Dict], cut: int) -> str:
+    digest = hashlib.md5()
+    for message in history[:cut]:
+        digest.update(f"{message['role']}\0{message['content']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def create_summary_prompt(summary: str, messages: List[Dict]) -> str:
+    """Create a prompt folding older turns into the running summary"""
+    turns = "\n".join(f"{m['role'].title()}: {m['content']}" for m in messages)
+    return f"""Update the summary of an ongoing conversation with the new turns below.
+
+Current summary:
+{summary or "(none)"}
+
+New turns:
+{turns}
+
+Write a concise summary that keeps facts, decisions, names and open questions the assistant may need later. Reply with the summary only."""
+
+
+def compact_history(
+    history: List[Dict],
+    state: Dict,
+    summarize: Callable[[str], str],
+    settings: Optional[Dict] = None,
+) -> Tuple[List[Dict], int]:
+    """Fit chat history into a token-bounded window plus a running summary.
+
+    Turns that fall out of the window are summarized incrementally: the
+    summary of everything before ``state["cut"]`` is kept in ``state`` and
+    only extended when the unsummarized turns exceed ``max_history_tokens``.
+    The window is then shrunk to ``keep_recent_tokens`` so the summary is
+    refreshed every few turns rather than on every one. Returns the messages
+    to send after the system prompt and the number of tokens saved.
+    """
+    settings = config.history if settings is None else settings
+    full_tokens = sum(_message_tokens(m) for m in history)
+    if not settings.get("enabled", True):
+        return [{"role": m["role"], "content": m["content"]} for m in history], 0
+
+    # Start over if the history was cleared or rewritten under the summary
+    cut = state.get("cut", 0)
+    if cut > len(history) or state.get("prefix_hash") != _prefix_hash(history, cut):
+        state.clear()
+        cut = 0
+    summary = state.get("summary", "")
+
+    max_tokens = settings.get("max_history_tokens", 2000)
+    keep_tokens = settings.get("keep_recent_tokens", max_tokens // 2)
+    recent = history[cut:]
+    if sum(_message_tokens(m) for m in recent) > max_tokens:
+        # Always keep the latest message, then as many as fit the low mark
+        new_cut, used = len(history) - 1, _message_tokens(history[-1])
+        while new_cut > cut and used + _message_tokens(history[new_cut - 1]) <= (
+            keep_tokens
+        ):
+            new_cut -= 1
+            used += _message_tokens(history[new_cut])
+        new_summary = summarize(create_summary_prompt(summary, history[cut:new_cut]))
+        if new_summary and not new_summary.startswith("Error: "):
+            cut, summary = new_cut, new_summary.strip()
+            state.update(
+                cut=cut, summary=summary, prefix_hash=_prefix_hash(history, cut)
+            )
+        recent = history[cut:]
+
+    # If summarizing failed, drop the oldest turns rather than overflow
+    window: List[Dict] = []
+    used = 0
+    for message in reversed(recent):
+        used += _message_tokens(message)
+        if window and used > max_tokens:
+            break
+        window.append({"role": message["role"], "content": message["content"]})
+    window.reverse()
+
+    messages = []
+    if summary:
+        messages.append(
+            {
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            }
+        )
+    messages.extend(window)
+    sent_tokens = sum(_message_tokens(m) for m in messages)
+    return messages, max(0, full_tokens - sent_tokens)
@@ -31,6 +31,10 @@ class Config:
         if os.getenv("PAGE_ICON"):
             self._config["app"]["page_icon"] = os.getenv("PAGE_ICON")
 
+        if os.getenv("OPENROUTER_BASE_URL"):
+            self._config.setdefault("openrouter", {})
+            self._config["openrouter"]["base_url"] = os.getenv("OPENROUTER_BASE_URL")
+
     def _validate(self):
         if "title" not in self._config.get("app", {}):
             warnings.warn("Missing 'title' in [app] config")
@@ -67,6 +71,70 @@ class Config:
     def chat(self):
         return self._config.get("chat", {})
 
+    @property
+    def cache(self):
+        return self._config.get("cache", {})
+
+    @property
+    def context(self):
+        return self._config.get("context", {})
+
+    @property
+    def rerank(self):
+        return self._config.get("rerank", {})
+
+    @property
+    def search(self):
+        return self._config.get("search", {})
+
+    @property
+    def index(self):
+        return self._config.get("index", {})
+
+    @property
+    def embeddings(self):
+        return self._config.get("embeddings", {})
+
+    @property
+    def answer_cache(self):
+        return self._config.get("answer_cache", {})
+
+    @property
+    def loading(self):
+        return self._config.get("loading", {})
+
+    @property
+    def startup(self):
+        return self._config.get("startup", {})
+
+    @property
+    def dedup(self):
+        return self._config.get("dedup", {})
+
+    @property
+    def splitting(self):
+        return self._config.get("splitting", {})
+
+    @property
+    def metrics(self):
+        return self._config.get("metrics", {})
+
+    @property
+    def vector_store(self):
+        return self._config.get("vector_store", {})
+
+    @property
+    def ingest(self):
+        return self._config.get("ingest", {})
+
+    @property
+    def history(self):
+        return self._config.get("history", {})
+
+    @property
+    def openrouter(self):
+        return self._config.get("openrouter", {})
+
 
 # Global instance
 config = Config()
@@ -76,7 +144,7 @@ EMBEDDING_MODEL = "text-embedding-3-small"  # or "text-embedding-ada-002"
 EMBEDDING_DIMENSION = 1536
 
 # Vector store settings
-CHROMA_DIR = "./chroma_db"
+CHROMA_DIR = "./chroma_store"
 DOCS_DIR = "./docs"
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 100
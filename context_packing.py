@@ -0,0 +1,110 @@
+import math
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from config import config
+from lazy_imports import LazyModule
+
+# Also used for plain chat; keep LangChain community out of the first page
+vectorstore_utils = LazyModule("langchain_community.vectorstores.utils")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return math.ceil(len(text) / 4)
+
+
+def get_token_budget(
+    model: str, max_tokens: int, prompt_text: str = "", settings: Optional[Dict] = None
+) -> int:
+    """Context tokens left after the answer and the rest of the prompt"""
+    settings = config.context if settings is None else settings
+    context_window = settings.get("model_context_tokens", {}).get(
+        model, settings.get("default_context_tokens", 8192)
+    )
+    available = context_window - max_tokens - estimate_tokens(prompt_text)
+    available -= settings.get("reserved_tokens", 256)
+    return max(0, min(available, settings.get("max_context_tokens", 3000)))
+
+
+def merge_overlapping(
+    first: str, second: str, min_overlap: int = 20, max_overlap: int = 400
+) -> Optional[str]:
+    """Join two chunks that share an overlapping span, or return None.
+
+    Adjacent splits repeat up to chunk_overlap characters; when one chunk's
+    tail is the other's head, the shared span is kept only once.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for head, tail in ((first, second), (second, first)):
+        longest = min(len(head), len(tail) - 1, max_overlap)
+        for size in range(longest, min_overlap - 1, -1):
+            if head.endswith(tail[:size]):
+                return head + tail[size:]
+    return None
+
+
+def pack_context(
+    query_vector,
+    docs: List[Document],
+    vectors,
+    token_budget: int,
+    max_chunks: int,
+    settings: Optional[Dict] = None,
+) -> List[Document]:
+    """Select and merge retrieved chunks to fit a token budget.
+
+    Candidates are ordered by maximal marginal relevance, near-duplicates
+    are dropped, and chunks overlapping an already selected chunk from the
+    same source are merged into it so the shared span is paid for once.
+    """
+    settings = config.context if settings is None else settings
+    if not docs:
+        return []
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    order = vectorstore_utils.maximal_marginal_relevance(
+        np.asarray(query_vector, dtype=np.float32),
+        vectors,
+        lambda_mult=settings.get("mmr_lambda", 0.7),
+        k=len(docs),
+    )
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    duplicate_threshold = settings.get("duplicate_threshold", 0.95)
+
+    packed: List[Document] = []
+    packed_positions: List[int] = []
+    used_tokens = 0
+    for position in order:
+        doc = docs[position]
+        if packed_positions and (
+            float(np.max(unit[packed_positions] @ unit[position]))
+            >= duplicate_threshold
+        ):
+            continue
+
+        source = doc.metadata.get("source")
+        for i, selected in enumerate(packed):
+            if selected.metadata.get("source") != source:
+                continue
+            merged = merge_overlapping(selected.page_content, doc.page_content)
+            if merged is None:
+                continue
+            cost = estimate_tokens(merged) - estimate_tokens(selected.page_content)
+            if used_tokens + cost <= token_budget:
+                packed[i] = Document(page_content=merged, metadata=selected.metadata)
+                packed_positions.append(position)
+                used_tokens += cost
+            break
+        else:
+            cost = estimate_tokens(doc.page_content)
+            if len(packed) < max_chunks and used_tokens + cost <= token_budget:
+                packed.append(doc)
+                packed_positions.append(position)
+                used_tokens += cost
+    return packed
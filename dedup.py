@@ -0,0 +1,228 @@
+import hashlib
+import uuid
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+import metrics
+from config import config
+
+
+class _WordHashes(dict):
+    """32-bit word hashes, computed once per distinct word"""
+
+    def __missing__(self, word: str) -> int:
+        value = self[word] = zlib.crc32(word.encode())
+        return value
+
+
+def exact_key(text: str) -> bytes:
+    """Hash of the text ignoring case and whitespace (punctuation and digits count)"""
+    normalized = " ".join(text.lower().split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+
+
+class DedupIndex:
+    """Finds chunks that repeat one already kept in a store.
+
+    Exact duplicates match on ``exact_key``. With ``near_duplicates`` on,
+    chunks of different files are also matched by MinHash signatures over
+    word shingles with LSH banding, when the estimated Jaccard similarity
+    reaches ``threshold``; chunks of the same file never are, since e.g.
+    catalog rows that differ in one number are distinct content. Entries
+    are keyed by docstore id so they can be removed with their chunks.
+    """
+
+    def __init__(
+        self,
+        near_duplicates: bool = False,
+        threshold: float = 0.9,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_words: int = 5,
+        seed: int = 0,
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        rng = np.random.default_rng(seed)
+        # Multiply-shift hashing: (a * x + b) mod 2**64, top 32 bits, odd a
+        self._a = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) * np.uint64(
+            2
+        ) + np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+        self._word_hashes = _WordHashes()
+        self._exact: Dict[bytes, str] = {}
+        self._buckets: Dict[tuple, Set[str]] = {}
+        # doc id -> (exact key, signature or None, source)
+        self._entries: Dict[str, tuple] = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _shingles(self, words: List[str]) -> np.ndarray:
+        """32-bit hashes of the runs of ``shingle_words`` words"""
+        words = np.fromiter(
+            map(self._word_hashes.__getitem__, words), dtype=np.uint64, count=len(words)
+        )
+        n = min(self.shingle_words, len(words))
+        count = len(words) - n + 1
+        # Polynomial hash over each window, computed for all windows at once
+        shingles = np.zeros(count, dtype=np.uint64)
+        for offset in range(n):
+            shingles = (
+                shingles * np.uint64(1000003) + words[offset : offset + count]
+            ) & (np.uint64(0xFFFFFFFF))
+        return shingles
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of the text's lowercased words"""
+        shingles = self._shingles(text.lower().split())
+        return ((np.outer(self._a, shingles) + self._b[:, None]) >> np.uint64(32)).min(
+            axis=1
+        )
+
+    def _band_keys(self, signature: np.ndarray) -> List[tuple]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def find(
+        self, text: str, source: str
+    ) -> Tuple[Optional[str], Optional[str], tuple]:
+        """Return the id of a kept chunk ``text`` repeats, "exact" or "near",
+        and the hashes to pass to ``add`` if it is kept"""
+        key = exact_key(text)
+        match = self._exact.get(key)
+        if match is not None:
+            return match, "exact", (key, None)
+        if not self.near_duplicates:
+            return None, None, (key, None)
+
+        signature = self.signature(text)
+        candidates = {
+            doc_id
+            for band_key in self._band_keys(signature)
+            for doc_id in self._buckets.get(band_key, ())
+        }
+        for doc_id in sorted(candidates):
+            _, other, other_source = self._entries[doc_id]
+            if other_source != source and np.mean(other == signature) >= self.threshold:
+                return doc_id, "near", (key, signature)
+        return None, None, (key, signature)
+
+    def add(self, doc_id: str, text: str, source: str, hashes: tuple = None):
+        """Index a kept chunk (``hashes`` as returned by ``find``)"""
+        key, signature = hashes or (exact_key(text), None)
+        if self.near_duplicates and signature is None:
+            signature = self.signature(text)
+        self.remove([doc_id])
+        self._entries[doc_id] = (key, signature, source)
+        self._exact.setdefault(key, doc_id)
+        if signature is not None:
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(doc_id)
+
+    def remove(self, doc_ids):
+        for doc_id in doc_ids:
+            entry = self._entries.pop(doc_id, None)
+            if entry is None:
+                continue
+            key, signature, _ = entry
+            if self._exact.get(key) == doc_id:
+                del self._exact[key]
+            if signature is not None:
+                for band_key in self._band_keys(signature):
+                    bucket = self._buckets.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(doc_id)
+                        if not bucket:
+                            del self._buckets[band_key]
+
+
+def new_dedup_index(settings: Optional[Dict] = None) -> Optional[DedupIndex]:
+    """A DedupIndex configured from [dedup], or None when dedup is off"""
+    settings = config.dedup if settings is None else settings
+    if not settings.get("enabled", True):
+        return None
+    return DedupIndex(
+        near_duplicates=settings.get("near_duplicates", False),
+        threshold=settings.get("threshold", 0.9),
+        num_perm=settings.get("num_perm", 64),
+        bands=settings.get("bands", 16),
+        shingle_words=settings.get("shingle_words", 5),
+    )
+
+
+def add_source_ref(metadata: dict, duplicate: dict) -> dict:
+    """Copy of ``metadata`` that also lists the duplicate's file"""
+    source = duplicate.get("source", "Unknown")
+    sources = list(metadata.get("sources", [metadata.get("source", "Unknown")]))
+    if source in sources:
+        return metadata
+    file_hashes = list(metadata.get("file_hashes", [metadata.get("file_hash")]))
+    sources.append(source)
+    file_hashes.append(duplicate.get("file_hash"))
+    return {**metadata, "sources": sources, "file_hashes": file_hashes}
+
+
+def replace_metadata(docstore, doc_id: str, metadata: dict):
+    """Swap in a copy of a stored chunk with new metadata.
+
+    Replaced rather than edited: copies of the store share documents.
+    """
+    stored = docstore.search(doc_id)
+    docstore._dict[doc_id] = Document(
+        id=doc_id, page_content=stored.page_content, metadata=metadata
+    )
+
+
+def deduplicate(
+    chunks: List[Document],
+    dedup_index: Optional[DedupIndex],
+    docstore=None,
+    report: Optional[Dict[str, int]] = None,
+) -> Tuple[List[str], List[Document]]:
+    """Drop chunks that repeat a kept one, earlier in ``chunks`` or in the store.
+
+    Returns new docstore ids for the kept chunks, which are added to
+    ``dedup_index``. The file of each dropped chunk is added to the
+    ``sources``/``file_hashes`` of the chunk it repeats; stored chunks are
+    replaced in ``docstore``. ``report``, if given, is incremented with the
+    number of ``exact`` and ``near`` duplicates skipped.
+    """
+    if dedup_index is None:
+        return [str(uuid.uuid4()) for _ in chunks], list(chunks)
+
+    pending: Dict[str, Document] = {}
+    counts = {"exact": 0, "near": 0}
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "Unknown")
+        match, kind, hashes = dedup_index.find(chunk.page_content, source)
+        if match is None:
+            doc_id = str(uuid.uuid4())
+            dedup_index.add(doc_id, chunk.page_content, source, hashes)
+            pending[doc_id] = chunk
+            continue
+        counts[kind] += 1
+        if match in pending:
+            kept = pending[match]
+            kept.metadata = add_source_ref(kept.metadata, chunk.metadata)
+        elif docstore is not None:
+            stored = docstore.search(match)
+            replace_metadata(
+                docstore, match, add_source_ref(stored.metadata, chunk.metadata)
+            )
+
+    for kind, count in counts.items():
+        metrics.inc("docuchat_dedup_chunks_total", count, kind=kind)
+        if report is not None:
+            report[kind] = report.get(kind, 0) + count
+    return list(pending), list(pending.values())
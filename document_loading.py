@@ -0,0 +1,35 @@
+# Kept free of heavy imports: spawned parse workers import this module, and
+# each one imports only the loader its files need
+
+
+def load_file(file_name: str, path: str, file_hash: str) -> list:
+    """Parse a single file into documents (runs in a worker process)"""
+    file_extension = file_name.split(".")[-1].lower()
+
+    # Load document based on file type
+    if file_extension == "pdf":
+        from langchain_community.document_loaders.pdf import PyPDFLoader
+
+        loader = PyPDFLoader(path)
+    elif file_extension == "txt":
+        from langchain_community.document_loaders.text import TextLoader
+
+        loader = TextLoader(path, encoding="utf-8")
+    elif file_extension == "csv":
+        from langchain_community.document_loaders.csv_loader import CSVLoader
+
+        loader = CSVLoader(path)
+    else:
+        from langchain_community.document_loaders.word_document import (
+            UnstructuredWordDocumentLoader,
+        )
+
+        loader = UnstructuredWordDocumentLoader(path)
+    docs = loader.load()
+
+    # Add source metadata
+    for doc in docs:
+        doc.metadata["source"] = file_name
+        doc.metadata["file_hash"] = file_hash
+        doc.metadata["file_type"] = file_extension
+    return docs
@@ -0,0 +1,132 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+
+import metrics
+
+
+def available_cores() -> int:
+    """Number of CPU cores this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class EmbeddingEngine(Embeddings):
+    """Batched sentence-transformers embeddings with throughput reporting.
+
+    Wraps ``HuggingFaceEmbeddings`` so vectors stay identical to the ones the
+    app produced before: same model, same text cleaning, same default batch
+    size of 32 and no normalization unless ``normalize`` is set.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        device: str = "cpu",
+        batch_size: int = 32,
+        num_threads: int = 0,
+        num_processes: int = 0,
+        normalize: bool = False,
+        query_cache_size: int = 1024,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.num_processes = num_processes
+        # Vectors from a normalized model must not share cache entries
+        self.namespace = f"{model_name}:normalized" if normalize else model_name
+
+        if device == "cpu":
+            import torch
+
+            torch.set_num_threads(num_threads or available_cores())
+
+        self._hf = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            encode_kwargs={
+                "batch_size": batch_size,
+                "normalize_embeddings": normalize,
+            },
+        )
+        self._pool = None
+        self._lock = threading.Lock()
+        self.query_cache_size = query_cache_size
+        self._query_cache = OrderedDict()
+        # Indexing jobs report their throughput from these totals
+        self.total_chunks = 0
+        self.total_seconds = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = self._hf._client.start_multi_process_pool(
+                ["cpu"] * self.num_processes
+            )
+            atexit.register(self.close)
+        return self._pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+
+        start = time.perf_counter()
+        if self.num_processes > 1 and len(texts) >= self.batch_size * 2:
+            with self._lock:
+                pool = self._get_pool()
+            # Same text cleaning as HuggingFaceEmbeddings._embed
+            cleaned = [text.replace("\n", " ") for text in texts]
+            vectors = self._hf._client.encode_multi_process(
+                cleaned,
+                pool,
+                batch_size=self.batch_size,
+                normalize_embeddings=self.normalize,
+            ).tolist()
+        else:
+            vectors = self._hf.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.total_chunks += len(texts)
+            self.total_seconds += elapsed
+        if elapsed:
+            metrics.set_gauge(
+                "docuchat_embedding_chunks_per_second", len(texts) / elapsed
+            )
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, memoized in a bounded LRU cache"""
+        with self._lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+                metrics.inc(
+                    "docuchat_cache_requests_total",
+                    cache="query_embedding",
+                    result="hit",
+                )
+                return list(vector)
+        metrics.inc(
+            "docuchat_cache_requests_total", cache="query_embedding", result="miss"
+        )
+
+        vector = self._hf.embed_query(text)
+        if self.query_cache_size:
+            with self._lock:
+                self._query_cache[text] = tuple(vector)
+                while len(self._query_cache) > self.query_cache_size:
+                    self._query_cache.popitem(last=False)
+        return vector
+
+    def close(self):
+        """Stop the worker pool, if one was started"""
+        if self._pool is not None:
+            self._hf._client.stop_multi_process_pool(self._pool)
+            self._pool = None
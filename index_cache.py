@@ -0,0 +1,272 @@
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import hashlib
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from config import config
+from lexical_index import BM25Index
+
+
+def hash_text(text: str) -> str:
+    """Return the content hash used to key a chunk's embedding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _load_lexical_index(path: str, vectorstore: FAISS):
+    lexical_path = os.path.join(path, "lexical.pkl")
+    if os.path.isfile(lexical_path):
+        vectorstore.lexical_index = BM25Index.load(lexical_path)
+
+
+def load_faiss_store(path: str, embeddings, mmap: bool = True) -> FAISS:
+    """Load a saved vector store, optionally memory-mapping its index read-only"""
+    index_file = os.path.join(path, "index.faiss")
+    try:
+        if not mmap:
+            raise RuntimeError
+        index = faiss.read_index(
+            index_file, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        )
+    except RuntimeError:
+        # Index types without in-place mmap support are read normally
+        index = faiss.read_index(index_file)
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vectorstore = FAISS(embeddings, index, docstore, index_to_docstore_id)
+    _load_lexical_index(path, vectorstore)
+    return vectorstore
+
+
+class EmbeddingStore:
+    """SQLite store of chunk embeddings keyed by (model, content hash)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # auto_vacuum must be set before the first table is created
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                namespace TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (namespace, chunk_hash)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_used "
+            "ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    def get_many(
+        self, namespace: str, hashes: List[str], touch: bool = True
+    ) -> Dict[str, np.ndarray]:
+        """Return cached vectors for the given hashes, skipping misses.
+
+        ``touch`` marks them as used for eviction; queries pass False so
+        that searching never writes to the database.
+        """
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings "
+                    f"WHERE namespace = ? AND chunk_hash IN ({placeholders})",
+                    [namespace, *batch],
+                ).fetchall()
+                for chunk_hash, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+            if found and touch:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE namespace = ? AND chunk_hash = ?",
+                    [(now, namespace, h) for h in found],
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, namespace: str, vectors: Dict[str, List[float]]):
+        """Insert or refresh vectors for the given hashes"""
+        now = time.time()
+        rows = [
+            (namespace, h, np.asarray(v, dtype=np.float32).tobytes(), now)
+            for h, v in vectors.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(namespace, chunk_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def size_bytes(self) -> int:
+        total = 0
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+
+    def evict_bytes(self, num_bytes: int) -> int:
+        """Drop least recently used rows to free roughly num_bytes"""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if not count:
+                return 0
+            row_bytes = max(1, self.size_bytes() // count)
+            to_delete = min(count, num_bytes // row_bytes + 1)
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (to_delete,),
+            )
+            self._conn.commit()
+            # execute() steps the pragma once, which frees a single page
+            self._conn.executescript("PRAGMA incremental_vacuum;")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return to_delete
+
+
+class IndexCache:
+    """On-disk cache of chunk embeddings and built FAISS indexes.
+
+    Indexes are stored per corpus key under ``indexes/``; chunk vectors are
+    kept in ``embeddings.sqlite3`` so unchanged chunks are never re-embedded.
+    Total disk usage is kept under ``max_disk_mb`` by evicting the least
+    recently used indexes first and then the oldest embeddings.
+    """
+
+    def __init__(self, cache_dir: str, max_disk_mb: float = 2048):
+        self.cache_dir = cache_dir
+        self.index_dir = os.path.join(cache_dir, "indexes")
+        self.max_bytes = int(max_disk_mb * 1024 * 1024)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.embeddings = EmbeddingStore(os.path.join(cache_dir, "embeddings.sqlite3"))
+        self._lock = threading.Lock()
+
+    def index_path(self, key: str) -> str:
+        return os.path.join(self.index_dir, key)
+
+    def has_index(self, key: str) -> bool:
+        return os.path.isfile(os.path.join(self.index_path(key), "index.faiss"))
+
+    def load_index(self, key: str, embeddings) -> Optional[FAISS]:
+        """Load a cached index, or return None on a miss"""
+        path = self.index_path(key)
+        if not self.has_index(key):
+            return None
+        try:
+            vectorstore = FAISS.load_local(
+                path, embeddings, allow_dangerous_deserialization=True
+            )
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        _load_lexical_index(path, vectorstore)
+        # mtime doubles as the LRU timestamp for eviction
+        os.utime(path)
+        return vectorstore
+
+    def load_index_mmap(self, key: str, embeddings) -> Optional[FAISS]:
+        """Load a cached index as a read-only memory mapping of its file.
+
+        Pages are shared through the OS page cache, so every process and
+        session mapping the same file costs the RAM of one copy.
+        """
+        path = self.index_path(key)
+        if not self.has_index(key):
+            return None
+        os.utime(path)
+        return load_faiss_store(path, embeddings)
+
+    def save_index(self, key: str, vectorstore: FAISS):
+        """Persist an index atomically and enforce the disk budget"""
+        path = self.index_path(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        vectorstore.save_local(tmp_path)
+        lexical_index = getattr(vectorstore, "lexical_index", None)
+        if lexical_index is not None:
+            lexical_index.save(os.path.join(tmp_path, "lexical.pkl"))
+        with self._lock:
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        self.enforce_limit(keep=key)
+
+    def put_embeddings(self, namespace: str, vectors: Dict[str, List[float]]):
+        """Store chunk vectors and enforce the disk budget"""
+        self.embeddings.put_many(namespace, vectors)
+        self.enforce_limit()
+
+    def disk_usage(self) -> int:
+        return _dir_size(self.index_dir) + self.embeddings.size_bytes()
+
+    def enforce_limit(self, keep: Optional[str] = None):
+        """Evict least recently used entries until under the disk budget"""
+        with self._lock:
+            indexes = []
+            for name in os.listdir(self.index_dir):
+                path = os.path.join(self.index_dir, name)
+                if os.path.isdir(path):
+                    indexes.append((os.path.getmtime(path), name, _dir_size(path)))
+            indexes.sort()
+
+            total = sum(size for _, _, size in indexes) + self.embeddings.size_bytes()
+            for _, name, size in indexes:
+                if total <= self.max_bytes:
+                    return
+                if name == keep:
+                    continue
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+                total -= size
+
+            if total > self.max_bytes:
+                self.embeddings.evict_bytes(total - self.max_bytes)
+
+
+_index_cache = None
+_index_cache_lock = threading.Lock()
+
+
+def get_index_cache() -> Optional[IndexCache]:
+    """Return the process-wide index cache, or None if caching is disabled"""
+    global _index_cache
+    settings = config.cache
+    if not settings.get("enabled", True):
+        return None
+    with _index_cache_lock:
+        if _index_cache is None:
+            _index_cache = IndexCache(
+                settings.get("dir", "./cache"),
+                settings.get("max_disk_mb", 2048),
+            )
+    return _index_cache
@@ -0,0 +1,76 @@
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Callable, Dict
+
+
+class IndexLease:
+    """A session's handle on a shared index.
+
+    The registry reference is released when ``release`` is called or when
+    the lease is garbage collected, e.g. because its Streamlit session ended.
+    """
+
+    def __init__(self, registry: "IndexRegistry", key: str, vectorstore):
+        self.key = key
+        self.vectorstore = vectorstore
+        self._finalizer = weakref.finalize(self, registry.release, key)
+
+    def release(self):
+        self._finalizer()
+
+
+class IndexRegistry:
+    """Process-wide, reference-counted registry of read-only vector stores.
+
+    Sessions that index the same corpus share one store (typically a
+    memory-mapped FAISS index) instead of each holding a private copy. The
+    store is dropped once the last lease on it is released.
+    """
+
+    def __init__(self):
+        # key -> [future of the store, reference count]
+        self._entries: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, load: Callable[[], object]) -> IndexLease:
+        """Lease the store for ``key``, calling ``load`` if it is not open yet.
+
+        ``load`` runs outside the registry lock, so other keys can be
+        acquired and released meanwhile; sessions asking for the same key
+        wait for the one load. A failed load is not kept.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            loading = entry is None
+            if loading:
+                entry = self._entries[key] = [Future(), 0]
+            entry[1] += 1
+
+        if loading:
+            try:
+                entry[0].set_result(load())
+            except BaseException as e:
+                entry[0].set_exception(e)
+        try:
+            vectorstore = entry[0].result()
+        except BaseException:
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        return IndexLease(self, key, vectorstore)
+
+    def release(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Reference count of every open store"""
+        with self._lock:
+            return {key: entry[1] for key, entry in self._entries.items()}
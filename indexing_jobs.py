@@ -0,0 +1,146 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils import copy_vector_store, index_files
+from vector_backends import VectorBackend
+
+
+class IndexingCancelled(Exception):
+    pass
+
+
+class IndexingJob:
+    """An index update that runs off the Streamlit script thread.
+
+    FAISS stores are updated on a private copy, so chat keeps answering from
+    the current index until the caller swaps in ``vectorstore`` once the job
+    is ``done``. ``share``, if given, publishes the new FAISS store and
+    returns a lease; it also runs in the background. Persistent backends are
+    shared across sessions and updated in place, so they are never passed to
+    ``share``; only the session's view of them changes at the end.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        uploaded_files,
+        embeddings,
+        removed_sources: Iterable[str] = (),
+        share: Optional[Callable] = None,
+    ):
+        self._base = vectorstore
+        self._files = list(uploaded_files)
+        self._embeddings = embeddings
+        self._share = share
+        self.files_total = len(self._files)
+        self.removed_sources = set(removed_sources)
+        self.status: Dict = {
+            "stage": "queued",
+            "files_total": self.files_total,
+            "files_done": 0,
+            "files_failed": 0,
+            "batches_done": 0,
+            "chunks_added": 0,
+            "chunks_skipped": 0,
+        }
+        self.vectorstore = None
+        self.lease = None
+        self.errors: List[str] = []
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.embedded_chunks = 0
+        self.embed_seconds = 0.0
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def state(self) -> str:
+        """queued, running, done, cancelled or failed"""
+        if not self.done:
+            return "running" if self.started else "queued"
+        if self._cancel.is_set() and self.vectorstore is None:
+            return "cancelled"
+        return "failed" if self.error else "done"
+
+    @property
+    def progress(self) -> float:
+        """Fraction of files parsed, with the final batch counting as the rest"""
+        if self.done:
+            return 1.0
+        total = max(self.files_total, 1)
+        return min(self.status["files_done"] / total, 0.99)
+
+    @property
+    def indexed(self) -> bool:
+        """Whether the result should replace the current store"""
+        return self.state == "done" and (
+            not self.files_total
+            or bool(self.removed_sources)
+            or len(self.errors) < self.files_total
+        )
+
+    def cancel(self):
+        """Stop after the current file or batch; the current index is kept"""
+        self._cancel.set()
+
+    def _report(self, status: Dict):
+        self.status = dict(status)
+        if self._cancel.is_set():
+            raise IndexingCancelled()
+
+    def run(self):
+        self.started = time.time()
+        chunks_before = getattr(self._embeddings, "total_chunks", 0)
+        seconds_before = getattr(self._embeddings, "total_seconds", 0.0)
+        try:
+            if self._cancel.is_set():
+                raise IndexingCancelled()
+            vectorstore = self._base
+            if vectorstore is not None and not isinstance(vectorstore, VectorBackend):
+                # Never touch the store other threads are searching
+                vectorstore = copy_vector_store(vectorstore)
+            vectorstore, self.errors = index_files(
+                vectorstore,
+                self._files,
+                self._embeddings,
+                self.removed_sources,
+                progress=self._report,
+            )
+            if self._share is not None and not (
+                vectorstore is None or isinstance(vectorstore, VectorBackend)
+            ):
+                self.status["stage"] = "publishing"
+                self.lease = self._share(vectorstore)
+                vectorstore = self.lease.vectorstore
+            self.vectorstore = vectorstore
+        except IndexingCancelled:
+            pass
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            # Uploads and the old store are not needed once the job is over
+            self._files = []
+            self._base = None
+            self.embedded_chunks = (
+                getattr(self._embeddings, "total_chunks", 0) - chunks_before
+            )
+            self.embed_seconds = (
+                getattr(self._embeddings, "total_seconds", 0.0) - seconds_before
+            )
+            self.finished = time.time()
+            self.status["stage"] = "finished"
+            self._done.set()
+
+    def discard(self):
+        """Cancel the job and drop whatever it produced"""
+        self.cancel()
+        if self.done and self.lease is not None:
+            self.lease.release()
+            self.lease = None
+        self.vectorstore = None
@@ -0,0 +1,374 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from config import DOCS_DIR, config
+from lazy_imports import LazyModule
+
+# The app reads the status helpers on every run; only indexing needs these
+index_cache = LazyModule("index_cache")
+utils = LazyModule("utils")
+vector_index = LazyModule("vector_index")
+
+
+class LocalFile:
+    """A file on disk standing in for an upload.
+
+    It has the ``name`` and ``size`` of an upload; loaders read it through
+    ``path`` instead of copying its bytes.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        stat = os.stat(path)
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+
+
+def get_library_dir() -> str:
+    return config.ingest.get("index_dir", "./cache/library")
+
+
+def get_docs_dir() -> str:
+    return config.ingest.get("docs_dir") or DOCS_DIR
+
+
+def scan_docs_dir(docs_dir: str) -> List[LocalFile]:
+    """Find supported files under ``docs_dir``, named by their relative path"""
+    files = []
+    for root, dirs, names in os.walk(docs_dir):
+        dirs.sort()
+        for name in sorted(names):
+            if name.split(".")[-1].lower() not in utils.SUPPORTED_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            files.append(LocalFile(path, os.path.relpath(path, docs_dir)))
+    return files
+
+
+def _write_json(path: str, data: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> Optional[Dict]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_manifest(library_dir: Optional[str] = None) -> Optional[Dict]:
+    """Manifest of the last checkpoint, or None if nothing was indexed yet"""
+    library_dir = library_dir or get_library_dir()
+    return _read_json(os.path.join(library_dir, "current", "manifest.json"))
+
+
+def read_status(library_dir: Optional[str] = None) -> Optional[Dict]:
+    """Progress of the running or last ingestion job"""
+    library_dir = library_dir or get_library_dir()
+    return _read_json(os.path.join(library_dir, "status.json"))
+
+
+def is_ingestion_running(library_dir: Optional[str] = None) -> bool:
+    library_dir = library_dir or get_library_dir()
+    lock_path = os.path.join(library_dir, "ingest.lock")
+    if not os.path.exists(lock_path):
+        return False
+    with open(lock_path, "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return False
+
+
+def load_library(embeddings, library_dir: Optional[str] = None, mmap: bool = True):
+    """Open the last checkpointed library index, or return None"""
+    path = os.path.join(library_dir or get_library_dir(), "current")
+    if not os.path.isfile(os.path.join(path, "index.faiss")):
+        return None
+    vectorstore = index_cache.load_faiss_store(path, embeddings, mmap)
+    vector_index.apply_search_params(vectorstore.index)
+    return vectorstore
+
+
+def save_checkpoint(library_dir: str, vectorstore, manifest: Dict):
+    """Atomically replace the library index and manifest with a new version"""
+    current = os.path.join(library_dir, "current")
+    tmp_path = f"{current}.tmp"
+    old_path = f"{current}.old"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    if vectorstore is not None:
+        vectorstore.save_local(tmp_path)
+        utils.get_lexical_index(vectorstore).save(os.path.join(tmp_path, "lexical.pkl"))
+    manifest["index_factory"] = getattr(vectorstore, "index_factory", None)
+    index_file = os.path.join(tmp_path, "index.faiss")
+    manifest["index_bytes"] = (
+        os.path.getsize(index_file) if os.path.isfile(index_file) else 0
+    )
+    manifest["updated"] = time.time()
+    _write_json(os.path.join(tmp_path, "manifest.json"), manifest)
+
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.isdir(current):
+        os.replace(current, old_path)
+    os.replace(tmp_path, current)
+    # Sessions mapping the old files keep them alive until they detach
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def _file_errors(errors: List[str], files: List[LocalFile]) -> Dict[str, str]:
+    by_name = {}
+    for error in errors:
+        for local_file in files:
+            if error.startswith(f"{local_file.name}: "):
+                by_name[local_file.name] = error[len(local_file.name) + 2 :]
+    return by_name
+
+
+def run_ingestion(
+    embeddings,
+    docs_dir: Optional[str] = None,
+    library_dir: Optional[str] = None,
+    batch_files: Optional[int] = None,
+    checkpoint_seconds: Optional[float] = None,
+    progress: Callable[[Dict], None] = None,
+) -> Dict:
+    """Crawl ``docs_dir`` and bring the library index up to date.
+
+    Only new or changed files are parsed and embedded, in batches of
+    ``batch_files``. The index and manifest are checkpointed every
+    ``checkpoint_seconds``, so an interrupted run resumes after the last
+    checkpoint. Progress is written to ``status.json`` for the app.
+    """
+    settings = config.ingest
+    docs_dir = docs_dir or get_docs_dir()
+    library_dir = library_dir or get_library_dir()
+    batch_files = batch_files or settings.get("batch_files", 32)
+    if checkpoint_seconds is None:
+        checkpoint_seconds = settings.get("checkpoint_seconds", 300)
+    os.makedirs(library_dir, exist_ok=True)
+
+    lock_file = open(os.path.join(library_dir, "ingest.lock"), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise RuntimeError(f"Another ingestion is already running in {library_dir}")
+
+    try:
+        return _ingest(
+            embeddings,
+            docs_dir,
+            library_dir,
+            batch_files,
+            checkpoint_seconds,
+            progress,
+        )
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+def _ingest(
+    embeddings, docs_dir, library_dir, batch_files, checkpoint_seconds, progress
+):
+    status_path = os.path.join(library_dir, "status.json")
+    manifest = read_manifest(library_dir) or {"files": {}}
+    manifest["docs_dir"] = os.path.abspath(docs_dir)
+    vectorstore = load_library(embeddings, library_dir, mmap=False)
+    if vectorstore is not None:
+        vectorstore.index_factory = manifest.get("index_factory")
+    entries = manifest["files"]
+
+    files = scan_docs_dir(docs_dir)
+    on_disk = {local_file.name for local_file in files}
+    removed = [name for name in entries if name not in on_disk]
+
+    pending = []
+    touched = False
+    for local_file in files:
+        entry = entries.get(local_file.name)
+        if entry and (entry["size"], entry["mtime"]) == (
+            local_file.size,
+            local_file.mtime,
+        ):
+            continue
+        # Touched but identical files only need their manifest entry refreshed
+        if entry and entry.get("file_hash") == utils.get_file_hash(local_file):
+            entry["mtime"] = local_file.mtime
+            touched = True
+            continue
+        pending.append(local_file)
+
+    status = {
+        "state": "running",
+        "pid": os.getpid(),
+        "started": time.time(),
+        "files_total": len(pending),
+        "files_done": 0,
+        "bytes_total": sum(local_file.size for local_file in pending),
+        "bytes_done": 0,
+        "files_failed": 0,
+        "files_removed": len(removed),
+        "chunks_skipped": 0,
+        "eta_seconds": None,
+    }
+    dedup_report: Dict[str, int] = {}
+
+    def report():
+        status["updated"] = time.time()
+        _write_json(status_path, status)
+        if progress is not None:
+            progress(status)
+
+    report()
+    if removed:
+        vectorstore = utils.update_vector_store(vectorstore, [], embeddings, removed)
+        for name in removed:
+            del entries[name]
+
+    last_checkpoint = time.time()
+    try:
+        for start in range(0, len(pending), batch_files):
+            batch = pending[start : start + batch_files]
+            documents, errors = utils.load_documents_from_files(batch)
+            failed = _file_errors(errors, batch)
+            # Failed files must not keep chunks from an older version
+            stale = [name for name in failed if name in entries]
+            if vectorstore is None and documents:
+                # The library is a FAISS checkpoint whatever [vector_store] says
+                vectorstore = utils.create_vector_store(
+                    documents, embeddings, dedup_report=dedup_report, backend="faiss"
+                )
+                vectorstore.index_factory = vector_index.describe_index_settings(
+                    vectorstore.index.ntotal
+                )
+            elif documents or stale:
+                vectorstore = utils.update_vector_store(
+                    vectorstore, documents, embeddings, stale, dedup_report=dedup_report
+                )
+
+            hashes = {
+                doc.metadata["source"]: doc.metadata.get("file_hash")
+                for doc in documents
+            }
+            for local_file in batch:
+                entries[local_file.name] = {
+                    "size": local_file.size,
+                    "mtime": local_file.mtime,
+                    "file_hash": hashes.get(local_file.name),
+                    "error": failed.get(local_file.name),
+                }
+
+            status["files_done"] += len(batch)
+            status["bytes_done"] += sum(local_file.size for local_file in batch)
+            status["files_failed"] += len(failed)
+            status["chunks_skipped"] = sum(dedup_report.values())
+            elapsed = time.time() - status["started"]
+            if status["bytes_done"]:
+                remaining = status["bytes_total"] - status["bytes_done"]
+                status["eta_seconds"] = elapsed * remaining / status["bytes_done"]
+            report()
+
+            if time.time() - last_checkpoint >= checkpoint_seconds:
+                save_checkpoint(library_dir, vectorstore, manifest)
+                last_checkpoint = time.time()
+
+        if vectorstore is not None:
+            vectorstore = utils.rebuild_for_size(vectorstore, embeddings)
+            manifest["num_chunks"] = vectorstore.index.ntotal
+        else:
+            manifest["num_chunks"] = 0
+        manifest["num_files"] = len(utils.get_indexed_files(vectorstore))
+        if pending or removed or read_manifest(library_dir) is None:
+            save_checkpoint(library_dir, vectorstore, manifest)
+        elif touched:
+            # Only modification times changed; the index files are kept
+            _write_json(os.path.join(library_dir, "current", "manifest.json"), manifest)
+    except BaseException as e:
+        status["state"] = "failed"
+        status["error"] = str(e) or type(e).__name__
+        report()
+        raise
+
+    status["state"] = "done"
+    status["eta_seconds"] = 0
+    report()
+    return status
+
+
+def start_background_ingestion(library_dir: Optional[str] = None) -> subprocess.Popen:
+    """Run the ingestion CLI as a detached process that outlives the app"""
+    library_dir = library_dir or get_library_dir()
+    os.makedirs(library_dir, exist_ok=True)
+    # The child gets its own copy of the log file descriptor
+    with open(os.path.join(library_dir, "ingest.log"), "a") as log_file:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--library-dir", library_dir],
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+            cwd=os.getcwd(),
+        )
+
+
+def _print_progress(status: Dict):
+    eta = status.get("eta_seconds")
+    eta_text = f", ETA {eta / 60:.0f} min" if eta else ""
+    print(
+        f"[{status['state']}] {status['files_done']}/{status['files_total']} files, "
+        f"{status['bytes_done'] / 1e6:.1f}/{status['bytes_total'] / 1e6:.1f} MB, "
+        f"{status['files_failed']} failed{eta_text}",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index a document folder into the persistent library index"
+    )
+    parser.add_argument("--docs-dir", default=None, help="folder to crawl")
+    parser.add_argument("--library-dir", default=None, help="where to keep the index")
+    parser.add_argument("--batch-files", type=int, default=None)
+    parser.add_argument("--checkpoint-seconds", type=float, default=None)
+    parser.add_argument(
+        "--watch",
+        type=float,
+        default=0,
+        metavar="SECONDS",
+        help="keep running and rescan the folder at this interval",
+    )
+    args = parser.parse_args()
+
+    embeddings = utils.get_embeddings()
+    while True:
+        run_ingestion(
+            embeddings,
+            docs_dir=args.docs_dir,
+            library_dir=args.library_dir,
+            batch_files=args.batch_files,
+            checkpoint_seconds=args.checkpoint_seconds,
+            progress=_print_progress,
+        )
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+
+if __name__ == "__main__":
+    main()
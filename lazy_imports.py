@@ -0,0 +1,25 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access.
+
+    Unlike ``importlib.util.LazyLoader`` nothing is put in ``sys.modules``
+    early, so tools that walk loaded modules (like Streamlit's file watcher)
+    do not trigger the import by accident.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+                module = self._module
+        return getattr(module, attr)
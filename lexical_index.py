@@ -0,0 +1,122 @@
+import heapq
+import math
+import pickle
+import re
+from collections import Counter
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+
+# Keeps part numbers, versions and codes such as "ab-1234" or "v2.1" whole
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; compound tokens are also split into their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(re.findall(r"\w+", token))
+    return tokens
+
+
+class BM25Index:
+    """Incrementally updatable inverted index with Okapi BM25 scoring.
+
+    Documents are keyed by their vector store docstore id, so the lexical
+    and dense indexes can be fused and updated together.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_ids: Iterable[str], texts: Iterable[str]):
+        for doc_id, text in zip(doc_ids, texts):
+            if doc_id in self.doc_lengths:
+                self.remove([doc_id])
+            counts = Counter(tokenize(text))
+            for term, count in counts.items():
+                self.postings.setdefault(term, {})[doc_id] = count
+            length = sum(counts.values())
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
+
+    def remove(self, doc_ids: Iterable[str]):
+        drop = {doc_id for doc_id in doc_ids if doc_id in self.doc_lengths}
+        if not drop:
+            return
+        for term in list(self.postings):
+            postings = self.postings[term]
+            for doc_id in drop.intersection(postings):
+                del postings[doc_id]
+            if not postings:
+                del self.postings[term]
+        for doc_id in drop:
+            self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def search(
+        self, query: str, k: int, allowed: Optional[Container[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Return the top-k (doc id, BM25 score) pairs for a query.
+
+        ``allowed``, if given, restricts the result to those doc ids.
+        """
+        num_docs = len(self.doc_lengths)
+        if not num_docs:
+            return []
+        avg_length = self.total_length / num_docs
+
+        matched = [
+            self.postings[term]
+            for term in set(tokenize(query))
+            if term in self.postings
+        ]
+        # Terms found in most chunks carry almost no signal but have the
+        # longest posting lists; skip them unless nothing rarer matched
+        rare = [p for p in matched if len(p) <= self.max_df_ratio * num_docs]
+        scores: Dict[str, float] = {}
+        for postings in rare or matched:
+            df = len(postings)
+            idf = math.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf in postings.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (
+                    1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (
+                    tf + norm
+                )
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @classmethod
+    def from_vector_store(cls, vectorstore) -> "BM25Index":
+        index = cls()
+        doc_ids = list(vectorstore.index_to_docstore_id.values())
+        index.add(
+            doc_ids,
+            [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids],
+        )
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse several ranked id lists; ids ranked high by any list come first"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
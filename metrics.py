@@ -0,0 +1,257 @@
+import bisect
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+
+# Seconds; covers sub-millisecond searches up to slow LLM answers
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+METRICS = {
+    "docuchat_stage_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "docuchat_llm_tokens_total": ("counter", "LLM tokens by model and kind"),
+    "docuchat_llm_retries_total": ("counter", "Retried OpenRouter requests"),
+    "docuchat_llm_hedges_total": ("counter", "Requests also sent to the fallback"),
+    "docuchat_cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "docuchat_dedup_chunks_total": ("counter", "Duplicate chunks skipped at ingest"),
+    "docuchat_embedding_chunks_per_second": (
+        "gauge",
+        "Throughput of the most recent embedding batch",
+    ),
+    "docuchat_rerank_budget_exceeded_total": (
+        "counter",
+        "Re-rankings cut short by the latency budget",
+    ),
+    "docuchat_index_vectors": ("gauge", "Vectors in the most recently built index"),
+    "docuchat_index_bytes": ("gauge", "Size of the most recently built index"),
+}
+
+_settings = config.metrics
+_enabled = bool(_settings.get("enabled", False))
+_trace_path = _settings.get("trace_file", "") if _enabled else ""
+_lock = threading.Lock()
+_values: Dict[str, Dict[Tuple, object]] = {name: {} for name in METRICS}
+_current_span = contextvars.ContextVar("docuchat_span", default=None)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def _key(labels: Dict[str, str]) -> Tuple:
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    """Add a sample to a histogram"""
+    if not _enabled:
+        return
+    with _lock:
+        entry = _values[name].get(_key(labels))
+        if entry is None:
+            entry = _values[name][_key(labels)] = [
+                [0] * (len(DEFAULT_BUCKETS) + 1),
+                0.0,
+            ]
+        entry[0][bisect.bisect_left(DEFAULT_BUCKETS, value)] += 1
+        entry[1] += value
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Increase a counter"""
+    if not _enabled:
+        return
+    with _lock:
+        values = _values[name]
+        key = _key(labels)
+        values[key] = values.get(key, 0) + amount
+
+
+def set_gauge(name: str, value: float, **labels):
+    if not _enabled:
+        return
+    with _lock:
+        _values[name][_key(labels)] = value
+
+
+class _Span:
+    """Times a stage into ``docuchat_stage_seconds`` and the optional trace"""
+
+    __slots__ = ("stage", "start", "parent", "trace_id", "token")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        self.trace_id = self.parent.trace_id if self.parent else uuid.uuid4().hex[:16]
+        self.token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current_span.reset(self.token)
+        observe("docuchat_stage_seconds", elapsed, stage=self.stage)
+        if _trace_path:
+            record = {
+                "trace": self.trace_id,
+                "span": self.stage,
+                "parent": self.parent.stage if self.parent else None,
+                "end": time.time(),
+                "ms": round(elapsed * 1000, 3),
+                "error": exc_type.__name__ if exc_type else None,
+            }
+            with _lock, open(_trace_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage: str):
+    """Context manager timing a stage; a shared no-op when metrics are off"""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+def timed(stage: str):
+    """Decorator form of ``span``; leaves the function untouched when off"""
+
+    def decorate(fn):
+        if not _enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def render() -> str:
+    """Current metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    with _lock:
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(_values[name].items()):
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+                    continue
+                counts, total = value
+                cumulative = 0
+                for bound, count in zip(DEFAULT_BUCKETS + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, {'le': bound})} "
+                        f"{cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("content-type", "text/plain; version=0.0.4")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _write_file_periodically(path: str, interval: float):
+    while True:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(render())
+        os.replace(tmp_path, path)
+        time.sleep(interval)
+
+
+_exporters_started = False
+
+
+def start_exporters():
+    """Serve /metrics and/or write a textfile, as configured; idempotent"""
+    global _exporters_started
+    with _lock:
+        if not _enabled or _exporters_started:
+            return
+        _exporters_started = True
+
+    port = _settings.get("port", 0)
+    if port:
+        server = ThreadingHTTPServer(
+            (_settings.get("host", "127.0.0.1"), port), _MetricsHandler
+        )
+        threading.Thread(
+            target=server.serve_forever, name="metrics-http", daemon=True
+        ).start()
+    path = _settings.get("file", "")
+    if path:
+        threading.Thread(
+            target=_write_file_periodically,
+            args=(path, _settings.get("file_interval_seconds", 15)),
+            name="metrics-file",
+            daemon=True,
+        ).start()
@@ -1,24 +1,263 @@
-from openai import OpenAI
+import asyncio
+import queue
+import random
+import threading
+import time
+
+import httpx
+import openai
+from openai import AsyncOpenAI
 from config import config
 
+import metrics
+
+# 429s, 5xx responses, timeouts and dropped connections are worth retrying
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APIConnectionError,
+)
+
+
+def _chunk_text(chunk) -> str:
+    if chunk.choices and chunk.choices[0].delta.content:
+        return chunk.choices[0].delta.content
+    return ""
 
-def get_openrouter_client():
-    """Initialize OpenRouter client"""
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=config.app.get("openrouter_api_key"),
+
+def _record_usage(model: str, usage):
+    if usage is None:
+        return
+    metrics.inc(
+        "docuchat_llm_tokens_total",
+        usage.prompt_tokens or 0,
+        model=model,
+        kind="prompt",
+    )
+    metrics.inc(
+        "docuchat_llm_tokens_total",
+        usage.completion_tokens or 0,
+        model=model,
+        kind="completion",
     )
 
 
-def chat_with_openrouter(client, model, messages, temperature=0.7, max_tokens=1024):
-    """Send chat request to OpenRouter"""
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
+def _retry_delay(error, attempt: int, settings: dict) -> float:
+    """Exponential backoff with jitter, honouring a Retry-After header"""
+    backoff_max = settings.get("backoff_max", 8.0)
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), backoff_max)
+        except (TypeError, ValueError):
+            pass
+    delay = settings.get("backoff_base", 0.5) * 2**attempt
+    return min(delay, backoff_max) * random.uniform(0.5, 1.0)
+
+
+class AsyncOpenRouterClient:
+    """Pooled async OpenRouter client with retries, timeouts and hedging.
+
+    Requests run on a dedicated event loop thread so the HTTP connection pool
+    survives Streamlit reruns; ``chat`` and ``stream`` are synchronous
+    bridges for the script thread. If the primary model fails, or has not
+    answered (or produced a first token) within ``hedge_after_seconds``, the
+    same request is also sent to the fallback model and whichever succeeds
+    first wins.
+    """
+
+    def __init__(self, settings: dict = None, api_key: str = None):
+        self.settings = config.openrouter if settings is None else settings
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="openrouter-client", daemon=True
+        )
+        self._thread.start()
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.settings.get("max_connections", 20),
+                max_keepalive_connections=self.settings.get("max_keepalive", 10),
+                keepalive_expiry=self.settings.get("keepalive_expiry", 30.0),
+            ),
+            timeout=httpx.Timeout(
+                self.settings.get("request_timeout", 60.0),
+                connect=self.settings.get("connect_timeout", 5.0),
+            ),
         )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
+        self.client = AsyncOpenAI(
+            base_url=self.settings.get("base_url", "https://openrouter.ai/api/v1"),
+            api_key=api_key or config.app.get("openrouter_api_key"),
+            http_client=http_client,
+            # Retries are handled here so they can back off and hedge
+            max_retries=0,
+        )
+
+    async def _with_retries(self, request):
+        max_retries = self.settings.get("max_retries", 3)
+        for attempt in range(max_retries + 1):
+            try:
+                return await request()
+            except RETRYABLE_ERRORS as e:
+                if attempt == max_retries:
+                    raise
+                metrics.inc("docuchat_llm_retries_total", error=type(e).__name__)
+                await asyncio.sleep(_retry_delay(e, attempt, self.settings))
+
+    async def _complete(self, model, messages, temperature, max_tokens) -> str:
+        async def request():
+            response = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=self.settings.get("request_timeout", 60.0),
+            )
+            _record_usage(model, response.usage)
+            return response.choices[0].message.content
+
+        return await self._with_retries(request)
+
+    async def _open_stream(self, model, messages, temperature, max_tokens):
+        """Open a stream and wait for its first token, retrying until then"""
+
+        async def request():
+            stream = await self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=self.settings.get("request_timeout", 60.0),
+            )
+            iterator = stream.__aiter__()
+            try:
+                async for chunk in iterator:
+                    token = _chunk_text(chunk)
+                    if token:
+                        return token, iterator, stream
+            except BaseException:
+                await stream.close()
+                raise
+            return "", iterator, stream
+
+        return await self._with_retries(request)
+
+    async def _hedged(self, start, model, fallback_model, discard=None):
+        """Run ``start(model)``, racing ``start(fallback_model)`` if it is slow.
+
+        A primary that fails before ``hedge_after_seconds`` goes straight to
+        the fallback.
+        """
+        hedge_after = self.settings.get("hedge_after_seconds", 0)
+        if not fallback_model or fallback_model == model or not hedge_after:
+            return await start(model)
+
+        primary = asyncio.ensure_future(start(model))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+
+        metrics.inc("docuchat_llm_hedges_total", model=model)
+        fallback = asyncio.ensure_future(start(fallback_model))
+        pending = {fallback} if done else {primary, fallback}
+        error = primary.exception() if done else None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            winners = [task for task in done if task.exception() is None]
+            if winners:
+                for task in pending:
+                    task.cancel()
+                for task in winners[1:]:
+                    if discard is not None:
+                        await discard(task.result())
+                return winners[0].result()
+            error = next(iter(done)).exception()
+        raise error
+
+    def chat(
+        self, model, messages, temperature=0.7, max_tokens=1024, fallback_model=None
+    ) -> str:
+        """Blocking chat request; errors are returned as ``"Error: ..."``"""
+
+        async def run():
+            return await self._hedged(
+                lambda m: self._complete(m, messages, temperature, max_tokens),
+                model,
+                fallback_model,
+            )
+
+        try:
+            with metrics.span("llm"):
+                return asyncio.run_coroutine_threadsafe(run(), self._loop).result()
+        except Exception as e:
+            return f"Error: {str(e)}"
+
+    def stream(
+        self, model, messages, temperature=0.7, max_tokens=1024, fallback_model=None
+    ):
+        """Yield content tokens; errors are raised so partial output can be kept"""
+        tokens = queue.Queue()
+
+        async def discard(opened):
+            await opened[2].close()
+
+        async def produce():
+            try:
+                first_token, iterator, stream = await self._hedged(
+                    lambda m: self._open_stream(m, messages, temperature, max_tokens),
+                    model,
+                    fallback_model,
+                    discard,
+                )
+                try:
+                    if first_token:
+                        tokens.put(("token", first_token))
+                    async for chunk in iterator:
+                        token = _chunk_text(chunk)
+                        if token:
+                            tokens.put(("token", token))
+                        # OpenRouter reports usage on the final chunk
+                        _record_usage(
+                            chunk.model or model, getattr(chunk, "usage", None)
+                        )
+                finally:
+                    await stream.close()
+                tokens.put(("done", None))
+            except Exception as e:
+                tokens.put(("error", e))
+
+        # Timed by hand: a span would stay open across the caller's yields
+        start, first = time.perf_counter(), True
+        future = asyncio.run_coroutine_threadsafe(produce(), self._loop)
+        try:
+            while True:
+                kind, value = tokens.get()
+                if kind == "token":
+                    if first:
+                        first = False
+                        metrics.observe(
+                            "docuchat_stage_seconds",
+                            time.perf_counter() - start,
+                            stage="llm_first_token",
+                        )
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    metrics.observe(
+                        "docuchat_stage_seconds",
+                        time.perf_counter() - start,
+                        stage="llm_stream",
+                    )
+                    return
+        finally:
+            # Stops the request if the consumer gives up early
+            future.cancel()
+
+
+def get_async_openrouter_client():
+    """Initialize the pooled async OpenRouter client"""
+    return AsyncOpenRouterClient()
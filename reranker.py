@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from langchain_core.documents import Document
+
+import metrics
+from config import config
+from index_cache import hash_text
+
+
+class CrossEncoderReranker:
+    """Re-scores retrieved chunks with a local cross-encoder within a time budget.
+
+    Candidates are scored in retrieval order, in batches sized from the
+    measured cost per pair, until ``budget_ms`` is spent. Scored chunks are
+    ranked by score ahead of unscored ones, which keep their retrieval
+    order. Scores are memoized per (query, chunk) in a bounded LRU, so a
+    rerun or a slider change does not score the same pairs again.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        device: str = "cpu",
+        batch_size: int = 16,
+        max_length: int = 256,
+        budget_ms: float = 300,
+        cache_size: int = 4096,
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()
+        self.seconds_per_pair: Optional[float] = None
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(
+                    self.model_name, device=self.device, max_length=self.max_length
+                )
+        return self._model
+
+    def _score(self, query: str, docs: List[Document], indexes: List[int]):
+        model = self._get_model()
+        start = time.perf_counter()
+        scores = model.predict(
+            [(query, docs[i].page_content) for i in indexes],
+            batch_size=len(indexes),
+            show_progress_bar=False,
+        )
+        per_pair = (time.perf_counter() - start) / len(indexes)
+        if self.seconds_per_pair is None:
+            self.seconds_per_pair = per_pair
+        else:
+            self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * per_pair
+        return [float(score) for score in scores]
+
+    def rerank(
+        self,
+        query: str,
+        docs: List[Document],
+        top_k: int,
+        budget_ms: Optional[float] = None,
+    ) -> List[Document]:
+        """Return the ``top_k`` best of ``docs`` for ``query``"""
+        if not docs:
+            return []
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        keys = [(query, hash_text(doc.page_content)) for doc in docs]
+        scores: Dict[int, float] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                score = self._scores.get(key)
+                if score is not None:
+                    self._scores.move_to_end(key)
+                    scores[i] = score
+        metrics.inc(
+            "docuchat_cache_requests_total", len(scores), cache="rerank", result="hit"
+        )
+        metrics.inc(
+            "docuchat_cache_requests_total",
+            len(docs) - len(scores),
+            cache="rerank",
+            result="miss",
+        )
+
+        pending = [i for i in range(len(docs)) if i not in scores]
+        # Loading the model is a one-off and not charged to the budget
+        if pending:
+            self._get_model()
+        start = time.perf_counter()
+        while pending:
+            remaining = budget - (time.perf_counter() - start)
+            size = self.batch_size
+            if self.seconds_per_pair:
+                size = min(size, int(remaining / self.seconds_per_pair))
+            if remaining <= 0 or size <= 0:
+                metrics.inc("docuchat_rerank_budget_exceeded_total")
+                break
+            batch, pending = pending[:size], pending[size:]
+            batch_scores = self._score(query, docs, batch)
+            scores.update(zip(batch, batch_scores))
+            with self._lock:
+                for i, score in zip(batch, batch_scores):
+                    self._scores[keys[i]] = score
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        ranked += [i for i in range(len(docs)) if i not in scores]
+        return [docs[i] for i in ranked[:top_k]]
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """Return the process-wide reranker; its model loads on first use"""
+    global _reranker
+    settings = config.rerank
+    with _reranker_lock:
+        if _reranker is None:
+            _reranker = CrossEncoderReranker(
+                model_name=settings.get(
+                    "model_name", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+                ),
+                device=settings.get("device", "cpu"),
+                batch_size=settings.get("batch_size", 16),
+                max_length=settings.get("max_length", 256),
+                budget_ms=settings.get("budget_ms", 300),
+                cache_size=settings.get("cache_size", 4096),
+            )
+    return _reranker
@@ -0,0 +1,67 @@
+import numpy as np
+
+import answer_cache
+from answer_cache import AnswerCache
+
+
+def _embedder(vectors):
+    calls = []
+
+    def embed(question):
+        calls.append(question)
+        return vectors[question]
+
+    return embed, calls
+
+
+def _store(cache, scope, question, vector, answer):
+    vector = np.asarray(vector, dtype=np.float32)
+    cache.store(scope, question, vector / np.linalg.norm(vector), answer, ["a.txt"])
+
+
+def test_repeated_question_is_answered_without_embedding():
+    cache = AnswerCache()
+    _store(cache, ("corpus", "model"), "What is the warranty?", [1, 0], "Two years.")
+    embed, calls = _embedder({})
+
+    entry, vector = cache.lookup(("corpus", "model"), "  what is the WARRANTY ", embed)
+
+    assert entry["answer"] == "Two years."
+    assert entry["sources"] == ["a.txt"]
+    assert vector is None and calls == []
+    assert (cache.hits, cache.semantic_hits, cache.misses) == (1, 0, 0)
+
+
+def test_similar_questions_match_only_within_their_scope():
+    cache = AnswerCache(similarity_threshold=0.9)
+    _store(cache, ("corpus", "model"), "How long is the warranty?", [1, 0.1], "Two")
+    embed, _ = _embedder({"Warranty length?": [1, 0.05], "Who makes the pump?": [0, 1]})
+
+    entry, _ = cache.lookup(("corpus", "model"), "Warranty length?", embed)
+    assert entry["answer"] == "Two"
+
+    entry, vector = cache.lookup(("corpus", "other"), "Warranty length?", embed)
+    assert entry is None
+    assert np.isclose(np.linalg.norm(vector), 1)
+    entry, _ = cache.lookup(("corpus", "model"), "Who makes the pump?", embed)
+    assert entry is None
+    assert (cache.hits, cache.semantic_hits, cache.misses) == (1, 1, 2)
+    assert cache.hit_rate == 1 / 3
+
+
+def test_entries_expire_and_the_least_recently_used_is_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = AnswerCache(max_entries=2, ttl_seconds=60)
+    embed, _ = _embedder({"q1": [1, 0], "q2": [0, 1], "q3": [1, 1]})
+    for question in ["q1", "q2"]:
+        _store(cache, (), question, embed(question), question.upper())
+
+    # q1 is used again, so adding q3 evicts q2
+    assert cache.lookup((), "q1", embed)[0]["answer"] == "Q1"
+    _store(cache, (), "q3", [1, 1], "Q3")
+    assert len(cache) == 2
+    assert cache.lookup((), "q2", embed)[0] is None
+
+    now[0] += 61
+    assert cache.lookup((), "q1", embed)[0] is None
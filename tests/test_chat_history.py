@@ -0,0 +1,99 @@
+from chat_history import compact_history
+
+SETTINGS = {"enabled": True, "max_history_tokens": 40, "keep_recent_tokens": 20}
+
+
+def _history(turns):
+    # 36 characters: 9 tokens of content plus 4 of framing each
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message number {i:02d} of the chat log.",
+            "sources": [],
+        }
+        for i in range(turns)
+    ]
+
+
+def _summarizer(summaries):
+    prompts = []
+
+    def summarize(prompt):
+        prompts.append(prompt)
+        return summaries.pop(0)
+
+    return summarize, prompts
+
+
+def test_short_history_is_sent_verbatim():
+    history = _history(3)
+    summarize, prompts = _summarizer([])
+
+    messages, saved = compact_history(history, {}, summarize, SETTINGS)
+
+    assert messages == [{"role": m["role"], "content": m["content"]} for m in history]
+    assert saved == 0 and prompts == []
+
+
+def test_older_turns_are_folded_into_a_running_summary():
+    history = _history(4)
+    state = {}
+    summarize, prompts = _summarizer(["First summary.", "Second summary."])
+
+    messages, saved = compact_history(history, state, summarize, SETTINGS)
+
+    assert len(prompts) == 1
+    assert "Message number 00" in prompts[0] and "Message number 03" not in prompts[0]
+    assert messages[0] == {
+        "role": "system",
+        "content": "Summary of the earlier conversation:\nFirst summary.",
+    }
+    assert [m["content"] for m in messages[1:]] == [history[3]["content"]]
+    assert saved > 0
+
+    # Turns within the budget do not trigger another summary
+    history += _history(5)[4:]
+    messages, _ = compact_history(history, state, summarize, SETTINGS)
+    assert len(prompts) == 1
+    assert [m["content"] for m in messages[1:]] == [m["content"] for m in history[3:]]
+
+    # The next overflow extends the summary from where it stopped
+    history += _history(7)[5:]
+    messages, _ = compact_history(history, state, summarize, SETTINGS)
+    assert len(prompts) == 2
+    assert "First summary." in prompts[1]
+    assert "Message number 00" not in prompts[1]
+    assert messages[0]["content"].endswith("Second summary.")
+
+
+def test_failed_summary_drops_the_oldest_turns():
+    history = _history(6)
+    state = {}
+    summarize, _ = _summarizer(["Error: rate limited"])
+
+    messages, _ = compact_history(history, state, summarize, SETTINGS)
+
+    assert state == {}
+    assert [m["content"] for m in messages] == [m["content"] for m in history[3:]]
+
+
+def test_rewritten_history_starts_over():
+    history = _history(4)
+    state = {}
+    summarize, prompts = _summarizer(["Summary.", "New summary."])
+    compact_history(history, state, summarize, SETTINGS)
+
+    history[0] = {**history[0], "content": "A different first question here."}
+    messages, _ = compact_history(history, state, summarize, SETTINGS)
+
+    assert len(prompts) == 2
+    assert "A different first question" in prompts[1]
+    assert messages[0]["content"].endswith("New summary.")
+
+
+def test_disabled_history_is_sent_in_full():
+    history = _history(8)
+
+    messages, saved = compact_history(history, {}, None, {"enabled": False})
+
+    assert len(messages) == 8 and saved == 0
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import utils
+from vector_backends import MetadataFilter, get_vector_backend
+
+pytest.importorskip("chromadb")
+
+
+@pytest.fixture
+def backend(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    backend = get_vector_backend(
+        embeddings, "chroma", str(tmp_path / "chroma"), "tests"
+    )
+    texts = [f"Chunk {i} of the report." for i in range(30)]
+    metadatas = [
+        {
+            "source": "a.pdf" if i < 20 else "b.txt",
+            "file_hash": "ha" if i < 20 else "hb",
+            "file_type": "pdf" if i < 20 else "txt",
+            "added_at": 100 if i < 20 else 200,
+        }
+        for i in range(len(texts))
+    ]
+    backend.upsert(
+        [f"id{i}" for i in range(len(texts))],
+        texts,
+        embeddings.embed_documents(texts),
+        metadatas,
+    )
+    return backend
+
+
+def test_search_is_filtered_inside_the_collection(backend):
+    query = np.zeros(16)
+    assert backend.count() == 30
+    assert backend.get_sources() == {"a.pdf": "ha", "b.txt": "hb"}
+
+    found = backend.search(query, 5, ["b.txt"])
+    assert len(found) == 5
+    assert {doc.metadata["source"] for doc in found} == {"b.txt"}
+
+    found = backend.search(query, 30, where=MetadataFilter(file_types=["pdf"]))
+    assert {doc.metadata["source"] for doc in found} == {"a.pdf"}
+    assert backend.search(query, 5, where=MetadataFilter(since=300)) == []
+
+
+def test_delete_sources_and_get_vectors(backend):
+    vectors = backend.get_vectors(["id0", "id25", "missing"])
+    assert set(vectors) == {"id0", "id25"}
+    assert vectors["id0"].shape == (16,)
+
+    backend.delete_sources(["a.pdf"])
+
+    assert backend.count() == 10
+    assert backend.get_sources() == {"b.txt": "hb"}
+    assert backend.disk_bytes() > 0
+
+
+def test_hybrid_search_falls_back_to_vectors(backend):
+    with pytest.raises(NotImplementedError):
+        backend.lexical_search("report", 5)
+
+    backend.session_sources = {"b.txt": "hb"}
+    with pytest.warns(UserWarning, match="no keyword index"):
+        found = utils.hybrid_search(backend, "Chunk 25 of the report.", 3)
+
+    assert len(found) == 3
+    assert all(doc.metadata["source"] == "b.txt" for doc in found)
@@ -0,0 +1,69 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from context_packing import get_token_budget, merge_overlapping, pack_context
+
+SETTINGS = {"mmr_lambda": 1.0, "duplicate_threshold": 0.95}
+
+
+def _doc(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_token_budget_leaves_room_for_the_answer_and_prompt():
+    settings = {
+        "model_context_tokens": {"small-model": 2048},
+        "default_context_tokens": 8192,
+        "reserved_tokens": 256,
+        "max_context_tokens": 3000,
+    }
+
+    assert get_token_budget("small-model", 1024, "x" * 400, settings) == 668
+    assert get_token_budget("other-model", 1024, "", settings) == 3000
+    assert get_token_budget("small-model", 4096, "", settings) == 0
+
+
+def test_overlapping_chunks_merge_either_way_round():
+    first = "The pump must be primed before use. Fill the housing with water."
+    second = "Fill the housing with water. Then close the valve slowly."
+    merged = (
+        "The pump must be primed before use. Fill the housing with water. "
+        "Then close the valve slowly."
+    )
+
+    assert merge_overlapping(first, second) == merged
+    assert merge_overlapping(second, first) == merged
+    assert merge_overlapping(first, first[5:30]) == first
+    assert merge_overlapping(first, "Unrelated text about invoices.") is None
+
+
+def test_packing_drops_duplicates_merges_overlaps_and_keeps_the_budget():
+    docs = [
+        _doc("Reset the unit by holding the power button for ten seconds."),
+        _doc("Reset the unit by holding the power button for ten seconds!"),
+        _doc("power button for ten seconds. The status light blinks twice."),
+        _doc("Warranty claims need the original receipt.", "b.txt"),
+        _doc("Unrelated appendix text " * 20, "c.txt"),
+    ]
+    vectors = np.array(
+        [[1, 0, 0], [1, 0.01, 0], [0.9, 0.3, 0], [0.7, 0, 0.7], [0.5, 0.5, 0.5]]
+    )
+
+    packed = pack_context([1, 0, 0], docs, vectors, 50, 5, SETTINGS)
+
+    assert [doc.page_content for doc in packed] == [
+        "Reset the unit by holding the power button for ten seconds. "
+        "The status light blinks twice.",
+        "Warranty claims need the original receipt.",
+    ]
+    assert sum(len(doc.page_content) for doc in packed) / 4 <= 50
+
+
+def test_packing_respects_max_chunks():
+    docs = [_doc(f"Chunk {i} text.", f"{i}.txt") for i in range(4)]
+    vectors = np.eye(4)
+
+    packed = pack_context([1, 1, 1, 1], docs, vectors, 1000, 2, SETTINGS)
+
+    assert len(packed) == 2
+    assert pack_context([1, 0], [], [], 1000, 2, SETTINGS) == []
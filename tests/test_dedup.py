@@ -0,0 +1,89 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import utils
+from config import config
+from dedup import DedupIndex, deduplicate
+
+
+@pytest.fixture(autouse=True)
+def no_index_cache(monkeypatch):
+    monkeypatch.setitem(config.cache, "enabled", False)
+    monkeypatch.setitem(config.index, "type", "flat")
+
+
+def _doc(text, source):
+    return Document(page_content=text, metadata={"source": source, "file_hash": source})
+
+
+def test_exact_key_keeps_digits_and_punctuation():
+    chunks = [
+        _doc("Freezer setpoint: -5 C", "a.txt"),
+        _doc("Freezer setpoint: 5 C", "b.txt"),
+        _doc("freezer   SETPOINT: -5 c", "c.txt"),
+    ]
+    report = {}
+    ids, kept = deduplicate(chunks, DedupIndex(), report=report)
+
+    assert [doc.page_content for doc in kept] == [
+        "Freezer setpoint: -5 C",
+        "Freezer setpoint: 5 C",
+    ]
+    assert report == {"exact": 1, "near": 0}
+    assert kept[0].metadata["sources"] == ["a.txt", "c.txt"]
+    assert len(set(ids)) == 2
+
+
+def test_near_duplicates_never_merge_rows_of_one_file():
+    rows = [
+        f"Part number PN-{1000 + i} stainless hex bolt M8 x 40 mm, zinc plated, "
+        "box of 100, lead time two weeks"
+        for i in range(10)
+    ]
+    index = DedupIndex(near_duplicates=True, threshold=0.5)
+    _, kept = deduplicate([_doc(row, "catalog.csv") for row in rows], index)
+
+    assert [doc.page_content for doc in kept] == rows
+
+
+def test_duplicate_of_an_indexed_chunk_is_skipped_on_update():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    shared = "Shared disclaimer paragraph that appears in both files."
+    store = utils.create_vector_store(
+        [_doc(shared, "a.txt"), _doc("Only in the first file.", "a.txt")], embeddings
+    )
+
+    report = {}
+    store = utils.update_vector_store(
+        store,
+        [_doc(shared, "b.txt"), _doc("Only in the second file.", "b.txt")],
+        embeddings,
+        dedup_report=report,
+    )
+
+    assert report["exact"] == 1
+    assert store.index.ntotal == 3
+    [stored] = [
+        doc for doc in store.docstore._dict.values() if doc.page_content == shared
+    ]
+    assert stored.metadata["sources"] == ["a.txt", "b.txt"]
+
+    # Removing the first file hands the shared chunk over to the second
+    store = utils.update_vector_store(store, [], embeddings, ["a.txt"])
+    assert sorted(utils.get_indexed_files(store)) == ["b.txt"]
+    assert store.index.ntotal == 2
+
+
+def test_store_loaded_without_dedup_state_rebuilds_it():
+    embeddings = DeterministicFakeEmbedding(size=16)
+    store = utils.create_vector_store(
+        [_doc("First upload chunk.", "a.txt")], embeddings
+    )
+    del store.dedup_index
+
+    store = utils.update_vector_store(
+        store, [_doc("first upload   chunk.", "b.txt")], embeddings
+    )
+
+    assert store.index.ntotal == 1
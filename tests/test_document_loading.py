@@ -0,0 +1,56 @@
+import pytest
+
+import utils
+import worker_pools
+from config import config
+from ingest import LocalFile
+
+
+@pytest.fixture
+def text_files(tmp_path):
+    files = []
+    for i in range(4):
+        path = tmp_path / f"notes{i}.txt"
+        path.write_text(f"Notes number {i}.")
+        files.append(LocalFile(str(path), path.name))
+    return files
+
+
+def test_without_timeout_small_batches_are_parsed_in_process(monkeypatch, text_files):
+    monkeypatch.setattr(utils, "acquire_pool", None)
+    documents, errors = utils.load_documents_from_files(
+        text_files, max_workers=2, timeout=0
+    )
+    assert errors == []
+    assert [doc.metadata["source"] for doc in documents] == [f.name for f in text_files]
+
+
+def test_pool_is_kept_across_loads_until_a_parse_gets_stuck(monkeypatch, text_files):
+    monkeypatch.setitem(config.loading, "min_pool_files", 0)
+    for _ in range(2):
+        documents, errors = utils.load_documents_from_files(text_files, max_workers=2)
+        assert errors == []
+        assert [doc.page_content for doc in documents] == [
+            f"Notes number {i}." for i in range(len(text_files))
+        ]
+    pool = worker_pools.current_pool("loading")
+    assert worker_pools._pool_users[pool] == 0
+
+    worker_pools.release_pool(worker_pools.acquire_pool("loading", 2), stuck=True)
+    assert pool not in worker_pools._pool_users
+    replacement = worker_pools.acquire_pool("loading", 2)
+    assert replacement is not pool
+    worker_pools.release_pool(replacement)
+
+
+def test_timeout_applies_to_a_single_small_file(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("a,b\n" + "1,2\n" * 200_000)
+
+    documents, errors = utils.load_documents_from_files(
+        [LocalFile(str(path), path.name)], max_workers=2, timeout=0.001
+    )
+
+    assert documents == []
+    assert errors == ["table.csv: timed out after 0.001s"]
+    assert worker_pools.current_pool("loading") is None
@@ -0,0 +1,34 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import index_cache
+import utils
+from config import config
+
+
+def _documents(start, count, source):
+    return [
+        Document(page_content=f"Chunk {i} of {source}.", metadata={"source": source})
+        for i in range(start, start + count)
+    ]
+
+
+def test_incremental_updates_stay_within_the_disk_budget(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.cache, "enabled", True)
+    monkeypatch.setitem(config.cache, "dir", str(tmp_path / "cache"))
+    monkeypatch.setitem(config.cache, "max_disk_mb", 0.5)
+    monkeypatch.setitem(config.index, "type", "flat")
+    monkeypatch.setattr(index_cache, "_index_cache", None)
+    cache = index_cache.get_index_cache()
+    embeddings = DeterministicFakeEmbedding(size=256)
+
+    store = utils.create_vector_store(_documents(0, 10, "first.txt"), embeddings)
+    for batch in range(8):
+        store = utils.update_vector_store(
+            store, _documents(batch * 200, 200, f"file{batch}.txt"), embeddings
+        )
+
+    # 1,600 vectors of 1 KB would take three times the budget
+    assert store.index.ntotal == 1610
+    assert cache.disk_usage() <= cache.max_bytes
+    assert cache.embeddings.evict_bytes(0) > 0
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from index_registry import IndexRegistry
+
+
+def test_slow_load_does_not_block_other_keys():
+    registry = IndexRegistry()
+    loading, finish = threading.Event(), threading.Event()
+    loads = []
+    leases = []
+
+    def slow_load():
+        loads.append("slow")
+        loading.set()
+        assert finish.wait(5)
+        return "slow store"
+
+    threads = [
+        threading.Thread(target=lambda: leases.append(registry.acquire("a", slow_load)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    assert loading.wait(5)
+
+    # Another key is acquired and released while "a" is still loading
+    other = registry.acquire("b", lambda: "other store")
+    assert other.vectorstore == "other store"
+    other.release()
+    assert "b" not in registry.stats()
+
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+    assert loads == ["slow"]
+    assert [lease.vectorstore for lease in leases] == ["slow store"] * 2
+    assert registry.stats() == {"a": 2}
+    for lease in leases:
+        lease.release()
+    assert registry.stats() == {}
+
+
+def test_failed_load_is_retried():
+    registry = IndexRegistry()
+
+    def broken():
+        raise OSError("index file missing")
+
+    with pytest.raises(OSError):
+        registry.acquire("a", broken)
+    assert "a" not in registry.stats()
+    assert registry.acquire("a", lambda: "store").vectorstore == "store"
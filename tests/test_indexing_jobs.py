@@ -0,0 +1,35 @@
+import functools
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import utils
+from config import config
+from index_registry import IndexRegistry
+from indexing_jobs import IndexingJob
+from ingest import LocalFile
+from vector_backends import FaissBackend, VectorBackend
+
+
+def test_first_upload_to_a_persistent_backend_is_not_shared(monkeypatch, tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=16)
+    monkeypatch.setitem(config.cache, "enabled", False)
+    monkeypatch.setitem(config.vector_store, "backend", "chroma")
+    monkeypatch.setattr(
+        utils,
+        "get_vector_backend",
+        lambda embeddings, backend: FaissBackend(str(tmp_path / "store"), embeddings),
+    )
+    path = tmp_path / "notes.txt"
+    path.write_text("The first upload starts a persistent collection.")
+
+    # The app decides to share before the first store exists
+    share = functools.partial(
+        utils.share_vector_store, embeddings=embeddings, registry=IndexRegistry()
+    )
+    job = IndexingJob(None, [LocalFile(str(path), "notes.txt")], embeddings, (), share)
+    job.run()
+
+    assert job.error is None
+    assert isinstance(job.vectorstore, VectorBackend)
+    assert job.lease is None
+    assert job.vectorstore.count() == 1
@@ -0,0 +1,60 @@
+import os
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import ingest
+from config import config
+
+
+def test_library_is_faiss_whatever_the_session_backend(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.cache, "enabled", False)
+    monkeypatch.setitem(config.vector_store, "backend", "chroma")
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    for i in range(3):
+        (docs_dir / f"manual{i}.txt").write_text(f"Manual {i}: reset the unit.")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    library_dir = str(tmp_path / "library")
+
+    status = ingest.run_ingestion(embeddings, str(docs_dir), library_dir)
+
+    assert status["state"] == "done"
+    assert ingest.read_manifest(library_dir)["num_chunks"] == 3
+    library = ingest.load_library(embeddings, library_dir)
+    assert library.index.ntotal == 3
+
+    # A removed file is dropped on the next run
+    (docs_dir / "manual0.txt").unlink()
+    ingest.run_ingestion(embeddings, str(docs_dir), library_dir)
+    assert ingest.read_manifest(library_dir)["num_files"] == 2
+
+
+def test_touched_files_update_only_the_manifest(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.cache, "enabled", False)
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir()
+    path = docs_dir / "manual.txt"
+    path.write_text("Manual: reset the unit.")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    library_dir = str(tmp_path / "library")
+    ingest.run_ingestion(embeddings, str(docs_dir), library_dir)
+    updated = ingest.read_manifest(library_dir)["updated"]
+
+    os.utime(path, (1_000_000_000, 1_000_000_000))
+    status = ingest.run_ingestion(embeddings, str(docs_dir), library_dir)
+
+    assert status["files_total"] == 0
+    manifest = ingest.read_manifest(library_dir)
+    assert manifest["files"]["manual.txt"]["mtime"] == 1_000_000_000
+    assert manifest["updated"] == updated
+
+
+def test_background_ingestion_closes_the_parent_log_file(monkeypatch, tmp_path):
+    opened = []
+    monkeypatch.setattr(
+        ingest.subprocess, "Popen", lambda *args, **kwargs: opened.append(kwargs)
+    )
+
+    ingest.start_background_ingestion(str(tmp_path / "library"))
+
+    assert opened[0]["stdout"].closed
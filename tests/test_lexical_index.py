@@ -0,0 +1,77 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+TEXTS = {
+    "d1": "Error XJ-4471 means the pump is dry.",
+    "d2": "Prime the pump before the first start.",
+    "d3": "The manual covers the pump and the valve.",
+    "d4": "Firmware v2.1 fixes the display flicker.",
+}
+
+
+def _index():
+    index = BM25Index()
+    index.add(TEXTS, TEXTS.values())
+    return index
+
+
+def test_compound_tokens_are_kept_whole_and_split():
+    assert tokenize("Error XJ-4471 in v2.1") == [
+        "error",
+        "xj-4471",
+        "xj",
+        "4471",
+        "in",
+        "v2.1",
+        "v2",
+        "1",
+    ]
+
+
+def test_exact_codes_rank_first():
+    index = _index()
+
+    assert index.search("xj-4471", 2)[0][0] == "d1"
+    assert index.search("firmware V2.1", 5)[0][0] == "d4"
+    assert index.search("unknown words", 5) == []
+
+
+def test_common_terms_only_count_when_nothing_rarer_matches():
+    index = _index()
+
+    # "pump" is in three of four chunks; "valve" decides the ranking
+    assert [doc_id for doc_id, _ in index.search("pump valve", 5)] == ["d3"]
+    assert {doc_id for doc_id, _ in index.search("pump", 5)} == {"d1", "d2", "d3"}
+
+
+def test_allowed_ids_restrict_results():
+    index = _index()
+
+    found = index.search("pump", 5, allowed={"d2", "d4"})
+
+    assert [doc_id for doc_id, _ in found] == ["d2"]
+
+
+def test_updates_and_removals_match_a_fresh_index(tmp_path):
+    index = _index()
+    index.add(["d2"], ["Drain the tank before storage."])
+    index.remove(["d3", "missing"])
+
+    fresh = BM25Index()
+    fresh.add(["d1", "d4", "d2"], [TEXTS["d1"], TEXTS["d4"], "Drain the tank."])
+    fresh.remove(["d2"])
+    fresh.add(["d2"], ["Drain the tank before storage."])
+    assert index.postings == fresh.postings
+    assert index.total_length == fresh.total_length
+
+    index.save(tmp_path / "lexical.pkl")
+    loaded = BM25Index.load(tmp_path / "lexical.pkl")
+    assert loaded.search("tank", 1) == index.search("tank", 1)
+    assert loaded.search("valve", 1) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "e"]], k=60)
+
+    assert fused[0] == "b"
+    assert set(fused[1:3]) == {"a", "d"}
+    assert set(fused[3:]) == {"c", "e"}
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch, tmp_path):
+    trace_path = tmp_path / "trace.jsonl"
+    monkeypatch.setattr(metrics, "_enabled", True)
+    monkeypatch.setattr(metrics, "_trace_path", str(trace_path))
+    monkeypatch.setattr(metrics, "_values", {name: {} for name in metrics.METRICS})
+    return trace_path
+
+
+def test_render_uses_the_prometheus_text_format(enabled):
+    metrics.inc("docuchat_llm_retries_total", error="RateLimitError")
+    metrics.inc("docuchat_llm_retries_total", 2, error="RateLimitError")
+    metrics.set_gauge("docuchat_index_vectors", 1200)
+    metrics.observe("docuchat_stage_seconds", 0.003, stage="search")
+    metrics.observe("docuchat_stage_seconds", 0.2, stage="search")
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE docuchat_llm_retries_total counter" in lines
+    assert 'docuchat_llm_retries_total{error="RateLimitError"} 3' in lines
+    assert "docuchat_index_vectors 1200" in lines
+    assert 'docuchat_stage_seconds_bucket{stage="search",le="0.0025"} 0' in lines
+    assert 'docuchat_stage_seconds_bucket{stage="search",le="0.005"} 1' in lines
+    assert 'docuchat_stage_seconds_bucket{stage="search",le="+Inf"} 2' in lines
+    assert 'docuchat_stage_seconds_count{stage="search"} 2' in lines
+
+
+def test_nested_spans_share_a_trace(enabled):
+    @metrics.timed("retrieve")
+    def retrieve():
+        with metrics.span("search"):
+            pass
+
+    retrieve()
+    with pytest.raises(ValueError):
+        with metrics.span("llm"):
+            raise ValueError("bad")
+
+    search, outer, llm = [json.loads(line) for line in enabled.read_text().splitlines()]
+    assert (search["span"], search["parent"]) == ("search", "retrieve")
+    assert (outer["span"], outer["parent"]) == ("retrieve", None)
+    assert search["trace"] == outer["trace"] != llm["trace"]
+    assert llm["error"] == "ValueError"
+    assert 'docuchat_stage_seconds_count{stage="retrieve"} 1' in metrics.render()
+
+
+def test_disabled_metrics_cost_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", False)
+    monkeypatch.setattr(metrics, "_values", {name: {} for name in metrics.METRICS})
+
+    def fn():
+        return 1
+
+    assert metrics.timed("stage")(fn) is fn
+    assert metrics.span("a") is metrics.span("b")
+    metrics.inc("docuchat_llm_retries_total")
+    assert all(not values for values in metrics._values.values())
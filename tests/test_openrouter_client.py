@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from benchmark import _StubHandler
+from openrouter_client import AsyncOpenRouterClient
+
+ANSWER = "tok " * 3
+
+
+class _ScriptedHandler(_StubHandler):
+    """Stub answering each model with its scripted responses, then "ok".
+
+    A response is an HTTP error status, "slow" (answer after a second) or
+    "ok".
+    """
+
+    tokens = 3
+    script = {}
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        self.requests.append(body["model"])
+        responses = self.script.get(body["model"])
+        response = responses.pop(0) if responses else "ok"
+        try:
+            if response == "slow":
+                time.sleep(1)
+            elif response != "ok":
+                data = json.dumps({"error": {"message": "stub error"}}).encode()
+                self.send_response(response)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                self.send_header("retry-after", "0.01")
+                self.end_headers()
+                self.wfile.write(data)
+                return
+            self._answer(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow answer
+            pass
+
+
+@pytest.fixture
+def stub():
+    handler = type(
+        "ScriptedHandler", (_ScriptedHandler,), {"script": {}, "requests": []}
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield handler, f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(base_url, **settings):
+    return AsyncOpenRouterClient(
+        {
+            "base_url": base_url,
+            "max_retries": 3,
+            "backoff_base": 0.01,
+            "backoff_max": 0.05,
+            "request_timeout": 5,
+            "hedge_after_seconds": 0,
+            **settings,
+        },
+        api_key="test",
+    )
+
+
+def test_rate_limits_and_server_errors_are_retried(stub):
+    handler, base_url = stub
+    handler.script["model-a"] = [429, 500, 503]
+
+    assert _client(base_url).chat("model-a", []) == ANSWER
+    assert handler.requests == ["model-a"] * 4
+
+
+def test_retries_give_up_after_max_retries(stub):
+    handler, base_url = stub
+    handler.script["model-a"] = [502] * 5
+
+    answer = _client(base_url, max_retries=2).chat("model-a", [])
+
+    assert answer.startswith("Error: ")
+    assert handler.requests == ["model-a"] * 3
+
+
+def test_client_errors_are_not_retried(stub):
+    handler, base_url = stub
+    handler.script["model-a"] = [400]
+
+    assert _client(base_url).chat("model-a", []).startswith("Error: ")
+    assert handler.requests == ["model-a"]
+
+
+def test_timed_out_requests_are_retried(stub):
+    handler, base_url = stub
+    handler.script["model-a"] = ["slow"]
+
+    start = time.perf_counter()
+    assert _client(base_url, request_timeout=0.2).chat("model-a", []) == ANSWER
+    assert time.perf_counter() - start < 1
+    assert handler.requests == ["model-a"] * 2
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_slow_primary_is_hedged_to_the_fallback(stub, streamed):
+    handler, base_url = stub
+    handler.script["primary"] = ["slow"]
+    client = _client(base_url, hedge_after_seconds=0.1)
+
+    start = time.perf_counter()
+    if streamed:
+        answer = "".join(client.stream("primary", [], fallback_model="fallback"))
+    else:
+        answer = client.chat("primary", [], fallback_model="fallback")
+
+    assert answer == ANSWER
+    assert time.perf_counter() - start < 1
+    assert handler.requests == ["primary", "fallback"]
+
+
+def test_primary_failing_early_goes_to_the_fallback(stub):
+    handler, base_url = stub
+    handler.script["primary"] = [400]
+    client = _client(base_url, hedge_after_seconds=5)
+
+    start = time.perf_counter()
+    assert client.chat("primary", [], fallback_model="fallback") == ANSWER
+    assert time.perf_counter() - start < 1
+    assert handler.requests == ["primary", "fallback"]
+
+
+def test_without_hedging_the_fallback_is_not_asked(stub):
+    handler, base_url = stub
+    handler.script["primary"] = [400]
+
+    answer = _client(base_url).chat("primary", [], fallback_model="fallback")
+
+    assert answer.startswith("Error: ")
+    assert handler.requests == ["primary"]
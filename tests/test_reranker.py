@@ -0,0 +1,73 @@
+import time
+
+from langchain_core.documents import Document
+
+from reranker import CrossEncoderReranker
+
+
+class _FakeCrossEncoder:
+    """Scores a pair by the query words found in the text"""
+
+    def __init__(self, seconds_per_pair=0.0):
+        self.seconds_per_pair = seconds_per_pair
+        self.pairs = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.pairs.extend(pairs)
+        time.sleep(self.seconds_per_pair * len(pairs))
+        return [
+            sum(word in text.lower() for word in query.lower().split())
+            for query, text in pairs
+        ]
+
+
+def _reranker(model, **kwargs):
+    reranker = CrossEncoderReranker(**kwargs)
+    reranker._model = model
+    return reranker
+
+
+def _docs(texts):
+    return [Document(page_content=text) for text in texts]
+
+
+def test_chunks_are_reordered_by_score_and_scores_are_cached():
+    model = _FakeCrossEncoder()
+    reranker = _reranker(model, batch_size=2, budget_ms=10_000)
+    docs = _docs(
+        ["Invoices are due monthly.", "Reset the pump.", "Pump reset takes a minute."]
+    )
+
+    ranked = reranker.rerank("pump reset minute", docs, 2)
+
+    assert ranked == [docs[2], docs[1]]
+    assert len(model.pairs) == 3
+
+    # A slider change asks for more of the same candidates: nothing is rescored
+    assert reranker.rerank("pump reset minute", docs, 3) == [docs[2], docs[1], docs[0]]
+    assert len(model.pairs) == 3
+
+
+def test_unscored_chunks_keep_their_order_when_the_budget_runs_out():
+    model = _FakeCrossEncoder(seconds_per_pair=0.01)
+    reranker = _reranker(model, batch_size=2, budget_ms=30)
+    reranker.seconds_per_pair = 0.01
+    docs = _docs([f"chunk {i}" for i in range(8)] + ["the answer is here"])
+
+    ranked = reranker.rerank("answer", docs, 9)
+
+    scored = len(model.pairs)
+    assert 0 < scored < len(docs)
+    # Only scored chunks are reordered; the rest follow in retrieval order
+    assert ranked[scored:] == docs[scored:]
+    assert docs[-1] in ranked[scored:]
+
+
+def test_zero_budget_keeps_retrieval_order():
+    model = _FakeCrossEncoder()
+    reranker = _reranker(model)
+    docs = _docs(["a", "b", "c"])
+
+    assert reranker.rerank("b", docs, 2, budget_ms=0) == docs[:2]
+    assert model.pairs == []
+    assert reranker.rerank("b", [], 2) == []
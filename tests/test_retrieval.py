@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import index_cache
+import utils
+from config import config
+from vector_backends import MetadataFilter
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.cache, "enabled", True)
+    monkeypatch.setitem(config.cache, "dir", str(tmp_path / "cache"))
+    monkeypatch.setattr(index_cache, "_index_cache", None)
+    return index_cache.get_index_cache()
+
+
+def _documents(n):
+    return [
+        Document(
+            page_content=f"Section {i} describes topic {i % 7} in detail.",
+            metadata={"source": f"file{i % 3}.txt", "file_hash": str(i % 3)},
+        )
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_queries_do_not_embed_chunks_or_write_to_the_cache(
+    monkeypatch, cache, quantization
+):
+    monkeypatch.setitem(config.index, "type", "flat")
+    monkeypatch.setitem(config.index, "quantization", quantization)
+    embeddings = CountingEmbedding(size=32)
+    store = utils.create_vector_store(_documents(60), embeddings)
+    embedded = embeddings.embedded
+    changes = cache.embeddings._conn.total_changes
+
+    context, sources = utils.get_relevant_context(
+        store, "topic 3", num_docs=4, token_budget=200, rerank=False
+    )
+
+    assert context and sources
+    assert embeddings.embedded == embedded
+    assert cache.embeddings._conn.total_changes == changes
+
+
+def test_stored_vectors_follow_removals_and_additions(monkeypatch, cache):
+    monkeypatch.setitem(config.index, "type", "flat")
+    embeddings = DeterministicFakeEmbedding(size=32)
+    store = utils.create_vector_store(_documents(30), embeddings)
+    store = utils.update_vector_store(
+        store,
+        [Document(page_content="A new file.", metadata={"source": "new.txt"})],
+        embeddings,
+        ["file1.txt"],
+    )
+
+    docs = [
+        store.docstore.search(doc_id) for doc_id in store.index_to_docstore_id.values()
+    ]
+    vectors = utils.stored_vectors(store, [doc.id for doc in docs])
+    expected = embeddings.embed_documents([doc.page_content for doc in docs])
+    np.testing.assert_allclose(vectors, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("search_mode", ["vector", "hybrid"])
+def test_filters_apply_to_the_in_memory_store(monkeypatch, search_mode):
+    monkeypatch.setitem(config.cache, "enabled", False)
+    monkeypatch.setitem(config.index, "type", "flat")
+    store = utils.create_vector_store(
+        _documents(60), DeterministicFakeEmbedding(size=32)
+    )
+
+    _, sources = utils.get_relevant_context(
+        store,
+        "topic 3",
+        num_docs=5,
+        search_mode=search_mode,
+        rerank=False,
+        where=MetadataFilter(sources=["file2.txt"]),
+    )
+
+    assert sources == ["file2.txt"]
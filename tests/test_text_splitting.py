@@ -0,0 +1,49 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import text_splitting
+import worker_pools
+from config import config
+
+
+def _pages():
+    words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta"]
+    pages = []
+    for i in range(12):
+        paragraphs = [
+            " ".join(words[(i + j + n) % len(words)] for n in range(40 + 7 * j))
+            for j in range(1 + i % 5)
+        ]
+        pages.append(
+            Document(
+                page_content="\n\n".join(paragraphs) + f"\nPage {i} ends here.",
+                metadata={"source": f"doc{i % 3}.txt", "page": i},
+            )
+        )
+    # Whitespace-only runs and a page shorter than one chunk
+    pages.append(Document(page_content="   \n\n  short", metadata={"page": 12}))
+    return pages
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunks_match_recursive_character_splitter(monkeypatch, workers):
+    monkeypatch.setitem(config.splitting, "min_parallel_chars", 0)
+    pages = _pages()
+    expected = RecursiveCharacterTextSplitter(
+        chunk_size=200, chunk_overlap=50, add_start_index=True
+    ).split_documents(pages)
+
+    chunks = text_splitting.split_documents(pages, 200, 50, workers=workers)
+
+    assert [chunk.page_content for chunk in chunks] == [
+        doc.page_content for doc in expected
+    ]
+    for chunk, doc in zip(chunks, expected):
+        assert chunk.metadata.pop("end_index") == (
+            doc.metadata["start_index"] + len(doc.page_content)
+        )
+        assert chunk.metadata == doc.metadata
+    if workers > 1:
+        pool = worker_pools.current_pool("splitting")
+        assert pool is not None and worker_pools._pool_users[pool] == 0
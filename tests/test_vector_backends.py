@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import utils
+from config import config
+from vector_backends import FaissBackend, MetadataFilter, _MetadataIndex
+
+
+def _chunks(source, count, file_type, added_at, seed):
+    rng = np.random.default_rng(seed)
+    ids = [f"{source}-{i}" for i in range(count)]
+    metadatas = [
+        {"source": source, "file_type": file_type, "added_at": added_at} for _ in ids
+    ]
+    return ids, [f"text {i}" for i in ids], rng.normal(size=(count, 16)), metadatas
+
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_metadata_index_follows_upserts_and_deletes(monkeypatch, tmp_path, index_type):
+    monkeypatch.setitem(config.index, "type", index_type)
+    backend = FaissBackend(str(tmp_path / "store"), None, batch_size=50)
+    backend.upsert(*_chunks("a.pdf", 120, "pdf", 100, 0))
+    backend.upsert(*_chunks("b.txt", 80, "txt", 200, 1))
+    query = np.zeros(16)
+    assert backend.search(query, 5, ["a.pdf"])
+    metadata_index = backend._metadata_index
+
+    backend.upsert(*_chunks("c.txt", 60, "txt", 300, 2))
+    backend.delete_sources(["a.pdf"])
+    # Re-indexing a file replaces its chunks in place
+    backend.upsert(*_chunks("b.txt", 30, "txt", 400, 3))
+
+    assert backend._metadata_index is metadata_index
+    rebuilt = _MetadataIndex(backend.store)
+    where = MetadataFilter(file_types=["txt"], since=250)
+    for sources, filter_ in [(["b.txt"], None), (None, where), (["a.pdf"], None)]:
+        np.testing.assert_array_equal(
+            metadata_index.select(sources, filter_), rebuilt.select(sources, filter_)
+        )
+
+    found = backend.search(query, 20, ["b.txt", "c.txt"], where)
+    assert found
+    assert {doc.metadata["source"] for doc in found} == {"c.txt", "b.txt"}
+    assert all(doc.metadata["added_at"] >= 250 for doc in found)
+    assert backend.search(query, 5, ["a.pdf"]) == []
+
+
+def test_hybrid_search_on_a_collection_uses_filtered_bm25(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.index, "type", "flat")
+    embeddings = DeterministicFakeEmbedding(size=16)
+    backend = FaissBackend(str(tmp_path / "store"), embeddings)
+    texts = [f"General notes number {i}." for i in range(200)]
+    texts[7] = "Error code XJ-4471 means the pump is dry."
+    texts[8] = "Error code XJ-4471 appears in the other file too."
+    sources = ["mine.txt" if i != 8 else "theirs.txt" for i in range(len(texts))]
+    backend.upsert(
+        [f"id{i}" for i in range(len(texts))],
+        texts,
+        embeddings.embed_documents(texts),
+        [{"source": source, "file_type": "txt"} for source in sources],
+    )
+    backend.session_sources = {"mine.txt": None}
+
+    found = utils.hybrid_search(backend, "XJ-4471", 3)
+
+    assert texts[7] in [doc.page_content for doc in found]
+    assert all(doc.metadata["source"] == "mine.txt" for doc in found)
+
+
+def test_version_changes_with_every_write(tmp_path):
+    backend = FaissBackend(str(tmp_path / "store"), None)
+    versions = [backend.version]
+    backend.upsert(*_chunks("a.pdf", 10, "pdf", 100, 0))
+    versions.append(backend.version)
+    backend.upsert(*_chunks("b.txt", 10, "txt", 200, 1))
+    versions.append(backend.version)
+    backend.delete_sources(["a.pdf"])
+    versions.append(backend.version)
+
+    assert len(set(versions)) == len(versions)
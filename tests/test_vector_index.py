@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from config import config
+from vector_backends import FaissBackend
+import utils
+from vector_index import (
+    build_faiss_store,
+    clustered_vectors,
+    needs_rebuild,
+    rebuild_without,
+    supports_removal,
+)
+
+
+def _clustered_vectors(n, dimension=32, seed=0):
+    rng = np.random.default_rng(seed)
+    return clustered_vectors(rng, n, dimension, num_clusters=64)[0]
+
+
+def _assert_finds_itself(store, vectors_by_id):
+    for doc_id, vector in vectors_by_id.items():
+        found = store.similarity_search_by_vector(vector, k=1)
+        assert found[0].id == doc_id
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "hnsw"])
+def test_update_keeps_surviving_chunks_findable(monkeypatch, index_type):
+    monkeypatch.setitem(config.index, "type", index_type)
+    # Search every list, so only a label mix-up can return the wrong chunk
+    monkeypatch.setitem(config.index, "nprobe", 1 << 20)
+    vectors = _clustered_vectors(2000)
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    store = build_faiss_store(
+        [f"text {i}" for i in range(len(vectors))],
+        vectors,
+        [{"source": "a.txt"} for _ in ids],
+        None,
+        ids,
+    )
+
+    removed = ids[:10]
+    if supports_removal(store.index):
+        store.delete(removed)
+    else:
+        rebuild_without(store, removed)
+    extra = _clustered_vectors(50, seed=1)
+    extra_ids = [f"new{i}" for i in range(len(extra))]
+    store.add_embeddings(
+        list(zip([f"new {i}" for i in range(len(extra))], extra)),
+        metadatas=[{"source": "b.txt"} for _ in extra_ids],
+        ids=extra_ids,
+    )
+
+    assert store.index.ntotal == len(vectors) - len(removed) + len(extra)
+    survivors = dict(zip(ids[10:], vectors[10:]))
+    survivors.update(zip(extra_ids, extra))
+    _assert_finds_itself(store, survivors)
+
+
+def test_backend_replacing_a_source_on_ivf(monkeypatch, tmp_path):
+    monkeypatch.setitem(config.index, "type", "ivf")
+    monkeypatch.setitem(config.index, "nprobe", 1 << 20)
+    backend = FaissBackend(str(tmp_path / "store"), None)
+    vectors = _clustered_vectors(1200)
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    metadatas = [{"source": f"file{i % 3}.txt"} for i in range(len(vectors))]
+    backend.upsert(ids, [f"text {i}" for i in ids], vectors, metadatas)
+
+    backend.delete_sources(["file0.txt"])
+    replacement = _clustered_vectors(100, seed=2)
+    new_ids = [f"v2-{i}" for i in range(len(replacement))]
+    backend.upsert(
+        new_ids,
+        [f"text {i}" for i in new_ids],
+        replacement,
+        [{"source": "file0.txt"} for _ in new_ids],
+    )
+
+    survivors = {
+        doc_id: vector
+        for doc_id, vector, metadata in zip(ids, vectors, metadatas)
+        if metadata["source"] != "file0.txt"
+    }
+    survivors.update(zip(new_ids, replacement))
+    _assert_finds_itself(backend.store, survivors)
+
+
+@pytest.mark.parametrize(
+    "built, wanted, expected",
+    [
+        (None, "Flat", True),
+        ("Flat", "Flat", False),
+        ("Flat", "HNSW32", True),
+        ("HNSW32", "HNSW32_SQ8", True),
+        ("IVF400,Flat", "IVF760,Flat", False),
+        ("IVF400,Flat", "IVF900,Flat", True),
+        ("IVF400,Flat", "IVF400,SQ8", True),
+        ("HNSW32", "IVF4000,Flat", True),
+    ],
+)
+def test_needs_rebuild_ignores_small_list_count_drift(built, wanted, expected):
+    assert needs_rebuild(built, wanted) == expected
+
+
+class _NoEmbedding:
+    def embed_documents(self, texts):
+        raise AssertionError("rebuilding must not embed")
+
+
+def test_rebuild_for_size_reuses_stored_vectors(monkeypatch):
+    monkeypatch.setitem(config.cache, "enabled", False)
+    monkeypatch.setitem(config.index, "type", "flat")
+    vectors = _clustered_vectors(600)
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    store = build_faiss_store(
+        [f"text {i}" for i in ids],
+        vectors,
+        [{"source": "a.txt"} for _ in ids],
+        _NoEmbedding(),
+        ids,
+    )
+    store.index_factory = "Flat"
+
+    monkeypatch.setitem(config.index, "type", "hnsw")
+    rebuilt = utils.rebuild_for_size(store, _NoEmbedding())
+
+    assert rebuilt.index_factory == "HNSW32"
+    assert rebuilt.index_to_docstore_id == store.index_to_docstore_id
+    _assert_finds_itself(rebuilt, dict(zip(ids, vectors)))
+    assert utils.rebuild_for_size(rebuilt, _NoEmbedding()) is rebuilt
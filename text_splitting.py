@@ -0,0 +1,116 @@
+# Spawned split workers import this module, so it imports no more than the
+# splitter itself needs
+from copy import deepcopy
+from typing import List, Tuple, Union
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from config import config
+from worker_pools import acquire_pool, release_pool
+
+# A chunk is its (start, end) span in the page, or its text if not contiguous
+Span = Union[Tuple[int, int], str]
+
+
+def _make_splitter(chunk_size: int, chunk_overlap: int):
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+
+
+def chunk_spans(text: str, splitter) -> List[Span]:
+    """Split ``text`` and locate each chunk in it, as LangChain's start index does"""
+    spans: List[Span] = []
+    index, previous_len = 0, 0
+    for chunk in splitter.split_text(text):
+        start = text.find(chunk, max(0, index + previous_len - splitter._chunk_overlap))
+        if start < 0:
+            spans.append(chunk)
+            continue
+        index, previous_len = start, len(chunk)
+        spans.append((start, start + len(chunk)))
+    return spans
+
+
+def _split_texts(args) -> List[List[Span]]:
+    """Chunk spans for a group of pages (runs in a worker process)"""
+    texts, chunk_size, chunk_overlap = args
+    splitter = _make_splitter(chunk_size, chunk_overlap)
+    return [chunk_spans(text, splitter) for text in texts]
+
+
+def _groups(documents: List[Document], parts: int) -> List[List[int]]:
+    """Contiguous groups of page indexes with roughly equal text size"""
+    total = sum(len(doc.page_content) for doc in documents)
+    target = max(1, total // parts)
+    groups, group, size = [], [], 0
+    for i, doc in enumerate(documents):
+        group.append(i)
+        size += len(doc.page_content)
+        if size >= target:
+            groups.append(group)
+            group, size = [], 0
+    if group:
+        groups.append(group)
+    return groups
+
+
+def split_documents(
+    documents: List[Document],
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    workers: int = 1,
+) -> List[Document]:
+    """Split documents into overlapping chunks, in parallel for large inputs.
+
+    Chunks are exactly those of ``RecursiveCharacterTextSplitter``. Workers
+    return each chunk's offsets rather than its text, so overlapping text is
+    not copied back; the offsets are kept as ``start_index``/``end_index``.
+    """
+    settings = config.splitting
+    total = sum(len(doc.page_content) for doc in documents)
+    parallel = (
+        workers > 1
+        and len(documents) > 1
+        and total >= settings.get("min_parallel_chars", 2_000_000)
+    )
+
+    if parallel:
+        # Several groups per worker even out pages of different sizes
+        groups = _groups(documents, workers * 4)
+        pool = acquire_pool("splitting", workers, settings.get("start_method", "spawn"))
+        try:
+            results = pool.map(
+                _split_texts,
+                [
+                    (
+                        [documents[i].page_content for i in group],
+                        chunk_size,
+                        chunk_overlap,
+                    )
+                    for group in groups
+                ],
+            )
+        finally:
+            release_pool(pool)
+        spans = [s for result in results for s in result]
+    else:
+        splitter = _make_splitter(chunk_size, chunk_overlap)
+        spans = [chunk_spans(doc.page_content, splitter) for doc in documents]
+
+    chunks = []
+    for doc, doc_spans in zip(documents, spans):
+        text = doc.page_content
+        for span in doc_spans:
+            metadata = deepcopy(doc.metadata)
+            if isinstance(span, str):
+                chunks.append(Document(page_content=span, metadata=metadata))
+                continue
+            start, end = span
+            metadata["start_index"] = start
+            metadata["end_index"] = end
+            chunks.append(Document(page_content=text[start:end], metadata=metadata))
+    return chunks
@@ -1,117 +1,1012 @@
 import os
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import multiprocessing
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    CSVLoader,
-    UnstructuredWordDocumentLoader,
-)
 from langchain.schema import Document
 import tempfile
 import hashlib
-from typing import List
+import time
+import warnings
+from copy import deepcopy
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+import text_splitting
+from document_loading import load_file
+from config import config
+from context_packing import pack_context
+from dedup import DedupIndex, deduplicate, new_dedup_index, replace_metadata
+from embedding_engine import EmbeddingEngine, available_cores
+from index_cache import get_index_cache, hash_text
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from reranker import get_reranker
+from vector_backends import (
+    MetadataFilter,
+    VectorBackend,
+    chunk_ids,
+    get_vector_backend,
+    lexical_search_masked,
+    search_masked,
+    store_mask,
+)
+from vector_index import (
+    apply_search_params,
+    build_faiss_store,
+    describe_index_settings,
+    exact_rerank,
+    index_memory_bytes,
+    is_quantized,
+    needs_rebuild,
+    rebuild_without,
+    reconstruct_vectors,
+    stored_vectors,
+    supports_removal,
+)
+from worker_pools import acquire_pool, release_pool
 
 
 def get_embeddings():
-    """Initialize and return HuggingFace embeddings"""
-    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    """Initialize and return the batched HuggingFace embedding engine"""
+    settings = config.embeddings
+    return EmbeddingEngine(
+        model_name=settings.get("model_name", "sentence-transformers/all-MiniLM-L6-v2"),
+        device=settings.get("device", "cpu"),
+        batch_size=settings.get("batch_size", 32),
+        num_threads=settings.get("num_threads", 0),
+        num_processes=settings.get("num_processes", 0),
+        normalize=settings.get("normalize", False),
+        query_cache_size=settings.get("query_cache_size", 1024),
+    )
 
 
 def create_documents_hash(documents: List[Document]) -> str:
     """Create a hash from document contents for caching purposes"""
-    content_string = ""
+    hasher = hashlib.md5()
     for doc in documents:
-        content_string += doc.page_content + str(doc.metadata)
-    return hashlib.md5(content_string.encode()).hexdigest()
+        hasher.update((doc.page_content + str(doc.metadata)).encode())
+    return hasher.hexdigest()
 
 
-def load_documents_from_files(uploaded_files) -> List[Document]:
-    """Load and process documents from uploaded files"""
-    documents = []
+def get_embeddings_namespace(embeddings) -> str:
+    """Identify the embedding model so cached vectors are never mixed"""
+    namespace = getattr(embeddings, "namespace", None)
+    return namespace or getattr(embeddings, "model_name", type(embeddings).__name__)
 
-    for uploaded_file in uploaded_files:
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(
-            delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}"
-        ) as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
 
-        try:
-            # Load document based on file type
-            file_extension = uploaded_file.name.split(".")[-1].lower()
-
-            if file_extension == "pdf":
-                loader = PyPDFLoader(tmp_file_path)
-            elif file_extension == "txt":
-                loader = TextLoader(tmp_file_path, encoding="utf-8")
-            elif file_extension == "csv":
-                loader = CSVLoader(tmp_file_path)
-            elif file_extension in ["doc", "docx"]:
-                loader = UnstructuredWordDocumentLoader(tmp_file_path)
-            else:
+@metrics.timed("embed")
+def embed_documents_cached(
+    texts: List[str], embeddings, cache=None
+) -> List[List[float]]:
+    """Embed texts, reusing vectors for chunks already in the on-disk cache"""
+    if cache is None:
+        return embeddings.embed_documents(texts)
+
+    namespace = get_embeddings_namespace(embeddings)
+    hashes = [hash_text(text) for text in texts]
+    cached = cache.embeddings.get_many(namespace, hashes)
+    metrics.inc(
+        "docuchat_cache_requests_total", len(cached), cache="embedding", result="hit"
+    )
+
+    missing = {}
+    for text, chunk_hash in zip(texts, hashes):
+        if chunk_hash not in cached and chunk_hash not in missing:
+            missing[chunk_hash] = text
+    if missing:
+        metrics.inc(
+            "docuchat_cache_requests_total",
+            len(missing),
+            cache="embedding",
+            result="miss",
+        )
+        new_vectors = embeddings.embed_documents(list(missing.values()))
+        fresh = dict(zip(missing.keys(), new_vectors))
+        cache.put_embeddings(namespace, fresh)
+        cached.update(fresh)
+
+    return [cached[chunk_hash] for chunk_hash in hashes]
+
+
+SUPPORTED_EXTENSIONS = ("pdf", "txt", "csv", "doc", "docx")
+READ_BLOCK_BYTES = 1 << 20
+# Formats whose parsing is slow enough to be worth a worker process
+SLOW_EXTENSIONS = ("pdf", "doc", "docx")
+
+
+def _iter_blocks(uploaded_file) -> Iterator[bytes]:
+    """Read an upload (or a file on disk) in blocks instead of copying it whole"""
+    path = getattr(uploaded_file, "path", None)
+    if path is not None:
+        with open(path, "rb") as f:
+            while block := f.read(READ_BLOCK_BYTES):
+                yield block
+        return
+    uploaded_file.seek(0)
+    try:
+        while block := uploaded_file.read(READ_BLOCK_BYTES):
+            yield block
+    finally:
+        uploaded_file.seek(0)
+
+
+def get_file_hash(uploaded_file) -> str:
+    """Hash the raw bytes of an uploaded file to detect changes"""
+    hasher = hashlib.sha256()
+    for block in _iter_blocks(uploaded_file):
+        hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _spool_file(uploaded_file) -> Tuple[str, str, bool]:
+    """Return a path the loaders can read, the file hash, and if it is a temp copy"""
+    hasher = hashlib.sha256()
+    path = getattr(uploaded_file, "path", None)
+    if path is not None:
+        for block in _iter_blocks(uploaded_file):
+            hasher.update(block)
+        return path, hasher.hexdigest(), False
+
+    # Save uploaded file temporarily, hashing it on the way
+    file_extension = uploaded_file.name.split(".")[-1].lower()
+    with tempfile.NamedTemporaryFile(
+        delete=False, suffix=f".{file_extension}"
+    ) as tmp_file:
+        for block in _iter_blocks(uploaded_file):
+            hasher.update(block)
+            tmp_file.write(block)
+    return tmp_file.name, hasher.hexdigest(), True
+
+
+def _is_supported(file_name: str) -> bool:
+    return file_name.split(".")[-1].lower() in SUPPORTED_EXTENSIONS
+
+
+def _load_upload(uploaded_file) -> List[Document]:
+    path, file_hash, is_temp = _spool_file(uploaded_file)
+    try:
+        return load_file(uploaded_file.name, path, file_hash)
+    finally:
+        # Clean up temporary file
+        if is_temp:
+            os.unlink(path)
+
+
+def _submit_file(pool, uploaded_file):
+    """Spool a file and queue it for parsing; workers get a path, not bytes"""
+    try:
+        path, file_hash, is_temp = _spool_file(uploaded_file)
+    except Exception as e:
+        return uploaded_file.name, e, None
+    result = pool.apply_async(load_file, (uploaded_file.name, path, file_hash))
+    return uploaded_file.name, result, path if is_temp else None
+
+
+def _collect_file(name: str, result, temp_path: Optional[str], timeout: float):
+    """Wait for a parse; returns ``(name, documents, error, timed_out)``"""
+    try:
+        if isinstance(result, Exception):
+            raise result
+        return name, result.get(timeout=timeout), None, False
+    except multiprocessing.TimeoutError:
+        return name, [], f"timed out after {timeout}s", True
+    except Exception as e:
+        return name, [], str(e), False
+    finally:
+        if temp_path is not None:
+            os.unlink(temp_path)
+
+
+def _worth_a_pool(uploaded_files, settings: Dict) -> bool:
+    """Whether parsing files in parallel saves more than sending them costs.
+
+    Text and CSV files parse about as fast as they can be handed over, so
+    only several PDF/Word files or a large batch are spread over workers.
+    """
+    slow = sum(f.name.split(".")[-1].lower() in SLOW_EXTENSIONS for f in uploaded_files)
+    size = sum(getattr(f, "size", 0) or 0 for f in uploaded_files)
+    return slow >= settings.get("min_pool_files", 2) or size >= settings.get(
+        "min_pool_bytes", 8_000_000
+    )
+
+
+def iter_loaded_files(
+    uploaded_files, max_workers: int = None, timeout: float = None
+) -> Iterator[Tuple[str, List[Document], Optional[str]]]:
+    """Yield ``(name, documents, error)`` per file, in upload order.
+
+    Files are parsed in a process pool kept across calls, so a file taking
+    longer than ``timeout`` seconds can be abandoned. Batches worth it (see
+    ``_worth_a_pool``) keep two files per worker in flight; others are
+    parsed one at a time. With no timeout (0), those are parsed in-process.
+    Memory does not grow with the number of files either way.
+    """
+    settings = config.loading
+    if max_workers is None:
+        max_workers = settings.get("max_workers", 0) or available_cores()
+    if timeout is None:
+        timeout = settings.get("timeout_seconds", 120)
+
+    uploaded_files = [f for f in uploaded_files if _is_supported(f.name)]
+    in_flight = 1
+    if len(uploaded_files) > 1 and _worth_a_pool(uploaded_files, settings):
+        in_flight = 2 * max_workers
+    if not uploaded_files or (in_flight == 1 and not timeout):
+        for uploaded_file in uploaded_files:
+            try:
+                documents = _load_upload(uploaded_file)
+            except Exception as e:
+                yield uploaded_file.name, [], str(e)
                 continue
+            yield uploaded_file.name, documents, None
+        return
 
-            docs = loader.load()
+    # The pool keeps one size, so small and large batches do not restart it
+    pool = acquire_pool("loading", max_workers, settings.get("start_method", "spawn"))
+    pending = deque()
+    stuck = False
+    try:
+        for i, uploaded_file in enumerate(uploaded_files):
+            pending.append(_submit_file(pool, uploaded_file))
+            # Collect in submission order so output and metadata stay deterministic
+            while pending and (
+                len(pending) >= in_flight or i == len(uploaded_files) - 1
+            ):
+                name, documents, error, timed_out = _collect_file(
+                    *pending.popleft(), timeout or None
+                )
+                stuck = stuck or timed_out
+                yield name, documents, error
+    finally:
+        # Spooled copies are left behind if the consumer stops early
+        for _, _, temp_path in pending:
+            if temp_path is not None:
+                os.unlink(temp_path)
+        # A worker still stuck on a timed-out file is killed with its pool
+        release_pool(pool, stuck)
 
-            # Add source metadata
-            for doc in docs:
-                doc.metadata["source"] = uploaded_file.name
 
-            documents.extend(docs)
+@metrics.timed("load")
+def load_documents_from_files(
+    uploaded_files, max_workers: int = None, timeout: float = None
+) -> Tuple[List[Document], List[str]]:
+    """Load and process documents from uploaded files.
 
-        except Exception as e:
-            print(f"Error loading {uploaded_file.name}: {str(e)}")
-        finally:
-            # Clean up temporary file
-            os.unlink(tmp_file_path)
+    Returns the documents in upload order plus one error message per file
+    that failed or exceeded ``timeout`` seconds.
+    """
+    documents = []
+    errors = []
+    for name, docs, error in iter_loaded_files(uploaded_files, max_workers, timeout):
+        if error is not None:
+            errors.append(f"{name}: {error}")
+        documents.extend(docs)
+    return documents, errors
 
-    return documents
 
+@metrics.timed("split")
+def split_documents(
+    documents: List[Document], chunk_size: int = 1000, chunk_overlap: int = 200
+) -> List[Document]:
+    """Split documents into overlapping chunks"""
+    workers = config.splitting.get("workers", 0) or available_cores()
+    return text_splitting.split_documents(documents, chunk_size, chunk_overlap, workers)
 
+
+@metrics.timed("index_build")
 def create_vector_store(
     documents: List[Document],
     embeddings,
     chunk_size: int = 1000,
     chunk_overlap: int = 200,
+    dedup_report: Optional[Dict[str, int]] = None,
+    backend: Optional[str] = None,
 ):
-    """Create FAISS vector store from documents"""
+    """Create FAISS vector store from documents.
+
+    Duplicate chunks are dropped before embedding; ``dedup_report`` counts
+    them (see ``dedup.deduplicate``). The store keeps its ``dedup_index``,
+    so later updates are checked against the chunks already indexed.
+    ``backend`` overrides ``[vector_store] backend``; "faiss" always builds
+    an in-memory store.
+    """
     if not documents:
         return None
+    backend = backend or config.vector_store.get("backend", "faiss")
+    if backend != "faiss":
+        # Persistent backends (e.g. Chroma) keep chunks across restarts
+        return update_vector_store(
+            get_vector_backend(embeddings, backend),
+            documents,
+            embeddings,
+            (),
+            chunk_size,
+            chunk_overlap,
+            dedup_report,
+        )
+
+    # Split documents into chunks and drop duplicates across files
+    splits = split_documents(documents, chunk_size, chunk_overlap)
+    dedup_index = new_dedup_index()
+    ids, splits = deduplicate(splits, dedup_index, report=dedup_report)
+
+    # Reuse a persisted index when the exact same corpus was indexed before
+    cache = get_index_cache()
+    corpus_key = hashlib.md5(
+        "|".join(
+            [
+                get_embeddings_namespace(embeddings),
+                str(chunk_size),
+                str(chunk_overlap),
+                describe_index_settings(len(splits)),
+                create_documents_hash(splits),
+            ]
+        ).encode()
+    ).hexdigest()
+    if cache is not None:
+        vectorstore = cache.load_index(corpus_key, embeddings)
+        metrics.inc(
+            "docuchat_cache_requests_total",
+            cache="index",
+            result="miss" if vectorstore is None else "hit",
+        )
+        if vectorstore is not None:
+            apply_search_params(vectorstore.index)
+            return vectorstore
+
+    # Create vector store, embedding only chunks missing from the cache
+    texts = [doc.page_content for doc in splits]
+    vectors = embed_documents_cached(texts, embeddings, cache)
+    vectorstore = build_faiss_store(
+        texts, vectors, [doc.metadata for doc in splits], embeddings, ids
+    )
+    vectorstore.lexical_index = BM25Index.from_vector_store(vectorstore)
+    vectorstore.dedup_index = dedup_index
+    if cache is not None:
+        cache.save_index(corpus_key, vectorstore)
+    return vectorstore
+
+
+def get_indexed_files(vectorstore) -> Dict[str, Dict]:
+    """Map each indexed source to its file hash and docstore ids"""
+    indexed = {}
+    if not vectorstore:
+        return indexed
+    if isinstance(vectorstore, VectorBackend):
+        return {
+            source: {"file_hash": file_hash, "ids": []}
+            for source, file_hash in vectorstore.session_sources.items()
+        }
+
+    for doc_id in vectorstore.index_to_docstore_id.values():
+        doc = vectorstore.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            continue
+        metadata = doc.metadata
+        # A deduplicated chunk also belongs to the files it was merged from
+        refs = zip(
+            metadata.get("sources", [metadata.get("source", "Unknown")]),
+            metadata.get("file_hashes", [metadata.get("file_hash")]),
+        )
+        for source, file_hash in refs:
+            entry = indexed.setdefault(source, {"file_hash": file_hash, "ids": []})
+            entry["ids"].append(doc_id)
+    return indexed
+
+
+def _count_chunks(vectorstore) -> int:
+    if not vectorstore:
+        return 0
+    if isinstance(vectorstore, VectorBackend):
+        return vectorstore.count()
+    return vectorstore.index.ntotal
+
+
+def get_vector_store_stats(vectorstore) -> Tuple[int, int]:
+    """Number of indexed chunks and the index size in bytes"""
+    if not vectorstore:
+        return 0, 0
+    if isinstance(vectorstore, VectorBackend):
+        return vectorstore.count(), vectorstore.disk_bytes()
+    return vectorstore.index.ntotal, index_memory_bytes(vectorstore.index)
+
+
+def get_corpus_hash(vectorstore) -> str:
+    """Hash the set of indexed files, identifying the corpus a store answers from"""
+    indexed = get_indexed_files(vectorstore)
+    hasher = hashlib.md5()
+    for source in sorted(indexed):
+        hasher.update(f"{source}:{indexed[source]['file_hash']}\n".encode())
+    return hasher.hexdigest()
+
+
+def plan_index_update(vectorstore, uploaded_files) -> Tuple[list, set]:
+    """Work out which uploads are new or changed and which sources were removed"""
+    indexed = get_indexed_files(vectorstore)
+    changed_files = []
+    for uploaded_file in uploaded_files:
+        entry = indexed.get(uploaded_file.name)
+        if entry is None or entry["file_hash"] != get_file_hash(uploaded_file):
+            changed_files.append(uploaded_file)
+
+    uploaded_names = {uploaded_file.name for uploaded_file in uploaded_files}
+    removed_sources = set(indexed) - uploaded_names
+    return changed_files, removed_sources
+
+
+@metrics.timed("index_update")
+def update_vector_store(
+    vectorstore,
+    documents: List[Document],
+    embeddings,
+    removed_sources: Iterable[str] = (),
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    dedup_report: Optional[Dict[str, int]] = None,
+):
+    """Incrementally add new/changed documents and drop removed sources.
+
+    Vectors of any source present in ``documents`` are replaced, so only the
+    changed files are split and embedded. Chunks shared with files that stay
+    are handed over to them rather than dropped. Returns the updated store,
+    or None once every source has been removed.
+    """
+    if vectorstore is None:
+        return create_vector_store(
+            documents, embeddings, chunk_size, chunk_overlap, dedup_report
+        )
+    if isinstance(vectorstore, VectorBackend):
+        return _update_backend(
+            vectorstore,
+            documents,
+            embeddings,
+            removed_sources,
+            chunk_size,
+            chunk_overlap,
+            dedup_report,
+        )
 
-    # Split documents into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
+    stale_sources = set(removed_sources)
+    stale_sources.update(doc.metadata.get("source", "Unknown") for doc in documents)
+    indexed = get_indexed_files(vectorstore)
+    stale_ids = _release_shared_chunks(
+        vectorstore,
+        dict.fromkeys(
+            doc_id
+            for source in stale_sources
+            if source in indexed
+            for doc_id in indexed[source]["ids"]
+        ),
+        stale_sources,
     )
+    lexical_index = get_lexical_index(vectorstore)
+    if stale_ids:
+        if supports_removal(vectorstore.index):
+            vectorstore.delete(stale_ids)
+        else:
+            rebuild_without(vectorstore, stale_ids)
+        lexical_index.remove(stale_ids)
+        if getattr(vectorstore, "dedup_index", None) is not None:
+            vectorstore.dedup_index.remove(stale_ids)
 
-    splits = text_splitter.split_documents(documents)
+    if documents:
+        splits = split_documents(documents, chunk_size, chunk_overlap)
+        new_ids, splits = deduplicate(
+            splits,
+            get_dedup_index(vectorstore),
+            vectorstore.docstore,
+            dedup_report,
+        )
+        texts = [doc.page_content for doc in splits]
+        vectors = embed_documents_cached(texts, embeddings, get_index_cache())
+        if new_ids:
+            vectorstore.add_embeddings(
+                list(zip(texts, vectors)),
+                metadatas=[doc.metadata for doc in splits],
+                ids=new_ids,
+            )
+            lexical_index.add(new_ids, texts)
 
-    # Create vector store
-    vectorstore = FAISS.from_documents(splits, embeddings)
+    if not vectorstore.index_to_docstore_id:
+        return None
     return vectorstore
 
 
-def get_relevant_context(vectorstore, query: str, num_docs: int = 3) -> tuple:
-    """Get relevant context and sources from vector store"""
+def _release_shared_chunks(
+    vectorstore, doc_ids: Iterable[str], stale_sources: Iterable[str]
+) -> List[str]:
+    """Hand deduplicated chunks over to the files that still contain them.
+
+    Returns the ids of the chunks no remaining file refers to.
+    """
+    stale_sources = set(stale_sources)
+    dedup_index = getattr(vectorstore, "dedup_index", None)
+    unreferenced = []
+    for doc_id in doc_ids:
+        doc = vectorstore.docstore.search(doc_id)
+        refs = [
+            (source, file_hash)
+            for source, file_hash in zip(
+                doc.metadata.get("sources", ()), doc.metadata.get("file_hashes", ())
+            )
+            if source not in stale_sources
+        ]
+        if not refs:
+            unreferenced.append(doc_id)
+            continue
+        metadata = dict(doc.metadata)
+        metadata["source"], metadata["file_hash"] = refs[0]
+        metadata["sources"] = [source for source, _ in refs]
+        metadata["file_hashes"] = [file_hash for _, file_hash in refs]
+        replace_metadata(vectorstore.docstore, doc_id, metadata)
+        if dedup_index is not None:
+            dedup_index.add(doc_id, doc.page_content, metadata["source"])
+    return unreferenced
+
+
+def _update_backend(
+    backend: VectorBackend,
+    documents: List[Document],
+    embeddings,
+    removed_sources: Iterable[str],
+    chunk_size: int,
+    chunk_overlap: int,
+    dedup_report: Optional[Dict[str, int]] = None,
+):
+    """Upsert documents into a persistent backend and update the session's view.
+
+    Removed sources only leave the session's view; they stay in the store so
+    re-adding them later costs nothing. Older versions of changed files are
+    deleted, and unchanged files already in the store are not re-upserted.
+    Only exact duplicates within a file are dropped, since files are
+    replaced independently here.
+    """
+    for source in removed_sources:
+        backend.session_sources.pop(source, None)
+
+    file_hashes = {
+        doc.metadata.get("source", "Unknown"): doc.metadata.get("file_hash")
+        for doc in documents
+    }
+    stored = backend.get_sources(file_hashes)
+    backend.delete_sources(
+        source
+        for source, file_hash in file_hashes.items()
+        if source in stored and stored[source] != file_hash
+    )
+    new_documents = [
+        doc
+        for doc in documents
+        if stored.get(doc.metadata.get("source", "Unknown"))
+        != doc.metadata.get("file_hash")
+    ]
+    if new_documents:
+        splits = split_documents(new_documents, chunk_size, chunk_overlap)
+        if new_dedup_index() is not None:
+            by_source: Dict[str, List[Document]] = {}
+            for split in splits:
+                by_source.setdefault(split.metadata.get("source"), []).append(split)
+            splits = [
+                split
+                for source_splits in by_source.values()
+                for split in deduplicate(
+                    source_splits, DedupIndex(), report=dedup_report
+                )[1]
+            ]
+        texts = [doc.page_content for doc in splits]
+        vectors = embed_documents_cached(texts, embeddings, get_index_cache())
+        # Collections can be filtered by when a file was added to them
+        added_at = int(time.time())
+        backend.upsert(
+            chunk_ids(splits),
+            texts,
+            vectors,
+            [{**doc.metadata, "added_at": added_at} for doc in splits],
+        )
+        backend.persist()
+    backend.session_sources.update(file_hashes)
+
+    if not backend.session_sources:
+        return None
+    return backend
+
+
+def rebuild_for_size(vectorstore, embeddings):
+    """Rebuild the index if the corpus outgrew the type it was started with.
+
+    Batches are appended to the index created for the first batch, so a
+    large share would otherwise stay on a flat index (see ``needs_rebuild``).
+    Vectors are read back from the index, or for a quantized index from the
+    embedding cache where present, so nothing is re-embedded.
+    """
+    factory = describe_index_settings(vectorstore.index.ntotal)
+    if not needs_rebuild(getattr(vectorstore, "index_factory", None), factory):
+        return vectorstore
+    doc_ids = [doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+    docs = [vectorstore.docstore.search(doc_id) for doc_id in doc_ids]
+    if is_quantized(vectorstore.index):
+        vectors = _exact_vectors(vectorstore, docs)
+    else:
+        vectors = reconstruct_vectors(vectorstore.index)
+    rebuilt = build_faiss_store(
+        [doc.page_content for doc in docs],
+        vectors,
+        [doc.metadata for doc in docs],
+        embeddings,
+        doc_ids,
+    )
+    rebuilt.lexical_index = get_lexical_index(vectorstore)
+    rebuilt.dedup_index = getattr(vectorstore, "dedup_index", None)
+    rebuilt.index_factory = factory
+    return rebuilt
+
+
+def _document_batches(
+    loaded: Iterable[Tuple[str, List[Document], Optional[str]]],
+    batch_chars: int,
+    errors: List[str],
+) -> Iterator[List[Document]]:
+    """Group loaded files into batches of whole files by page text size"""
+    batch, size = [], 0
+    for name, documents, error in loaded:
+        if error is not None:
+            errors.append(f"{name}: {error}")
+            continue
+        batch.extend(documents)
+        size += sum(len(doc.page_content) for doc in documents)
+        if size >= batch_chars:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def index_files(
+    vectorstore,
+    uploaded_files,
+    embeddings,
+    removed_sources: Iterable[str] = (),
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    batch_chars: int = None,
+    progress: Optional[Callable[[Dict], None]] = None,
+) -> Tuple[object, List[str]]:
+    """Stream files through loading, splitting and embedding into the store.
+
+    Files are parsed as a pipeline and indexed in batches of whole files of
+    about ``batch_chars`` characters; page text is dropped once its batch is
+    indexed, so peak memory follows the batch size rather than the corpus.
+    ``progress`` is called with a status dict after every file and batch;
+    an exception raised from it stops indexing. Returns the updated store
+    and one error message per failed file.
+    """
+    if batch_chars is None:
+        batch_chars = config.loading.get("batch_chars", 4_000_000)
+    uploaded_files = list(uploaded_files)
+    status = {
+        "stage": "loading",
+        "files_total": len(uploaded_files),
+        "files_done": 0,
+        "files_failed": 0,
+        "batches_done": 0,
+        "chunks_added": 0,
+        "chunks_skipped": 0,
+    }
+    dedup_report: Dict[str, int] = {}
+
+    def report():
+        if progress is not None:
+            progress(status)
+
+    def loaded():
+        for name, documents, error in iter_loaded_files(uploaded_files):
+            status["files_done"] += 1
+            status["files_failed"] += error is not None
+            report()
+            yield name, documents, error
+
+    errors: List[str] = []
+    removed = set(removed_sources)
+    created = False
+    report()
+    for documents in _document_batches(loaded(), batch_chars, errors):
+        status["stage"] = "indexing"
+        report()
+        chunks_before = _count_chunks(vectorstore)
+        if vectorstore is None:
+            vectorstore = create_vector_store(
+                documents, embeddings, chunk_size, chunk_overlap, dedup_report
+            )
+            created = not isinstance(vectorstore, VectorBackend)
+            if created:
+                vectorstore.index_factory = describe_index_settings(
+                    vectorstore.index.ntotal
+                )
+        else:
+            vectorstore = update_vector_store(
+                vectorstore,
+                documents,
+                embeddings,
+                removed,
+                chunk_size,
+                chunk_overlap,
+                dedup_report,
+            )
+        removed = set()
+        del documents
+        status["stage"] = "loading"
+        status["batches_done"] += 1
+        status["chunks_added"] += max(0, _count_chunks(vectorstore) - chunks_before)
+        status["chunks_skipped"] = sum(dedup_report.values())
+        report()
+    status["stage"] = "finishing"
+    report()
+    if removed and vectorstore is not None:
+        vectorstore = update_vector_store(vectorstore, [], embeddings, removed)
+    if created and vectorstore is not None:
+        vectorstore = rebuild_for_size(vectorstore, embeddings)
+    return vectorstore, errors
+
+
+def get_lexical_index(vectorstore) -> BM25Index:
+    """Return the store's BM25 index, building it for stores saved without one"""
+    lexical_index = getattr(vectorstore, "lexical_index", None)
+    if lexical_index is None:
+        lexical_index = BM25Index.from_vector_store(vectorstore)
+        vectorstore.lexical_index = lexical_index
+    return lexical_index
+
+
+def get_dedup_index(vectorstore) -> Optional[DedupIndex]:
+    """Return the store's duplicate index, building it from its chunks if needed.
+
+    The index is not saved with the store; stores loaded from disk rebuild
+    it on their first update. None when dedup is disabled.
+    """
+    dedup_index = getattr(vectorstore, "dedup_index", None)
+    if dedup_index is None:
+        dedup_index = new_dedup_index()
+        if dedup_index is None:
+            return None
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            doc = vectorstore.docstore.search(doc_id)
+            dedup_index.add(
+                doc_id, doc.page_content, doc.metadata.get("source", "Unknown")
+            )
+        vectorstore.dedup_index = dedup_index
+    return dedup_index
+
+
+def copy_vector_store(vectorstore):
+    """Make a private, writable copy of a (possibly shared) vector store"""
+    copy = FAISS(
+        vectorstore.embedding_function,
+        # A serialization round trip also copies out of a memory mapping
+        faiss.deserialize_index(faiss.serialize_index(vectorstore.index)),
+        InMemoryDocstore(dict(vectorstore.docstore._dict)),
+        dict(vectorstore.index_to_docstore_id),
+    )
+    copy.lexical_index = deepcopy(get_lexical_index(vectorstore))
+    copy.dedup_index = deepcopy(getattr(vectorstore, "dedup_index", None))
+    return copy
+
+
+def share_vector_store(vectorstore, embeddings, registry):
+    """Publish a store in the shared registry and return this session's lease.
+
+    If another session already holds the same corpus, its mapping is reused
+    and ``vectorstore`` can be dropped. Otherwise the index is persisted and
+    re-opened as a read-only memory mapping.
+    """
+    key = hashlib.md5(
+        "|".join(
+            [
+                get_embeddings_namespace(embeddings),
+                get_corpus_hash(vectorstore),
+                str(vectorstore.index.ntotal),
+            ]
+        ).encode()
+    ).hexdigest()
+    cache = get_index_cache()
+
+    def load():
+        if cache is None:
+            return vectorstore
+        if not cache.has_index(key):
+            cache.save_index(key, vectorstore)
+        shared = cache.load_index_mmap(key, embeddings)
+        if shared is None:
+            return vectorstore
+        apply_search_params(shared.index)
+        return shared
+
+    return registry.acquire(key, load)
+
+
+def _exact_vectors(vectorstore, docs: List[Document]) -> np.ndarray:
+    """Full-precision vectors of chunks in a quantized store.
+
+    They are read from the embedding cache without marking them used, so a
+    query never writes to it; chunks missing from it fall back to the
+    vectors decoded from the index.
+    """
+    vectors = stored_vectors(vectorstore, [doc.id for doc in docs])
+    cache = get_index_cache()
+    if cache is not None:
+        hashes = [hash_text(doc.page_content) for doc in docs]
+        cached = cache.embeddings.get_many(
+            get_embeddings_namespace(vectorstore.embeddings), hashes, touch=False
+        )
+        for i, chunk_hash in enumerate(hashes):
+            if chunk_hash in cached:
+                vectors[i] = cached[chunk_hash]
+    return vectors
+
+
+def _packing_vectors(vectorstore, docs: List[Document]):
+    """Stored vectors of retrieved chunks; chunks removed since are dropped"""
+    if isinstance(vectorstore, VectorBackend):
+        found = vectorstore.get_vectors([doc.id for doc in docs])
+        docs = [doc for doc in docs if doc.id in found]
+        return docs, np.asarray([found[doc.id] for doc in docs], dtype=np.float32)
+    return docs, stored_vectors(vectorstore, [doc.id for doc in docs])
+
+
+@metrics.timed("vector_search")
+def dense_search(
+    vectorstore, query: str, num_docs: int, where: Optional[MetadataFilter] = None
+) -> List[Document]:
+    """Nearest-neighbour search over the FAISS index, pre-filtered by ``where``"""
+    # The engine memoizes query vectors, so a repeated query (e.g. after a
+    # rerun or a num_docs change) costs a single FAISS search
+    with metrics.span("embed_query"):
+        query_vector = vectorstore.embeddings.embed_query(query)
+    if isinstance(vectorstore, VectorBackend):
+        # Persistent stores are shared; only search this session's files
+        return vectorstore.search(
+            query_vector, num_docs, list(vectorstore.session_sources), where
+        )
+    mask = store_mask(vectorstore, where) if where else None
+    exact_filter_max = config.vector_store.get("exact_filter_max", 4096)
+    if is_quantized(vectorstore.index):
+        # Over-fetch from the compressed index, then re-rank on exact vectors
+        rerank_factor = config.index.get("rerank_factor", 4)
+        candidates = search_masked(
+            vectorstore, query_vector, num_docs * rerank_factor, mask, exact_filter_max
+        )
+        exact_vectors = _exact_vectors(vectorstore, candidates)
+        relevant_docs = [
+            candidates[i] for i in exact_rerank(query_vector, exact_vectors, num_docs)
+        ]
+    else:
+        relevant_docs = search_masked(
+            vectorstore, query_vector, num_docs, mask, exact_filter_max
+        )
+    return relevant_docs
+
+
+def _lexical_search(
+    vectorstore, query: str, k: int, where: Optional[MetadataFilter]
+) -> Optional[List[Document]]:
+    """BM25 hits with the same pre-filter as ``dense_search``; None if the
+    backend has no keyword index"""
+    if isinstance(vectorstore, VectorBackend):
+        try:
+            return vectorstore.lexical_search(
+                query, k, list(vectorstore.session_sources), where
+            )
+        except NotImplementedError:
+            return None
+    mask = store_mask(vectorstore, where) if where else None
+    return lexical_search_masked(
+        vectorstore, get_lexical_index(vectorstore), query, k, mask
+    )
+
+
+def hybrid_search(
+    vectorstore, query: str, num_docs: int, where: Optional[MetadataFilter] = None
+) -> List[Document]:
+    """Fuse dense and BM25 rankings with reciprocal rank fusion.
+
+    Both legs apply ``where``. Backends without a keyword index (Chroma)
+    fall back to vector search with a warning.
+    """
+    settings = config.search
+    fetch_k = num_docs * settings.get("candidate_factor", 4)
+    with metrics.span("bm25_search"):
+        lexical_docs = _lexical_search(vectorstore, query, fetch_k, where)
+    if lexical_docs is None:
+        warnings.warn(
+            f"The {vectorstore.name} backend has no keyword index; "
+            "hybrid search falls back to vector search"
+        )
+        return dense_search(vectorstore, query, num_docs, where)
+    dense_docs = dense_search(vectorstore, query, fetch_k, where)
+
+    fused_ids = reciprocal_rank_fusion(
+        [[doc.id for doc in dense_docs], [doc.id for doc in lexical_docs]],
+        k=settings.get("rrf_k", 60),
+    )
+    docs_by_id = {doc.id: doc for doc in lexical_docs + dense_docs}
+    return [docs_by_id[doc_id] for doc_id in fused_ids[:num_docs]]
+
+
+@metrics.timed("retrieve")
+def get_relevant_context(
+    vectorstore,
+    query: str,
+    num_docs: int = 3,
+    search_mode: str = "vector",
+    token_budget: int = None,
+    rerank: Optional[bool] = None,
+    where: Optional[MetadataFilter] = None,
+) -> tuple:
+    """Get relevant context and sources from vector store.
+
+    ``where`` pre-filters persistent collections by source, file type or
+    date inside the index search. With ``rerank`` (default from
+    ``[rerank]``), a larger candidate pool is re-scored by the cross-encoder
+    and cut to the best ``num_docs``. With a ``token_budget``, a larger
+    candidate pool is retrieved and packed into the budget (MMR order,
+    near-duplicates dropped, overlapping chunks merged), keeping at most
+    ``num_docs`` chunks.
+    """
     if not vectorstore:
         return "", []
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": num_docs})
-    relevant_docs = retriever.get_relevant_documents(query)
+    if rerank is None:
+        rerank = config.rerank.get("enabled", False)
+
+    fetch_k = num_docs
+    if token_budget is not None:
+        fetch_k = num_docs * config.context.get("candidate_factor", 3)
+    if rerank:
+        settings = config.rerank
+        rerank_k = min(
+            num_docs * settings.get("candidate_factor", 4),
+            settings.get("max_candidates", 40),
+        )
+        fetch_k = max(fetch_k, rerank_k)
+
+    if search_mode == "hybrid":
+        relevant_docs = hybrid_search(vectorstore, query, fetch_k, where)
+    else:
+        relevant_docs = dense_search(vectorstore, query, fetch_k, where)
+
+    if rerank:
+        with metrics.span("rerank"):
+            relevant_docs = get_reranker().rerank(query, relevant_docs, num_docs)
+
+    if token_budget is not None:
+        with metrics.span("pack_context"):
+            # Vectors come from the index; nothing is embedded or cached per query
+            relevant_docs, vectors = _packing_vectors(vectorstore, relevant_docs)
+            relevant_docs = pack_context(
+                vectorstore.embeddings.embed_query(query),
+                relevant_docs,
+                vectors,
+                token_budget,
+                num_docs,
+            )
 
     # Create context from retrieved documents
     context = "\n\n".join([doc.page_content for doc in relevant_docs])
     sources = list(
-        set([doc.metadata.get("source", "Unknown") for doc in relevant_docs])
+        set(
+            source
+            for doc in relevant_docs
+            for source in doc.metadata.get(
+                "sources", [doc.metadata.get("source", "Unknown")]
+            )
+        )
     )
 
     return context, sources
 
 
+@metrics.timed("prompt_build")
 def create_rag_prompt(context: str, question: str) -> str:
     """Create a RAG-enhanced prompt"""
     return f"""Based on the following context from the uploaded documents, please answer the question.
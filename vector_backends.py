@@ -0,0 +1,805 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+import faiss
+import numpy as np
+import psutil
+from langchain.schema import Document
+
+from config import CHROMA_DIR, config
+from index_cache import _dir_size, hash_text, load_faiss_store
+from lexical_index import BM25Index
+from vector_index import (
+    apply_search_params,
+    build_faiss_store,
+    clustered_vectors,
+    docstore_positions,
+    nearby_queries,
+    rebuild_without,
+    stored_vectors,
+    supports_removal,
+)
+
+BACKENDS = ("faiss", "chroma")
+# Chroma's rule for collection names, also safe as a directory name
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{1,61}[A-Za-z0-9]$")
+
+
+class MetadataFilter:
+    """Restricts a search to chunks whose metadata matches every given field.
+
+    ``sources`` and ``file_types`` are the allowed values; ``since`` and
+    ``until`` bound ``added_at``, the time (Unix seconds) a chunk was added
+    to its collection. Fields left as None do not filter.
+    """
+
+    def __init__(
+        self,
+        sources: Optional[Iterable[str]] = None,
+        file_types: Optional[Iterable[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ):
+        self.sources = None if sources is None else set(sources)
+        self.file_types = None if file_types is None else set(file_types)
+        self.since = since
+        self.until = until
+
+    def __bool__(self):
+        return any(
+            value is not None
+            for value in (self.sources, self.file_types, self.since, self.until)
+        )
+
+    def key(self) -> tuple:
+        """Hashable form, e.g. for cache keys"""
+        return (
+            None if self.sources is None else tuple(sorted(self.sources)),
+            None if self.file_types is None else tuple(sorted(self.file_types)),
+            self.since,
+            self.until,
+        )
+
+    def matches(self, metadata: dict) -> bool:
+        if self.sources is not None and metadata.get("source") not in self.sources:
+            return False
+        if (
+            self.file_types is not None
+            and metadata.get("file_type") not in self.file_types
+        ):
+            return False
+        added_at = metadata.get("added_at")
+        if self.since is not None and (added_at is None or added_at < self.since):
+            return False
+        if self.until is not None and (added_at is None or added_at > self.until):
+            return False
+        return True
+
+
+def _merge_sources(sources, where: Optional[MetadataFilter]) -> Optional[set]:
+    """Sources allowed by both a session's view and a filter (None: all)"""
+    allowed = None if sources is None else set(sources)
+    if where is not None and where.sources is not None:
+        allowed = where.sources if allowed is None else allowed & where.sources
+    return allowed
+
+
+def chunk_ids(chunks: List[Document]) -> List[str]:
+    """Stable chunk ids, so re-indexing the same file version is an upsert"""
+    ids = []
+    positions: Dict[str, int] = {}
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "Unknown")
+        position = positions.get(source, 0)
+        positions[source] = position + 1
+        ids.append(
+            hash_text(
+                f"{source}\0{chunk.metadata.get('file_hash')}\0{position}\0"
+                f"{chunk.page_content}"
+            )
+        )
+    return ids
+
+
+class VectorBackend(ABC):
+    """A persistent store of chunk vectors.
+
+    Implementations support batched upserts keyed by chunk id, deletion,
+    search pre-filtered by ``source`` files and a ``MetadataFilter`` inside
+    the index, and persistence to disk. ``session_sources`` maps the sources
+    a session has loaded to their file hash; searches from the app are
+    filtered to them. ``version`` changes with every write from this process,
+    so answers cached for one version of a shared collection go stale.
+    """
+
+    name = ""
+
+    def __init__(self, embeddings, batch_size: int = 256):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.session_sources: Dict[str, str] = {}
+        self._versions = itertools.count(1)
+        self.version = 0
+
+    def _changed(self):
+        """Call after each upsert or delete"""
+        self.version = next(self._versions)
+
+    @abstractmethod
+    def upsert(
+        self, ids: List[str], texts: List[str], vectors, metadatas: List[dict]
+    ): ...
+
+    @abstractmethod
+    def delete_sources(self, sources: Iterable[str]): ...
+
+    @abstractmethod
+    def search(
+        self,
+        query_vector,
+        k: int,
+        sources: Optional[Iterable[str]] = None,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Document]: ...
+
+    @abstractmethod
+    def get_sources(self, sources: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Map stored sources (optionally only the given ones) to file hashes"""
+        ...
+
+    def lexical_search(
+        self,
+        query: str,
+        k: int,
+        sources: Optional[Iterable[str]] = None,
+        where: Optional[MetadataFilter] = None,
+    ) -> List[Document]:
+        """BM25 search, pre-filtered like ``search``; NotImplementedError if
+        the backend has no keyword index"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_vectors(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """Stored vectors of the given chunk ids, skipping ids since removed"""
+        ...
+
+    @abstractmethod
+    def count(self) -> int: ...
+
+    def persist(self):
+        pass
+
+    @abstractmethod
+    def disk_bytes(self) -> int: ...
+
+
+class _MetadataIndex:
+    """Metadata codes per position of a FAISS index, for building filter masks.
+
+    Kept in step with the index: ``append`` after adding chunks and
+    ``remove`` with the positions being dropped, since removal keeps the
+    order of the remaining chunks.
+    """
+
+    def __init__(self, store):
+        self.source_codes: Dict[str, int] = {}
+        self.file_type_codes: Dict[Optional[str], int] = {}
+        self.sources = np.zeros(0, dtype=np.int32)
+        self.file_types = np.zeros(0, dtype=np.int32)
+        self.added_at = np.zeros(0, dtype=np.int64)
+        self.append(
+            [
+                store.docstore.search(doc_id).metadata
+                for _, doc_id in sorted(store.index_to_docstore_id.items())
+            ]
+        )
+
+    @property
+    def total(self) -> int:
+        return len(self.sources)
+
+    @staticmethod
+    def _codes(codes: Dict, values) -> np.ndarray:
+        return np.fromiter(
+            (codes.setdefault(value, len(codes)) for value in values), dtype=np.int32
+        )
+
+    def append(self, metadatas: List[dict]):
+        self.sources = np.concatenate(
+            [
+                self.sources,
+                self._codes(
+                    self.source_codes,
+                    (metadata.get("source", "Unknown") for metadata in metadatas),
+                ),
+            ]
+        )
+        self.file_types = np.concatenate(
+            [
+                self.file_types,
+                self._codes(
+                    self.file_type_codes,
+                    (metadata.get("file_type") for metadata in metadatas),
+                ),
+            ]
+        )
+        self.added_at = np.concatenate(
+            [
+                self.added_at,
+                np.fromiter(
+                    (metadata.get("added_at", -1) for metadata in metadatas),
+                    dtype=np.int64,
+                ),
+            ]
+        )
+
+    def remove(self, positions: List[int]):
+        keep = np.ones(self.total, dtype=bool)
+        keep[positions] = False
+        self.sources = self.sources[keep]
+        self.file_types = self.file_types[keep]
+        self.added_at = self.added_at[keep]
+
+    @staticmethod
+    def _any_of(column: np.ndarray, codes: Dict, values) -> np.ndarray:
+        wanted = [codes[value] for value in values if value in codes]
+        return np.isin(column, wanted)
+
+    def select(self, sources, where: Optional[MetadataFilter]) -> np.ndarray:
+        """Boolean mask of the positions matching ``sources`` and ``where``"""
+        mask = np.ones(self.total, dtype=bool)
+        if sources is not None:
+            mask &= self._any_of(self.sources, self.source_codes, sources)
+        if where is not None:
+            if where.file_types is not None:
+                mask &= self._any_of(
+                    self.file_types, self.file_type_codes, where.file_types
+                )
+            if where.since is not None:
+                mask &= self.added_at >= where.since
+            if where.until is not None:
+                mask &= (self.added_at >= 0) & (self.added_at <= where.until)
+        return mask
+
+
+def _filtered_search_params(index, selector, selectivity: float):
+    """Search parameters restricted to ``selector``.
+
+    IVF lists and the HNSW beam are widened in proportion to how few vectors
+    pass the filter, so about as many matching neighbours are visited as an
+    unfiltered search would see.
+    """
+    widen = 1 / max(selectivity, 1e-6)
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(
+            sel=selector, nprobe=min(index.nlist, math.ceil(index.nprobe * widen))
+        )
+    if isinstance(index, faiss.IndexHNSW):
+        ef_search = index.hnsw.efSearch
+        return faiss.SearchParametersHNSW(
+            sel=selector,
+            efSearch=min(math.ceil(ef_search * widen), ef_search * 16),
+        )
+    return faiss.SearchParameters(sel=selector)
+
+
+def store_mask(store, where: MetadataFilter) -> np.ndarray:
+    """Positions of an in-memory FAISS store matching ``where``.
+
+    The metadata index is kept on the store and rebuilt when its chunks
+    change, like ``vector_index.docstore_positions``.
+    """
+    mapping = store.index_to_docstore_id
+    cached = getattr(store, "metadata_index", None)
+    if cached is None or cached[0] is not mapping or cached[1] != len(mapping):
+        cached = store.metadata_index = (mapping, len(mapping), _MetadataIndex(store))
+    return cached[2].select(_merge_sources(None, where), where)
+
+
+def search_masked(
+    store, query_vector, k: int, mask: Optional[np.ndarray], exact_filter_max: int
+) -> List[Document]:
+    """Nearest chunks among the positions set in ``mask`` (None: all).
+
+    The search runs inside FAISS on an ID selector; masks of at most
+    ``exact_filter_max`` chunks are scanned exactly instead.
+    """
+    if mask is None or mask.all():
+        return store.similarity_search_by_vector(query_vector, k=k)
+    if not mask.any():
+        return []
+    index = store.index
+    positions = np.flatnonzero(mask)
+    query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+    if len(positions) <= exact_filter_max and not isinstance(index, faiss.IndexIVF):
+        vectors = index.reconstruct_batch(positions)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        found = positions[np.argsort(distances, kind="stable")[:k]].tolist()
+    else:
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        params = _filtered_search_params(index, selector, len(positions) / len(mask))
+        _, found = index.search(query, k, params=params)
+        found = [int(position) for position in found[0] if position >= 0]
+    return [
+        store.docstore.search(store.index_to_docstore_id[position])
+        for position in found
+    ]
+
+
+def lexical_search_masked(
+    store, lexical_index, query: str, k: int, mask: Optional[np.ndarray]
+) -> List[Document]:
+    """BM25 search restricted to the positions set in ``mask`` (None: all)"""
+    allowed = None
+    if mask is not None and not mask.all():
+        mapping = store.index_to_docstore_id
+        allowed = {mapping[position] for position in np.flatnonzero(mask)}
+    return [
+        store.docstore.search(doc_id)
+        for doc_id, _ in lexical_index.search(query, k, allowed)
+    ]
+
+
+class FaissBackend(VectorBackend):
+    """FAISS index saved under ``path`` with its docstore and BM25 index.
+
+    Filtered searches run inside FAISS on an ID selector built from a
+    metadata index, rather than filtering the results of a wider search.
+    Filters that leave at most ``exact_filter_max`` chunks are searched
+    exactly over just those vectors, like a small dedicated index would be.
+    """
+
+    name = "faiss"
+
+    def __init__(
+        self,
+        path: str,
+        embeddings,
+        batch_size: int = 256,
+        exact_filter_max: int = 4096,
+    ):
+        super().__init__(embeddings, batch_size)
+        self.path = path
+        self.exact_filter_max = exact_filter_max
+        self.store = None
+        self._metadata_index = None
+        # Collections are shared by sessions that search while others upsert
+        self._lock = threading.RLock()
+        if os.path.isfile(os.path.join(path, "index.faiss")):
+            self.store = load_faiss_store(path, embeddings, mmap=False)
+            apply_search_params(self.store.index)
+            if getattr(self.store, "lexical_index", None) is None:
+                self.store.lexical_index = BM25Index.from_vector_store(self.store)
+
+    def _existing_ids(self, ids: List[str]) -> List[str]:
+        return [
+            doc_id
+            for doc_id in ids
+            if isinstance(self.store.docstore.search(doc_id), Document)
+        ]
+
+    def _remove(self, ids: List[str]):
+        if not ids:
+            return
+        if self._metadata_index is not None:
+            self._metadata_index.remove(docstore_positions(self.store, ids))
+        if supports_removal(self.store.index):
+            self.store.delete(ids)
+        else:
+            rebuild_without(self.store, ids)
+        self.store.lexical_index.remove(ids)
+        if not self.store.index_to_docstore_id:
+            self.store = None
+            self._metadata_index = None
+
+    def upsert(self, ids, texts, vectors, metadatas):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.store is None and len(ids):
+                # Build in one go so the index type fits the whole first load
+                self.store = build_faiss_store(
+                    texts, vectors, metadatas, self.embeddings, ids
+                )
+                self.store.lexical_index = BM25Index.from_vector_store(self.store)
+                self._changed()
+                return
+            for start in range(0, len(ids), self.batch_size):
+                end = start + self.batch_size
+                batch_ids = ids[start:end]
+                self._remove(self._existing_ids(batch_ids))
+                if self.store is None:
+                    self.store = build_faiss_store(
+                        texts[start:end],
+                        vectors[start:end],
+                        metadatas[start:end],
+                        self.embeddings,
+                        batch_ids,
+                    )
+                    self.store.lexical_index = BM25Index.from_vector_store(self.store)
+                    continue
+                self.store.add_embeddings(
+                    list(zip(texts[start:end], vectors[start:end])),
+                    metadatas=metadatas[start:end],
+                    ids=batch_ids,
+                )
+                self.store.lexical_index.add(batch_ids, texts[start:end])
+                if self._metadata_index is not None:
+                    self._metadata_index.append(metadatas[start:end])
+            self._changed()
+
+    def delete_sources(self, sources):
+        sources = set(sources)
+        with self._lock:
+            if self.store is None or not sources:
+                return
+            mask = self._get_metadata_index().select(sources, None)
+            mapping = self.store.index_to_docstore_id
+            self._remove([mapping[position] for position in np.flatnonzero(mask)])
+            self._changed()
+
+    def _get_metadata_index(self) -> _MetadataIndex:
+        """Built from the docstore once, then updated with every change"""
+        if self._metadata_index is None:
+            self._metadata_index = _MetadataIndex(self.store)
+        return self._metadata_index
+
+    def _mask(self, sources, where) -> Optional[np.ndarray]:
+        sources = _merge_sources(sources, where)
+        if sources is None and not where:
+            return None
+        return self._get_metadata_index().select(sources, where)
+
+    def search(self, query_vector, k, sources=None, where=None):
+        with self._lock:
+            if self.store is None:
+                return []
+            return search_masked(
+                self.store,
+                query_vector,
+                k,
+                self._mask(sources, where),
+                self.exact_filter_max,
+            )
+
+    def lexical_search(self, query, k, sources=None, where=None):
+        with self._lock:
+            if self.store is None:
+                return []
+            return lexical_search_masked(
+                self.store,
+                self.store.lexical_index,
+                query,
+                k,
+                self._mask(sources, where),
+            )
+
+    def get_sources(self, sources=None):
+        found = {}
+        with self._lock:
+            if self.store is None:
+                return found
+            wanted = None if sources is None else set(sources)
+            for doc_id in self.store.index_to_docstore_id.values():
+                metadata = self.store.docstore.search(doc_id).metadata
+                source = metadata.get("source", "Unknown")
+                if wanted is None or source in wanted:
+                    found.setdefault(source, metadata.get("file_hash"))
+        return found
+
+    def get_vectors(self, ids):
+        with self._lock:
+            if self.store is None:
+                return {}
+            stored = self.store.docstore._dict
+            ids = [doc_id for doc_id in ids if doc_id in stored]
+            return dict(zip(ids, stored_vectors(self.store, ids)))
+
+    def count(self):
+        with self._lock:
+            return self.store.index.ntotal if self.store is not None else 0
+
+    def persist(self):
+        """Write to a temporary directory, then swap it into place"""
+        with self._lock:
+            if self.store is None:
+                shutil.rmtree(self.path, ignore_errors=True)
+                return
+            tmp_path = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            self.store.save_local(tmp_path)
+            self.store.lexical_index.save(os.path.join(tmp_path, "lexical.pkl"))
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.replace(tmp_path, self.path)
+
+    def disk_bytes(self):
+        return _dir_size(self.path) if os.path.isdir(self.path) else 0
+
+
+def _chroma_client(path: str):
+    try:
+        import chromadb
+        from chromadb.config import Settings
+    except ImportError as e:
+        raise ImportError(
+            "The chroma vector store backend requires `pip install -r requirements-chroma.txt`"
+        ) from e
+    return chromadb.PersistentClient(
+        path=path, settings=Settings(anonymized_telemetry=False)
+    )
+
+
+class ChromaBackend(VectorBackend):
+    """Chroma collection persisted in ``path`` (chromadb is optional)"""
+
+    name = "chroma"
+
+    def __init__(self, path: str, collection: str, embeddings, batch_size: int = 256):
+        super().__init__(embeddings, batch_size)
+        self.path = path
+        self.client = _chroma_client(path)
+        # L2 distance, like the FAISS indexes
+        self.collection = self.client.get_or_create_collection(
+            collection, metadata={"hnsw:space": "l2"}
+        )
+        self.batch_size = min(batch_size, self.client.get_max_batch_size())
+
+    @staticmethod
+    def _metadata(metadata: dict) -> dict:
+        # Chroma only stores scalar metadata values
+        return {
+            key: value if isinstance(value, (str, int, float, bool)) else str(value)
+            for key, value in metadata.items()
+            if value is not None
+        }
+
+    @staticmethod
+    def _source_filter(sources) -> dict:
+        return {"source": {"$in": list(sources)}}
+
+    @classmethod
+    def _where(cls, sources, where: Optional[MetadataFilter]) -> Optional[dict]:
+        """Chroma ``where`` clause; Chroma applies it inside the HNSW search"""
+        clauses = []
+        if sources is not None:
+            clauses.append(cls._source_filter(sources))
+        if where is not None:
+            if where.file_types is not None:
+                clauses.append({"file_type": {"$in": list(where.file_types)}})
+            if where.since is not None:
+                clauses.append({"added_at": {"$gte": where.since}})
+            if where.until is not None:
+                clauses.append({"added_at": {"$lte": where.until}})
+        if len(clauses) > 1:
+            return {"$and": clauses}
+        return clauses[0] if clauses else None
+
+    def upsert(self, ids, texts, vectors, metadatas):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                embeddings=vectors[start:end],
+                documents=texts[start:end],
+                metadatas=[self._metadata(m) for m in metadatas[start:end]],
+            )
+        self._changed()
+
+    def delete_sources(self, sources):
+        sources = list(sources)
+        if sources:
+            self.collection.delete(where=self._source_filter(sources))
+            self._changed()
+
+    def search(self, query_vector, k, sources=None, where=None):
+        sources = _merge_sources(sources, where)
+        if sources == set() or not self.collection.count():
+            return []
+        result = self.collection.query(
+            query_embeddings=[np.asarray(query_vector, dtype=np.float32)],
+            n_results=k,
+            where=self._where(sources, where),
+            include=["documents", "metadatas"],
+        )
+        return [
+            Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0]
+            )
+        ]
+
+    def get_sources(self, sources=None):
+        sources = None if sources is None else list(sources)
+        if sources == []:
+            return {}
+        result = self.collection.get(
+            where=self._source_filter(sources) if sources else None,
+            include=["metadatas"],
+        )
+        found = {}
+        for metadata in result["metadatas"]:
+            found.setdefault(
+                metadata.get("source", "Unknown"), metadata.get("file_hash")
+            )
+        return found
+
+    def get_vectors(self, ids):
+        result = self.collection.get(ids=list(ids), include=["embeddings"])
+        return {
+            doc_id: np.asarray(vector, dtype=np.float32)
+            for doc_id, vector in zip(result["ids"], result["embeddings"])
+        }
+
+    def count(self):
+        return self.collection.count()
+
+    def disk_bytes(self):
+        return _dir_size(self.path)
+
+
+def get_vector_backend(
+    embeddings,
+    backend: Optional[str] = None,
+    path: Optional[str] = None,
+    collection: Optional[str] = None,
+) -> VectorBackend:
+    """Open a collection of the vector store backend configured in [vector_store]"""
+    settings = config.vector_store
+    backend = backend or settings.get("backend", "faiss")
+    collection = collection or settings.get("collection", "langchain")
+    if not COLLECTION_NAME.match(collection):
+        raise ValueError(
+            f"Invalid collection name: {collection!r} (3-63 letters, digits, "
+            "'.', '_' or '-')"
+        )
+    batch_size = settings.get("batch_size", 256)
+    if backend == "faiss":
+        path = path or os.path.join(
+            settings.get("faiss_dir", "./cache/faiss_store"), collection
+        )
+        return FaissBackend(
+            path, embeddings, batch_size, settings.get("exact_filter_max", 4096)
+        )
+    if backend == "chroma":
+        return ChromaBackend(path or CHROMA_DIR, collection, embeddings, batch_size)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def list_collections(backend: Optional[str] = None) -> List[str]:
+    """Names of the collections stored by a backend"""
+    settings = config.vector_store
+    backend = backend or settings.get("backend", "faiss")
+    if backend == "faiss":
+        root = settings.get("faiss_dir", "./cache/faiss_store")
+        if not os.path.isdir(root):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(root)
+            if COLLECTION_NAME.match(name)
+            and os.path.isfile(os.path.join(root, name, "index.faiss"))
+        )
+    if backend == "chroma":
+        collections = _chroma_client(CHROMA_DIR).list_collections()
+        # Older chromadb versions return collection objects, newer ones names
+        return sorted(getattr(c, "name", c) for c in collections)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def benchmark_backends(
+    texts: List[str],
+    vectors,
+    metadatas: List[dict],
+    queries,
+    k: int = 5,
+    backends=BACKENDS,
+) -> List[Dict]:
+    """Compare build time, query latency, recall and memory of each backend.
+
+    Every backend indexes the same chunks into a scratch directory. Recall
+    is measured against exact search; filtered queries are restricted to one
+    source per query.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+    # Squared L2 distances without materialising a queries x chunks x dim array
+    distances = (
+        (queries**2).sum(axis=1)[:, None]
+        - 2 * queries @ vectors.T
+        + (vectors**2).sum(axis=1)[None, :]
+    )
+    truth = np.argsort(distances, axis=1)[:, :k]
+    sources = [metadata.get("source", "Unknown") for metadata in metadatas]
+    process = psutil.Process()
+
+    report = []
+    for name in backends:
+        scratch = tempfile.mkdtemp(prefix=f"{name}-bench-")
+        try:
+            rss_before = process.memory_info().rss
+            start = time.perf_counter()
+            backend = get_vector_backend(None, name, os.path.join(scratch, "store"))
+            backend.upsert(ids, texts, vectors, metadatas)
+            backend.persist()
+            build_seconds = time.perf_counter() - start
+            rss_after = process.memory_info().rss
+        except ImportError as e:
+            report.append({"backend": name, "error": str(e)})
+            shutil.rmtree(scratch, ignore_errors=True)
+            continue
+
+        timings, filtered_timings, hits = [], [], 0
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            docs = backend.search(query, k)
+            timings.append((time.perf_counter() - start) * 1000)
+            found = {int(doc.id.split("-")[1]) for doc in docs}
+            hits += len(found & set(expected.tolist()))
+
+            start = time.perf_counter()
+            backend.search(query, k, [sources[expected[0]]])
+            filtered_timings.append((time.perf_counter() - start) * 1000)
+
+        report.append(
+            {
+                "backend": name,
+                "chunks": backend.count(),
+                "build_seconds": build_seconds,
+                "chunks_per_second": len(ids) / build_seconds,
+                "query_ms_p50": float(np.percentile(timings, 50)),
+                "query_ms_p95": float(np.percentile(timings, 95)),
+                "filtered_query_ms_p50": float(np.percentile(filtered_timings, 50)),
+                f"recall@{k}": hits / truth.size,
+                "rss_delta_mb": (rss_after - rss_before) / 2**20,
+                "disk_mb": backend.disk_bytes() / 2**20,
+            }
+        )
+        del backend
+        shutil.rmtree(scratch, ignore_errors=True)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the FAISS and Chroma backends on the same corpus"
+    )
+    parser.add_argument("--num-chunks", type=int, default=20000)
+    parser.add_argument("--num-sources", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors, labels = clustered_vectors(rng, args.num_chunks, args.dimension)
+    texts = [f"chunk {i} of cluster {label}" for i, label in enumerate(labels)]
+    metadatas = [
+        {"source": f"doc-{i % args.num_sources}.txt", "file_hash": "bench"}
+        for i in range(args.num_chunks)
+    ]
+    queries = nearby_queries(rng, vectors, args.num_queries)
+
+    print(
+        json.dumps(
+            benchmark_backends(
+                texts, vectors, metadatas, queries, k=args.k, backends=args.backends
+            ),
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
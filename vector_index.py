@@ -0,0 +1,363 @@
+import argparse
+import json
+import math
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from config import config
+
+INDEX_TYPES = ("flat", "ivf", "hnsw")
+QUANTIZATIONS = ("none", "fp16", "int8", "pq")
+
+
+def choose_index_type(num_vectors: int, settings: Optional[Dict] = None) -> str:
+    """Pick the configured index type, or one suited to the corpus size"""
+    settings = config.index if settings is None else settings
+    index_type = settings.get("type", "auto")
+    if index_type != "auto":
+        return index_type
+    if num_vectors < settings.get("flat_max_vectors", 10000):
+        return "flat"
+    if num_vectors < settings.get("hnsw_max_vectors", 500000):
+        return "hnsw"
+    return "ivf"
+
+
+def _num_lists(num_vectors: int, settings: Dict) -> int:
+    nlist = settings.get("nlist", 0)
+    if not nlist:
+        nlist = int(4 * math.sqrt(num_vectors))
+    # FAISS wants ~39 training points per centroid
+    return max(1, min(nlist, num_vectors // 39))
+
+
+def _storage_code(num_vectors: int, settings: Dict) -> str:
+    quantization = settings.get("quantization", "none")
+    if quantization == "fp16":
+        return "SQfp16"
+    if quantization == "int8":
+        return "SQ8"
+    if quantization == "pq":
+        nbits = settings.get("pq_nbits", 8)
+        # Too few points to train the PQ codebooks; int8 is the next best
+        if num_vectors < 39 * 2**nbits:
+            return "SQ8"
+        return f"PQ{settings.get('pq_m', 16)}x{nbits}"
+    if quantization == "none":
+        return "Flat"
+    raise ValueError(f"Unknown quantization: {quantization}")
+
+
+def describe_index_settings(num_vectors: int, settings: Optional[Dict] = None) -> str:
+    """Return the FAISS index factory string used for a corpus of this size"""
+    settings = config.index if settings is None else settings
+    index_type = choose_index_type(num_vectors, settings)
+    storage = _storage_code(num_vectors, settings)
+    if index_type == "flat":
+        return storage
+    if index_type == "ivf":
+        return f"IVF{_num_lists(num_vectors, settings)},{storage}"
+    if index_type == "hnsw":
+        hnsw = f"HNSW{settings.get('hnsw_m', 32)}"
+        return hnsw if storage == "Flat" else f"{hnsw}_{storage}"
+    raise ValueError(f"Unknown index type: {index_type}")
+
+
+def needs_rebuild(built: Optional[str], wanted: str) -> bool:
+    """Whether an index made with factory ``built`` should become ``wanted``.
+
+    Only a change of family (index type or storage) counts, or an IVF list
+    count more than 2x off; the list count follows the corpus size, so
+    comparing factory strings would rebuild an IVF index on every update.
+    """
+    if built is None:
+        return True
+    built_head, _, built_storage = built.rpartition(",")
+    wanted_head, _, wanted_storage = wanted.rpartition(",")
+    if not (built_head.startswith("IVF") and wanted_head.startswith("IVF")):
+        return built != wanted
+    if built_storage != wanted_storage:
+        return True
+    built_lists, wanted_lists = int(built_head[3:]), int(wanted_head[3:])
+    return max(built_lists, wanted_lists) > 2 * min(built_lists, wanted_lists)
+
+
+def is_quantized(index) -> bool:
+    """Whether the index stores lossy codes rather than float32 vectors"""
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return not isinstance(index, (faiss.IndexFlat, faiss.IndexIVFFlat))
+
+
+def index_memory_bytes(index) -> int:
+    """Approximate resident size of an index from its serialized form"""
+    return faiss.serialize_index(index).nbytes
+
+
+def apply_search_params(index, settings: Optional[Dict] = None):
+    """Set nprobe / efSearch on an IVF or HNSW index"""
+    settings = config.index if settings is None else settings
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(settings.get("nprobe", 16), index.nlist)
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.get("ef_search", 64)
+
+
+def build_index(
+    vectors: np.ndarray, index_type: str, settings: Optional[Dict] = None
+) -> faiss.Index:
+    """Build, train and fill a FAISS index of the given type over ``vectors``"""
+    settings = config.index if settings is None else settings
+    factory = describe_index_settings(len(vectors), {**settings, "type": index_type})
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efConstruction = settings.get("ef_construction", 80)
+    if not index.is_trained:
+        index.train(vectors)
+
+    apply_search_params(index, settings)
+    index.add(vectors)
+    return index
+
+
+def build_faiss_store(
+    texts: List[str],
+    vectors,
+    metadatas: List[dict],
+    embeddings,
+    ids: Optional[List[str]] = None,
+) -> FAISS:
+    """Wrap a FAISS index of the configured type in a LangChain vector store"""
+    array = np.asarray(vectors, dtype=np.float32)
+    index = build_index(array, choose_index_type(len(array)))
+
+    if ids is None:
+        ids = [str(uuid.uuid4()) for _ in texts]
+    docstore = InMemoryDocstore(
+        {
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata)
+            for doc_id, text, metadata in zip(ids, texts, metadatas)
+        }
+    )
+    return FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+
+
+def supports_removal(index) -> bool:
+    """Whether LangChain's delete keeps positions and labels in step.
+
+    Only flat-code indexes (Flat, SQ, PQ) renumber their vectors on removal
+    like ``index_to_docstore_id`` is renumbered; IVF keeps its original
+    labels and HNSW graphs cannot drop vectors at all.
+    """
+    return isinstance(index, faiss.IndexFlatCodes)
+
+
+_direct_map_lock = threading.Lock()
+
+
+def reconstruct_vectors(index, positions: Optional[List[int]] = None) -> np.ndarray:
+    """Stored vectors by position (decoded, for compressed indexes)"""
+    if isinstance(index, faiss.IndexIVF):
+        # Shared indexes are read by several sessions at once
+        with _direct_map_lock:
+            if index.direct_map.type == faiss.DirectMap.NoMap:
+                index.make_direct_map()
+    if positions is None:
+        return index.reconstruct_n(0, index.ntotal)
+    if not len(positions):
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+
+
+def docstore_positions(vectorstore: FAISS, doc_ids: List[str]) -> List[int]:
+    """Index positions of the given chunks.
+
+    The id -> position map is kept on the store and rebuilt when
+    ``index_to_docstore_id`` is replaced (delete, rebuild) or grows (add).
+    """
+    mapping = vectorstore.index_to_docstore_id
+    cached = getattr(vectorstore, "position_map", None)
+    if cached is None or cached[0] is not mapping or cached[1] != len(mapping):
+        positions = {doc_id: position for position, doc_id in mapping.items()}
+        cached = vectorstore.position_map = (mapping, len(mapping), positions)
+    return [cached[2][doc_id] for doc_id in doc_ids]
+
+
+def stored_vectors(vectorstore: FAISS, doc_ids: List[str]) -> np.ndarray:
+    """Stored vectors of the given chunks, read back from the index"""
+    return reconstruct_vectors(
+        vectorstore.index, docstore_positions(vectorstore, doc_ids)
+    )
+
+
+def rebuild_without(vectorstore: FAISS, doc_ids: List[str]):
+    """Remove documents from a store whose index cannot renumber positions.
+
+    The kept vectors are re-added in order: into an emptied copy of a
+    trained IVF index, so nothing is retrained, or into a new HNSW graph.
+    """
+    drop = set(doc_ids)
+    keep = [
+        (position, doc_id)
+        for position, doc_id in sorted(vectorstore.index_to_docstore_id.items())
+        if doc_id not in drop
+    ]
+    old_index = vectorstore.index
+    kept_vectors = reconstruct_vectors(old_index, [position for position, _ in keep])
+
+    if isinstance(old_index, faiss.IndexIVF):
+        index = faiss.clone_index(old_index)
+        index.reset()
+        index.add(kept_vectors)
+        index.nprobe = old_index.nprobe
+    elif len(kept_vectors):
+        index = build_index(kept_vectors, "hnsw")
+        index.hnsw.efSearch = old_index.hnsw.efSearch
+    else:
+        index = faiss.index_factory(old_index.d, "HNSW32")
+        index.hnsw.efSearch = old_index.hnsw.efSearch
+
+    vectorstore.index = index
+    vectorstore.docstore.delete(list(drop))
+    vectorstore.index_to_docstore_id = {
+        new_position: doc_id for new_position, (_, doc_id) in enumerate(keep)
+    }
+
+
+def exact_rerank(query_vector, candidate_vectors, k: int) -> List[int]:
+    """Order candidates by exact L2 distance and return the top-k positions"""
+    query = np.asarray(query_vector, dtype=np.float32)
+    candidates = np.asarray(candidate_vectors, dtype=np.float32)
+    distances = ((candidates - query) ** 2).sum(axis=1)
+    return np.argsort(distances, kind="stable")[:k].tolist()
+
+
+DEFAULT_REPORT_MODES = (
+    ("ivf", "none"),
+    ("hnsw", "none"),
+    ("flat", "fp16"),
+    ("flat", "int8"),
+    ("flat", "pq"),
+    ("hnsw", "int8"),
+)
+
+
+def recall_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 5,
+    modes=DEFAULT_REPORT_MODES,
+    settings: Optional[Dict] = None,
+) -> List[Dict]:
+    """Compare recall@k, latency and memory per vector against a flat index.
+
+    ``modes`` are (index type, quantization) pairs. Quantized modes also
+    report recall after exactly re-ranking ``rerank_factor * k`` candidates.
+    """
+    settings = config.index if settings is None else settings
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    rerank_factor = settings.get("rerank_factor", 4)
+
+    def timed_search(index, fetch_k):
+        start = time.perf_counter()
+        _, found = index.search(queries, fetch_k)
+        elapsed = time.perf_counter() - start
+        return found, elapsed * 1000 / len(queries)
+
+    def recall(found):
+        return sum(len(set(t) & set(f)) for t, f in zip(truth, found)) / truth.size
+
+    flat_settings = {**settings, "quantization": "none"}
+    baseline = build_index(vectors, "flat", flat_settings)
+    truth, flat_ms = timed_search(baseline, k)
+    report = [
+        {
+            "index": "Flat",
+            "recall": 1.0,
+            "ms_per_query": flat_ms,
+            "bytes_per_vector": index_memory_bytes(baseline) / len(vectors),
+        }
+    ]
+
+    for index_type, quantization in modes:
+        mode_settings = {**settings, "type": index_type, "quantization": quantization}
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, mode_settings)
+        build_seconds = time.perf_counter() - start
+        found, ms = timed_search(index, k)
+        entry = {
+            "index": describe_index_settings(len(vectors), mode_settings),
+            "recall": recall(found),
+            "ms_per_query": ms,
+            "bytes_per_vector": index_memory_bytes(index) / len(vectors),
+            "build_seconds": build_seconds,
+        }
+        if is_quantized(index):
+            candidates, _ = timed_search(index, k * rerank_factor)
+            reranked = []
+            for query, row in zip(queries, candidates):
+                row = row[row >= 0]
+                reranked.append(row[exact_rerank(query, vectors[row], k)])
+            entry["reranked_recall"] = recall(reranked)
+        report.append(entry)
+    return report
+
+
+def clustered_vectors(
+    rng: np.random.Generator, count: int, dimension: int, num_clusters: int = 256
+):
+    """Synthetic vectors scattered around random centers, and their cluster.
+
+    Clustered data resembles real embeddings better than uniform noise.
+    """
+    centers = rng.normal(size=(num_clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, num_clusters, count)
+    noise = rng.normal(scale=0.3, size=(count, dimension))
+    return (centers[labels] + noise).astype(np.float32), labels
+
+
+def nearby_queries(rng: np.random.Generator, vectors: np.ndarray, count: int):
+    """Queries close to randomly picked ``vectors``"""
+    picks = rng.choice(len(vectors), size=min(count, len(vectors)))
+    return vectors[picks] + rng.normal(
+        scale=0.05, size=(len(picks), vectors.shape[1])
+    ).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall, latency and memory of index modes against a flat index"
+    )
+    parser.add_argument(
+        "index_dir",
+        nargs="?",
+        help="Saved FAISS index folder to sample vectors from (default: synthetic)",
+    )
+    parser.add_argument("--num-vectors", type=int, default=50000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index_dir:
+        index = faiss.read_index(f"{args.index_dir}/index.faiss")
+        vectors = index.reconstruct_n(0, index.ntotal)
+    else:
+        vectors, _ = clustered_vectors(rng, args.num_vectors, args.dimension)
+    queries = nearby_queries(rng, vectors, args.num_queries)
+
+    print(json.dumps(recall_report(vectors, queries, k=args.k), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import atexit
+import multiprocessing
+import threading
+
+# Current pool of each kind ("loading", "splitting"), with its size and start
+# method; a pool of another size or start method replaces it
+_pools = {}
+# Pools handed out, with the number of callers using each
+_pool_users = {}
+_pool_lock = threading.Lock()
+
+
+def _retire(pool):
+    """Stop handing out ``pool``; it is terminated once no caller uses it"""
+    for kind, (_, _, current) in list(_pools.items()):
+        if current is pool:
+            del _pools[kind]
+    if not _pool_users.get(pool):
+        _pool_users.pop(pool, None)
+        pool.terminate()
+
+
+def _close_pools():
+    with _pool_lock:
+        for pool in list(_pool_users):
+            pool.terminate()
+        _pool_users.clear()
+        _pools.clear()
+
+
+atexit.register(_close_pools)
+
+
+def current_pool(kind: str):
+    """The pool ``acquire_pool`` would hand out for ``kind``, if any"""
+    with _pool_lock:
+        entry = _pools.get(kind)
+        return entry[2] if entry is not None else None
+
+
+def acquire_pool(kind: str, workers: int, start_method: str = "spawn"):
+    """Process pool kept alive across calls, so workers start only once.
+
+    Return it with ``release_pool``.
+    """
+    with _pool_lock:
+        entry = _pools.get(kind)
+        if entry is not None and entry[:2] != (workers, start_method):
+            _retire(entry[2])
+            entry = None
+        if entry is None:
+            context = multiprocessing.get_context(start_method)
+            entry = (workers, start_method, context.Pool(processes=workers))
+            _pools[kind] = entry
+            _pool_users[entry[2]] = 0
+        _pool_users[entry[2]] += 1
+        return entry[2]
+
+
+def release_pool(pool, stuck: bool = False):
+    """Return a pool from ``acquire_pool``.
+
+    ``stuck`` means a task timed out and may still occupy a worker; the
+    pool is then replaced and terminated once its other callers finish.
+    """
+    with _pool_lock:
+        _pool_users[pool] -= 1
+        if stuck or not any(pool is entry[2] for entry in _pools.values()):
+            _retire(pool)